@@ -1,12 +1,10 @@
 #!/usr/bin/env python3
 """Точка входа в приложение ValutaTrade Hub"""
 
-from valutatrade_hub.logging_config import setup_logging
 from valutatrade_hub.core.utils import setup_data_directories
 from valutatrade_hub.cli.interface import main
 
-# Настраиваем логирование
-setup_logging()
+# Логирование настраивает @log_action при первом действии
 
 # Создаем необходимые директории
 setup_data_directories()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк поиска и регистрации пользователей при разном их числе
+Для каждого размера создает временный каталог данных с users.json на N
+пользователей и в отдельном процессе замеряет через DatabaseManager (JSON-
+бэкенд с индексом users.idx) однократное построение индекса, get_user,
+get_user_by_id и регистрацию (next_user_id + add_user). Печатает медианы и
+падает, если на самом большом размере операции медленнее, чем на самом
+малом, больше чем в заданное число раз
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+OPERATIONS = ("get_user", "get_user_by_id", "register")
+
+
+def write_users(path: str, count: int) -> None:
+    """Записать users.json на count пользователей (потоково, без списка в памяти)"""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("[\n")
+        for user_id in range(1, count + 1):
+            record = {
+                "user_id": user_id,
+                "username": f"user{user_id}",
+                "hashed_password": "0" * 64,
+                "salt": "bench",
+                "registration_date": "2025-01-01T00:00:00",
+            }
+            f.write(json.dumps(record))
+            f.write(",\n" if user_id < count else "\n")
+        f.write("]\n")
+
+
+def median_us(operation: Callable[[], object], repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        operation()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1_000_000
+
+
+def measure(count: int, repeat: int) -> Dict[str, float]:
+    """Замеры в текущем процессе (каталог данных задан окружением)"""
+    from valutatrade_hub.infra.database import DatabaseManager
+
+    db = DatabaseManager()
+    rng = random.Random(count)
+
+    start = time.perf_counter()
+    db.get_user("user1")
+    build = time.perf_counter() - start
+
+    def register() -> None:
+        user_id = db.next_user_id()
+        db.add_user({"user_id": user_id, "username": f"new{user_id}",
+                     "hashed_password": "0" * 64, "salt": "bench",
+                     "registration_date": "2025-01-01T00:00:00"})
+
+    return {
+        "build_s": build,
+        "get_user": median_us(
+            lambda: db.get_user(f"user{rng.randint(1, count)}"), repeat),
+        "get_user_by_id": median_us(
+            lambda: db.get_user_by_id(rng.randint(1, count)), repeat),
+        "register": median_us(register, repeat),
+    }
+
+
+def run_size(count: int, repeat: int) -> Dict[str, float]:
+    """Подготовить каталог данных и замерить размер в отдельном процессе"""
+    with tempfile.TemporaryDirectory() as workdir:
+        data_dir = os.path.join(workdir, "data")
+        os.makedirs(data_dir)
+        write_users(os.path.join(data_dir, "users.json"), count)
+        env = dict(
+            os.environ,
+            PYTHONPATH=ROOT,
+            VALUTATRADE_DATA_DIR=data_dir,
+            VALUTATRADE_STORAGE_BACKEND="json",
+            # Компакция во время замера не нужна
+            VALUTATRADE_JOURNAL_COMPACT_BYTES=str(1 << 30),
+        )
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__),
+             "--measure", str(count), "--repeat", str(repeat)],
+            capture_output=True, text=True, env=env, cwd=workdir, check=True
+        )
+    return json.loads(proc.stdout)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000,1000000",
+                        help="Числа пользователей через запятую")
+    parser.add_argument("--repeat", type=int, default=2000,
+                        help="Замеров каждой операции на размер")
+    parser.add_argument("--max-ratio", type=float, default=3.0,
+                        help="Допустимое замедление самого большого размера "
+                             "относительно самого малого")
+    parser.add_argument("--measure", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args.measure, args.repeat)))
+        return 0
+
+    sizes: List[int] = sorted(int(size) for size in args.sizes.split(","))
+    print(f"{'пользователей':>13}  {'индекс, с':>9}  "
+          + "  ".join(f"{name + ', мкс':>18}" for name in OPERATIONS))
+    results = {}
+    for count in sizes:
+        results[count] = run_size(count, args.repeat)
+        print(f"{count:>13,}  {results[count]['build_s']:>9.2f}  "
+              + "  ".join(f"{results[count][name]:>18.1f}" for name in OPERATIONS))
+
+    failed = False
+    smallest, largest = results[sizes[0]], results[sizes[-1]]
+    for name in OPERATIONS:
+        ratio = largest[name] / smallest[name]
+        if ratio > args.max_ratio:
+            print(f"ОШИБКА: {name} на {sizes[-1]:,} пользователей медленнее "
+                  f"в {ratio:.1f} раза, чем на {sizes[0]:,} "
+                  f"(порог {args.max_ratio:.1f})")
+            failed = True
+    if not failed:
+        print(f"OK: время операций не растет с числом пользователей "
+              f"(порог {args.max_ratio:.1f}x)")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
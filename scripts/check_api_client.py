@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Проверка HTTP-клиента источников курсов на локальном сервере-заглушке
+Поднимает http.server, который отдает ETag, Last-Modified и Cache-Control:
+max-age и отвечает 304 на совпавший If-None-Match, и через BaseApiClient во
+временном каталоге данных проверяет: свежая запись кеша отдается без
+запроса к серверу, устаревшая перепроверяется условным запросом с
+If-None-Match и If-Modified-Since, а на 304 возвращается тело из кеша.
+Ответ 200 с ошибкой в теле (ExchangeRate-API: неверный ключ, квота) не
+кешируется и считается неудачей: breaker источника открывается
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SOURCE = "Stand-in"
+ETAG = '"rates-v1"'
+LAST_MODIFIED = "Wed, 01 Jan 2025 00:00:00 GMT"
+BODY = {"result": "success", "rates": {"EUR": 0.92}}
+API_KEY = "stand-in-key"
+ERROR_BODY = {"result": "error", "error-type": "invalid-key"}
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+    /revalidate - ответ с валидаторами и max-age=0 (каждый раз перепроверка)
+    /fresh - ответ с max-age=60 (повторный запрос не нужен)
+    /<ключ>/latest/USD - ошибка ExchangeRate-API с кодом 200 и max-age=60
+    """
+
+    def do_GET(self) -> None:
+        self.server.seen.append({"path": self.path, "headers": dict(self.headers)})
+        if self.path.startswith(f"/{API_KEY}/"):
+            payload = json.dumps(ERROR_BODY).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.send_header("Cache-Control", "max-age=60")
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+        if self.path.startswith("/revalidate"):
+            max_age = 0
+        elif self.path.startswith("/fresh"):
+            max_age = 60
+        else:
+            self.send_error(404)
+            return
+
+        if self.headers.get("If-None-Match") == ETAG:
+            self.send_response(304)
+            self.send_header("ETag", ETAG)
+            self.send_header("Cache-Control", f"max-age={max_age}")
+            self.end_headers()
+            return
+
+        payload = json.dumps(BODY).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.send_header("ETag", ETAG)
+        self.send_header("Last-Modified", LAST_MODIFIED)
+        self.send_header("Cache-Control", f"max-age={max_age}")
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+def check_cache(client: Any, base_url: str, seen: List[Dict]) -> List[str]:
+    errors = []
+
+    url = f"{base_url}/revalidate"
+    first = client._make_request(url)
+    second = client._make_request(url)
+    requests_made = [r for r in seen if r["path"].startswith("/revalidate")]
+    conditional = {name: value for name, value in requests_made[-1]["headers"].items()
+                   if name.startswith("If-")}
+    print(f"  /revalidate: запросов к серверу {len(requests_made)}, "
+          f"условные заголовки второго: {conditional}")
+    if len(requests_made) != 2:
+        errors.append(f"устаревшая запись: {len(requests_made)} запросов, ожидалось 2")
+    else:
+        headers = requests_made[1]["headers"]
+        if headers.get("If-None-Match") != ETAG:
+            errors.append(f"If-None-Match: {headers.get('If-None-Match')!r}, "
+                          f"ожидалось {ETAG!r}")
+        if headers.get("If-Modified-Since") != LAST_MODIFIED:
+            errors.append(f"If-Modified-Since: {headers.get('If-Modified-Since')!r}, "
+                          f"ожидалось {LAST_MODIFIED!r}")
+    if first != BODY or second != BODY:
+        errors.append(f"на 304 не возвращено тело из кеша: {second!r}")
+
+    url = f"{base_url}/fresh"
+    client._make_request(url)
+    cached = client._make_request(url)
+    requests_made = [r for r in seen if r["path"].startswith("/fresh")]
+    print(f"  /fresh: запросов к серверу {len(requests_made)} на 2 вызова")
+    if len(requests_made) != 1:
+        errors.append(f"свежая запись: {len(requests_made)} запросов, ожидался 1")
+    if cached != BODY:
+        errors.append(f"свежая запись вернула {cached!r}")
+    return errors
+
+
+def check_error_payload(seen: List[Dict]) -> List[str]:
+    """Ошибка в теле ответа 200 открывает breaker и не попадает в кеш"""
+    from valutatrade_hub.core.exceptions import ApiRequestError
+    from valutatrade_hub.infra.database import DatabaseManager
+    from valutatrade_hub.parser_service.api_clients import ExchangeRateApiClient
+    from valutatrade_hub.parser_service.config import DataSource, config
+
+    errors = []
+    client = ExchangeRateApiClient()
+    rejected = 0
+    for _ in range(config.BREAKER_FAILURE_THRESHOLD + 1):
+        try:
+            client.fetch_rates()
+        except ApiRequestError:
+            rejected += 1
+    requests_made = [r for r in seen if r["path"].startswith(f"/{API_KEY}/")]
+    state = DatabaseManager().get_breakers().get(DataSource.EXCHANGERATE_API, {})
+    print(f"  ошибка в теле 200: отклонено {rejected} из "
+          f"{config.BREAKER_FAILURE_THRESHOLD + 1}, запросов к серверу "
+          f"{len(requests_made)}, breaker {state.get('state')}")
+
+    if rejected != config.BREAKER_FAILURE_THRESHOLD + 1:
+        errors.append("ответ с ошибкой в теле принят как успешный")
+    if len(requests_made) != config.BREAKER_FAILURE_THRESHOLD:
+        errors.append(f"запросов к серверу {len(requests_made)}, ожидалось "
+                      f"{config.BREAKER_FAILURE_THRESHOLD}: ответ с ошибкой "
+                      f"закеширован или открытый breaker не остановил запрос")
+    if state.get("state") != "open":
+        errors.append(f"breaker {state.get('state')!r} после "
+                      f"{config.BREAKER_FAILURE_THRESHOLD} ошибок, ожидался 'open'")
+    return errors
+
+
+def main() -> int:
+    argparse.ArgumentParser(description=__doc__.strip().splitlines()[0]).parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # Кеш ответов, лимиты и breaker'ы хранятся в data/ рабочего каталога
+        os.makedirs(os.path.join(workdir, "data"))
+        os.environ["VALUTATRADE_DATA_DIR"] = os.path.join(workdir, "data")
+        os.environ["EXCHANGERATE_API_KEY"] = API_KEY
+        os.chdir(workdir)
+        sys.path.insert(0, ROOT)
+
+        from valutatrade_hub.parser_service.api_clients import BaseApiClient
+        from valutatrade_hub.parser_service.config import DataSource, config
+
+        class StandInClient(BaseApiClient):
+            def __init__(self):
+                super().__init__(SOURCE)
+
+            def fetch_rates(self) -> Dict[str, Any]:
+                return {}
+
+        # Лимиты не должны растягивать проверку
+        config.RATE_LIMITS[SOURCE] = (100.0, 10)
+        config.RATE_LIMITS[DataSource.EXCHANGERATE_API] = (100.0, 10)
+
+        server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+        server.seen = []
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+        config.EXCHANGERATE_API_URL = base_url
+        try:
+            print(f"Кеш HTTP-ответов (заглушка {base_url}):")
+            errors = check_cache(StandInClient(), base_url, server.seen)
+            print("Circuit breaker:")
+            errors += check_error_payload(server.seen)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    for error in errors:
+        print(f"ОШИБКА: {error}")
+    if not errors:
+        print("OK: клиент источников курсов ведет себя как ожидается")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
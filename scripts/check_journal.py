@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Проверка восстановления журнала портфелей после обрыва записи
+Во временном каталоге данных пишет несколько изменений портфеля и затем:
+1. обрезает журнал посреди последней записи (как при падении процесса) и
+   проверяет, что новый процесс отбрасывает только недописанную запись;
+2. дописывает в журнал обрывок записи, как упавший CLI-процесс, и проверяет,
+   что долгоживущий процесс (shell, serve) после этого пишет сделки так, что
+   их видят и он сам, и новые процессы, а восстановление их не обрезает
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from typing import Any, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+USER_ID = 1
+
+
+def read_in_new_process() -> Dict[str, Any]:
+    """Портфель глазами нового процесса (с восстановлением журнала при старте)"""
+    proc = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--read"],
+        capture_output=True, text=True, check=True
+    )
+    return json.loads(proc.stdout)
+
+
+def state(portfolio: Optional[Dict]) -> Dict[str, Any]:
+    portfolio = portfolio or {"wallets": {}}
+    return {"version": portfolio.get("version"),
+            "usd": portfolio["wallets"].get("USD", {}).get("balance")}
+
+
+def check_truncated(journal_path: str, expected: Dict[str, Any]) -> List[str]:
+    """Обрезать последнюю запись на разных байтах; ждать состояние expected"""
+    with open(journal_path, "rb") as f:
+        data = f.read()
+    last_start = data.rstrip(b"\n").rfind(b"\n") + 1
+    record_length = len(data) - last_start
+
+    errors = []
+    for cut in (1, record_length // 2, record_length - 1):
+        with open(journal_path, "r+b") as f:
+            f.truncate(len(data) - cut)
+        seen = read_in_new_process()
+        size = os.path.getsize(journal_path)
+        print(f"  обрезано {cut} из {record_length} байт последней записи: "
+              f"новый процесс видит {seen}, журнал {size} байт")
+        if seen != expected:
+            errors.append(f"обрыв на {cut} байт: {seen}, ожидалось {expected}")
+        if size != last_start:
+            errors.append(f"обрыв на {cut} байт: журнал {size} байт после "
+                          f"восстановления, ожидалось {last_start}")
+        with open(journal_path, "wb") as f:
+            f.write(data)
+    return errors
+
+
+def check_append_after_torn_tail(db: Any, journal_path: str) -> List[str]:
+    """Долгоживущий процесс дописывает сделки после обрывка чужой записи"""
+    from valutatrade_hub.core.exceptions import ConcurrentUpdateError
+
+    current = state(db.get_portfolio(USER_ID))
+    torn = json.dumps({"u": USER_ID, "v": 999, "w": {"USD": 0.0}},
+                      separators=(",", ":"))
+    with open(journal_path, "ab") as f:
+        f.write(torn[:len(torn) // 2].encode())
+
+    version = current["version"]
+    for usd in (700.0, 600.0):
+        try:
+            version = db.update_wallets(USER_ID, {"USD": usd},
+                                        expected_version=version)
+        except ConcurrentUpdateError:
+            return ["записанная сделка не видна при чтении: "
+                    "следующая запись получила конфликт версий"]
+    expected = {"version": current["version"] + 2, "usd": 600.0}
+
+    errors = []
+    own = state(db.get_portfolio(USER_ID))
+    size = os.path.getsize(journal_path)
+    seen = read_in_new_process()
+    print(f"  после обрывка чужой записи: процесс видит {own}, "
+          f"новый процесс видит {seen}")
+    if own != expected:
+        errors.append(f"долгоживущий процесс видит {own}, ожидалось {expected}")
+    if seen != expected:
+        errors.append(f"новый процесс видит {seen}, ожидалось {expected}")
+    if os.path.getsize(journal_path) != size:
+        errors.append("восстановление обрезало записанные сделки")
+    return errors
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--read", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.read:
+        from valutatrade_hub.infra.database import DatabaseManager
+
+        print(json.dumps(state(DatabaseManager().get_portfolio(USER_ID))))
+        return 0
+
+    with tempfile.TemporaryDirectory() as workdir:
+        data_dir = os.path.join(workdir, "data")
+        os.makedirs(data_dir)
+        # Порог компакции заведомо не достигается: журнал не сворачивается
+        os.environ.update(
+            PYTHONPATH=ROOT,
+            VALUTATRADE_DATA_DIR=data_dir,
+            VALUTATRADE_STORAGE_BACKEND="json",
+            VALUTATRADE_JOURNAL_COMPACT_BYTES=str(1 << 30),
+        )
+        os.chdir(workdir)
+        sys.path.insert(0, ROOT)
+
+        from valutatrade_hub.infra.database import DatabaseManager
+
+        db = DatabaseManager()
+        db.save_portfolios([{"user_id": USER_ID, "version": 0,
+                             "wallets": {"USD": {"balance": 1000.0}}}])
+        for version, usd in enumerate((900.0, 800.0, 750.0)):
+            db.update_wallets(USER_ID, {"USD": usd}, expected_version=version)
+        journal_path = os.path.join(data_dir, "portfolios.journal")
+
+        print("Обрыв последней записи журнала:")
+        errors = check_truncated(journal_path, {"version": 2, "usd": 800.0})
+        print("Запись долгоживущим процессом после обрыва чужой записи:")
+        errors += check_append_after_torn_tail(db, journal_path)
+
+    for error in errors:
+        print(f"ОШИБКА: {error}")
+    if not errors:
+        print("OK: обрыв записи не теряет целые записи журнала")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Проверка времени запуска CLI по python -X importtime
+Запускает команду несколько раз, берет лучшее (устойчивее к шуму) суммарное
+время импортов сверх голого интерпретатора и падает, если оно превышает порог
+или если команда импортирует модули, которые ей не нужны
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Модули, которые не должны загружаться командами без сети и обновления курсов
+FORBIDDEN = (
+    "requests",
+    "dotenv",
+    "valutatrade_hub.parser_service.updater",
+    "valutatrade_hub.parser_service.api_clients",
+    "valutatrade_hub.core.valuation",
+    "valutatrade_hub.api.server",
+    "valutatrade_hub.parser_service.daemon",
+)
+
+
+def import_times(argv: List[str], cwd: str) -> Tuple[float, Dict[str, int]]:
+    """Суммарное время импортов верхнего уровня (мс) и время по модулям (мкс)"""
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", *argv],
+        capture_output=True, text=True, env=env, cwd=cwd
+    )
+    total = 0
+    modules: Dict[str, int] = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line[len("import time:"):].split("|")
+        modules[module.strip()] = int(cumulative)
+        # Модули верхнего уровня записаны с одним пробелом после '|'
+        if not module.startswith("  "):
+            total += int(cumulative)
+    return total / 1000, modules
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--command", default="whoami",
+                        help="Команда CLI для замера (по умолчанию whoami)")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-ms", type=float, default=80.0,
+                        help="Порог времени импортов сверх интерпретатора, мс")
+    args = parser.parse_args()
+
+    # Команда запускается в пустом каталоге, чтобы не трогать данные проекта
+    with tempfile.TemporaryDirectory() as workdir:
+        baseline = min(import_times(["-c", "pass"], workdir)[0]
+                                     for _ in range(args.runs))
+        samples = []
+        modules: Dict[str, int] = {}
+        command = [os.path.join(ROOT, "main.py"), *args.command.split()]
+        for _ in range(args.runs):
+            total, modules = import_times(command, workdir)
+            samples.append(total - baseline)
+    startup = min(samples)
+
+    heaviest = sorted(((cumulative, name) for name, cumulative in modules.items()
+                       if name.startswith("valutatrade_hub")), reverse=True)[:5]
+    print(f"Импорты '{args.command}': {startup:.1f} мс сверх интерпретатора "
+          f"(порог {args.max_ms:.0f} мс)")
+    for cumulative, name in heaviest:
+        print(f"  {cumulative / 1000:7.1f} мс  {name}")
+
+    failed = False
+    loaded = [name for name in FORBIDDEN if name in modules]
+    if loaded:
+        print(f"ОШИБКА: загружены лишние модули: {', '.join(loaded)}")
+        failed = True
+    if startup > args.max_ms:
+        print("ОШИБКА: время импортов превышает порог")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест локального HTTP API (project serve)
+Открывает заданное число keep-alive соединений, в течение заданного времени
+шлет запросы выбранного сценария и печатает число запросов в секунду и
+задержки p50/p99. Для сценариев с портфелем и сделками регистрирует и
+авторизует временного пользователя
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import secrets
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+# Сценарий -> список (вес, метод, путь, тело)
+SCENARIOS = {
+    "rate": [(1, "GET", "/rate?from=BTC&to=EUR", None)],
+    "rates": [(1, "GET", "/rates", None)],
+    "portfolio": [(1, "GET", "/portfolio?base=USD", None)],
+    "buy": [(1, "POST", "/buy", {"currency": "EUR", "amount": 0.01})],
+    "mix": [
+        (70, "GET", "/rate?from=BTC&to=EUR", None),
+        (10, "GET", "/rates", None),
+        (15, "GET", "/portfolio?base=USD", None),
+        (5, "POST", "/buy", {"currency": "EUR", "amount": 0.01}),
+    ],
+}
+
+
+class Connection:
+    """Keep-alive соединение с API"""
+
+    def __init__(self, host: str, port: int, token: Optional[str] = None):
+        self.host = host
+        self.port = port
+        self.token = token
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+
+    async def request(self, method: str, path: str,
+                      body: Optional[Dict] = None) -> Tuple[int, Any]:
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(
+                self.host, self.port
+            )
+
+        payload = json.dumps(body).encode() if body is not None else b""
+        head = f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n"
+        if self.token:
+            head += f"Authorization: Bearer {self.token}\r\n"
+        head += f"Content-Length: {len(payload)}\r\n\r\n"
+        self._writer.write(head.encode("latin-1") + payload)
+
+        status_line, *header_lines = (
+            (await self._reader.readuntil(b"\r\n\r\n")).decode("latin-1").split("\r\n")
+        )
+        headers = {}
+        for line in header_lines:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        data = await self._reader.readexactly(int(headers.get("content-length", 0)))
+        if headers.get("connection", "").lower() == "close":
+            await self.close()
+        return int(status_line.split(" ", 2)[1]), json.loads(data) if data else None
+
+    async def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except ConnectionError:
+                pass
+            self._reader = self._writer = None
+
+
+async def login_temp_user(host: str, port: int) -> str:
+    """Зарегистрировать временного пользователя и вернуть его токен"""
+    conn = Connection(host, port)
+    credentials = {"username": f"load_{secrets.token_hex(4)}",
+                   "password": secrets.token_hex(8)}
+    try:
+        status, data = await conn.request("POST", "/register", credentials)
+        if status != 201:
+            raise RuntimeError(f"register: {status} {data}")
+        status, data = await conn.request("POST", "/login", credentials)
+        if status != 200:
+            raise RuntimeError(f"login: {status} {data}")
+        return data["token"]
+    finally:
+        await conn.close()
+
+
+async def worker(conn: Connection, scenario: List, deadline: float,
+                 latencies: List[float], errors: Dict[int, int]) -> None:
+    weights = [item[0] for item in scenario]
+    while time.perf_counter() < deadline:
+        _, method, path, body = random.choices(scenario, weights)[0]
+        started = time.perf_counter()
+        try:
+            status, _ = await conn.request(method, path, body)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            status = 0
+            await conn.close()
+        latencies.append(time.perf_counter() - started)
+        if not 200 <= status < 300:
+            errors[status] = errors.get(status, 0) + 1
+    await conn.close()
+
+
+def percentile(values: List[float], share: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))]
+
+
+async def run(args: argparse.Namespace) -> int:
+    scenario = SCENARIOS[args.scenario]
+    token = None
+    if any(path.startswith(("/buy", "/portfolio")) for _, _, path, _ in scenario):
+        token = await login_temp_user(args.host, args.port)
+
+    latencies: List[float] = []
+    errors: Dict[int, int] = {}
+    deadline = time.perf_counter() + args.duration
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        worker(Connection(args.host, args.port, token), scenario, deadline,
+               latencies, errors)
+        for _ in range(args.concurrency)
+    ))
+    elapsed = time.perf_counter() - started
+
+    if not latencies:
+        print("Нет выполненных запросов")
+        return 1
+
+    print(f"Сценарий: {args.scenario}, соединений: {args.concurrency}, "
+          f"время: {elapsed:.1f} с")
+    print(f"Запросов: {len(latencies)}, ошибок: {sum(errors.values())}"
+          + (f" {errors}" if errors else ""))
+    print(f"RPS: {len(latencies) / elapsed:,.0f}")
+    print(f"p50: {percentile(latencies, 0.50) * 1000:.2f} мс, "
+          f"p99: {percentile(latencies, 0.99) * 1000:.2f} мс, "
+          f"max: {max(latencies) * 1000:.2f} мс")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="rate")
+    parser.add_argument("--concurrency", type=int, default=16,
+                        help="Число одновременных соединений (по умолчанию 16)")
+    parser.add_argument("--duration", type=float, default=10.0,
+                        help="Длительность теста в секундах (по умолчанию 10)")
+    args = parser.parse_args()
+    try:
+        return asyncio.run(run(args))
+    except (ConnectionError, RuntimeError) as e:
+        print(f"Ошибка: {e}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Стресс-тест параллельных сделок в нескольких процессах
+Создает временный каталог данных, запускает N процессов, которые одновременно
+покупают и продают по фиксированному курсу через commit_trade (общий путь
+записи buy/sell и заявок), и проверяет, что ни одно изменение не потеряно:
+итоговые балансы, version портфелей и число записей в журнале сделок должны
+точно совпасть с ожидаемыми. Дополнительно проверяет, что сделка с самим USD
+отклоняется и не меняет портфель
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CURRENCY = "EUR"
+# Сумма и курс точно представимы в float, поэтому балансы сравниваются на ==
+AMOUNT = 1.5
+RATE = 1.25
+INITIAL_BALANCE = 1_000_000.0
+
+
+def worker(user_id: int, trades: int, start_at: float) -> None:
+    """Две покупки на одну продажу; вывести число сделок каждого вида"""
+    from valutatrade_hub.core.trading import commit_trade
+
+    time.sleep(max(0.0, start_at - time.time()))
+    counts = {"buy": 0, "sell": 0}
+    for i in range(trades):
+        # Покупок больше, чем продаж: итоговые балансы отличаются от начальных
+        side = "sell" if i % 3 == 2 else "buy"
+        commit_trade(user_id, side, CURRENCY, AMOUNT, RATE)
+        counts[side] += 1
+    print(json.dumps(counts))
+
+
+def seed(users: int) -> None:
+    """Создать портфели с запасом USD и EUR, чтобы продажи не упирались в баланс"""
+    from valutatrade_hub.infra.database import DatabaseManager
+
+    DatabaseManager().save_portfolios([
+        {"user_id": user_id, "version": 0,
+         "wallets": {"USD": {"balance": INITIAL_BALANCE},
+                     CURRENCY: {"balance": INITIAL_BALANCE}}}
+        for user_id in range(1, users + 1)
+    ])
+
+
+def check_usd_rejected(user_id: int) -> List[str]:
+    """Покупка и продажа USD за USD должны отклоняться без изменения портфеля"""
+    from valutatrade_hub.core.trading import commit_trade
+    from valutatrade_hub.infra.database import DatabaseManager
+
+    db = DatabaseManager()
+    before = db.get_portfolio(user_id)
+    errors = []
+    for side in ("buy", "sell"):
+        try:
+            commit_trade(user_id, side, "USD", 100.0, 1.0)
+        except ValueError:
+            continue
+        errors.append(f"сделка {side} USD за USD не отклонена")
+    if db.get_portfolio(user_id) != before:
+        errors.append("сделка с USD изменила портфель")
+    return errors
+
+
+def verify(expected: Dict[int, Dict[str, int]]) -> List[str]:
+    """Сверить балансы, версии и журнал сделок с числом выполненных сделок"""
+    from valutatrade_hub.infra.database import DatabaseManager
+
+    db = DatabaseManager()
+    errors = []
+    for user_id, counts in sorted(expected.items()):
+        buys, sells = counts["buy"], counts["sell"]
+        portfolio = db.get_portfolio(user_id) or {"wallets": {}}
+        wallets = portfolio["wallets"]
+        usd = wallets.get("USD", {}).get("balance")
+        eur = wallets.get(CURRENCY, {}).get("balance")
+        want_usd = INITIAL_BALANCE + (sells - buys) * AMOUNT * RATE
+        want_eur = INITIAL_BALANCE + (buys - sells) * AMOUNT
+        ledger = sum(1 for _ in db.get_trade_history(user_id))
+
+        print(f"  пользователь {user_id}: сделок {buys + sells}, "
+              f"version {portfolio.get('version')}, USD {usd}, {CURRENCY} {eur}, "
+              f"в журнале сделок {ledger}")
+        if usd != want_usd:
+            errors.append(f"пользователь {user_id}: USD {usd}, ожидалось {want_usd}")
+        if eur != want_eur:
+            errors.append(f"пользователь {user_id}: {CURRENCY} {eur}, "
+                          f"ожидалось {want_eur}")
+        if portfolio.get("version") != buys + sells:
+            errors.append(f"пользователь {user_id}: version "
+                          f"{portfolio.get('version')}, ожидалось {buys + sells}")
+        if ledger != buys + sells:
+            errors.append(f"пользователь {user_id}: в журнале сделок {ledger} "
+                          f"записей, ожидалось {buys + sells}")
+    return errors
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--trades", type=int, default=200,
+                        help="Сделок на процесс")
+    parser.add_argument("--users", type=int, default=2,
+                        help="Портфелей, между которыми делятся процессы")
+    parser.add_argument("--backend", choices=("json", "sqlite"), default="json")
+    parser.add_argument("--compact-bytes", type=int, default=8192,
+                        help="Порог компакции журнала JSON-бэкенда (малый, "
+                             "чтобы компакция шла во время теста)")
+    parser.add_argument("--worker", nargs=3, type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        user_id, trades, start_at = args.worker
+        worker(int(user_id), int(trades), start_at)
+        return 0
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # Настройки читаются из окружения; рабочий каталог - временный, чтобы
+        # не трогать данные проекта (session.json и логи пишутся туда же)
+        os.environ.update(
+            PYTHONPATH=ROOT,
+            VALUTATRADE_DATA_DIR=os.path.join(workdir, "data"),
+            VALUTATRADE_STORAGE_BACKEND=args.backend,
+            VALUTATRADE_JOURNAL_COMPACT_BYTES=str(args.compact_bytes),
+        )
+        os.makedirs(os.environ["VALUTATRADE_DATA_DIR"])
+        os.chdir(workdir)
+        sys.path.insert(0, ROOT)
+        seed(args.users)
+
+        start_at = time.time() + 0.5
+        workers = [
+            subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), "--worker",
+                 str(i % args.users + 1), str(args.trades), str(start_at)],
+                stdout=subprocess.PIPE, text=True
+            )
+            for i in range(args.processes)
+        ]
+        expected = {user_id: {"buy": 0, "sell": 0}
+                    for user_id in range(1, args.users + 1)}
+        errors = []
+        for i, process in enumerate(workers):
+            out, _ = process.communicate()
+            if process.returncode != 0:
+                errors.append(f"процесс {i} завершился с кодом {process.returncode}")
+                continue
+            for side, count in json.loads(out).items():
+                expected[i % args.users + 1][side] += count
+        elapsed = time.time() - start_at
+
+        total = sum(sum(counts.values()) for counts in expected.values())
+        print(f"Бэкенд {args.backend}: {args.processes} процессов, "
+              f"{total} сделок за {elapsed:.2f} с ({total / elapsed:,.0f} сделок/с)")
+        errors += verify(expected)
+        errors += check_usd_rejected(1)
+
+    for error in errors:
+        print(f"ОШИБКА: {error}")
+    if not errors:
+        print("OK: изменения не потеряны, версии и журнал сделок сходятся")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
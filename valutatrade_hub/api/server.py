@@ -0,0 +1,373 @@
+"""
+Локальный HTTP/JSON API на asyncio (только стандартная библиотека)
+Соединения обслуживает один цикл событий с keep-alive. Курсы отдаются из
+прогретых кэшей (матрица RateEngine, rates.json в кэше DatabaseManager) прямо
+в цикле событий, а операции с хранилищем пользователей и портфелей
+выполняются в ограниченном пуле потоков. Токен, выданный /login, связан с
+отдельным TradingService, поэтому сессии клиентов не пересекаются. Сессия
+истекает, если ей не пользовались server_session_ttl секунд, а сверх
+server_max_sessions при входе вытесняются самые давно использованные
+"""
+
+import asyncio
+import functools
+import json
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from http import HTTPStatus
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+from ..core.exceptions import (
+    ApiRequestError, ConcurrentUpdateError, CurrencyNotFoundError,
+    InsufficientFundsError, UserNotFoundError
+)
+from ..core.rate_engine import RateEngine
+from ..core.service import TradingService
+from ..core.utils import validate_currency_code
+from ..infra.database import DatabaseManager
+from ..infra.settings import SettingsLoader
+
+MAX_HEADER_BYTES = 16384
+MAX_BODY_BYTES = 65536
+KEEPALIVE_TIMEOUT = 30.0
+
+# Ошибки сценариев и соответствующие им HTTP-статусы
+ERROR_STATUSES = (
+    (UserNotFoundError, HTTPStatus.NOT_FOUND),
+    (InsufficientFundsError, HTTPStatus.UNPROCESSABLE_ENTITY),
+    (ConcurrentUpdateError, HTTPStatus.CONFLICT),
+    (ApiRequestError, HTTPStatus.SERVICE_UNAVAILABLE),
+    (CurrencyNotFoundError, HTTPStatus.BAD_REQUEST),
+    (ValueError, HTTPStatus.BAD_REQUEST),
+)
+
+Response = Tuple[int, Any]
+
+
+class HttpError(Exception):
+    """Ошибка запроса, которая возвращается клиенту с указанным статусом"""
+
+    def __init__(self, status: int, message: str):
+        self.status = status
+        self.message = message
+        super().__init__(message)
+
+
+@dataclass
+class Request:
+    """Разобранный HTTP-запрос"""
+
+    method: str
+    path: str
+    version: str
+    headers: Dict[str, str]
+    query: Dict[str, list] = field(default_factory=dict)
+    body: bytes = b""
+
+    @property
+    def keep_alive(self) -> bool:
+        connection = self.headers.get("connection", "").lower()
+        if self.version == "HTTP/1.0":
+            return connection == "keep-alive"
+        return connection != "close"
+
+    def param(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        values = self.query.get(name)
+        return values[0] if values else default
+
+    def json(self) -> Dict[str, Any]:
+        if not self.body:
+            return {}
+        try:
+            data = json.loads(self.body, parse_constant=_reject_constant)
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            raise HttpError(HTTPStatus.BAD_REQUEST, "Тело запроса - не JSON")
+        if not isinstance(data, dict):
+            raise HttpError(HTTPStatus.BAD_REQUEST, "Ожидается JSON-объект")
+        return data
+
+
+class ApiServer:
+    """HTTP API сценариев торговли и курсов"""
+
+    def __init__(self, host: Optional[str] = None, port: Optional[int] = None,
+                 workers: Optional[int] = None):
+        settings = SettingsLoader()
+        self.host = host or settings.get("server_host", "127.0.0.1")
+        self.port = port if port is not None else settings.get("server_port", 8765)
+        self.workers = workers or settings.get("server_workers", 8)
+        if self.workers <= 0:
+            raise ValueError("Число потоков должно быть положительным")
+
+        self.session_ttl = settings.get("server_session_ttl", 3600)
+        self.max_sessions = settings.get("server_max_sessions", 10000)
+
+        self._pool: Optional[ThreadPoolExecutor] = None
+        # Токен -> (сессия, срок по time.monotonic()); порядок словаря - от
+        # давно использованных к недавним, поэтому истекшие идут первыми
+        self._sessions: Dict[str, Tuple[TradingService, float]] = {}
+        self._rates: Optional[Tuple[Tuple, Dict]] = None
+        self._routes: Dict[Tuple[str, str],
+                           Callable[[Request], Awaitable[Response]]] = {
+            ("POST", "/register"): self._register,
+            ("POST", "/login"): self._login,
+            ("POST", "/logout"): self._logout,
+            ("POST", "/buy"): functools.partial(self._trade, "buy"),
+            ("POST", "/sell"): functools.partial(self._trade, "sell"),
+            ("GET", "/rate"): self._get_rate,
+            ("GET", "/rates"): self._show_rates,
+            ("GET", "/portfolio"): self._portfolio,
+        }
+
+    def run(self) -> None:
+        """Обслуживать запросы до Ctrl+C"""
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            pass
+
+    async def serve(self) -> None:
+        self._pool = ThreadPoolExecutor(max_workers=self.workers,
+                                        thread_name_prefix="api")
+        try:
+            # Матрица курсов строится до первого запроса, а не в нем
+            try:
+                await self._call(RateEngine().matrix)
+            except ApiRequestError:
+                pass
+
+            server = await asyncio.start_server(
+                self._handle_connection, self.host, self.port,
+                limit=MAX_HEADER_BYTES
+            )
+            port = server.sockets[0].getsockname()[1]
+            print(f"HTTP API: http://{self.host}:{port} (потоков: {self.workers}). "
+                  f"Ctrl+C - остановка", flush=True)
+            async with server:
+                await server.serve_forever()
+        finally:
+            self._pool.shutdown(wait=True)
+
+    async def _handle_connection(self, reader: asyncio.StreamReader,
+                                 writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(_read_request(reader),
+                                                     KEEPALIVE_TIMEOUT)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError,
+                        ConnectionError):
+                    break
+                except HttpError as e:
+                    writer.write(_encode(e.status, {"error": e.message}, False))
+                    await writer.drain()
+                    break
+
+                status, payload = await self._dispatch(request)
+                writer.write(_encode(status, payload, request.keep_alive))
+                await writer.drain()
+                if not request.keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def _dispatch(self, request: Request) -> Response:
+        handler = self._routes.get((request.method, request.path))
+        if handler is None:
+            if any(path == request.path for _, path in self._routes):
+                return HTTPStatus.METHOD_NOT_ALLOWED, {
+                    "error": f"Метод {request.method} не поддерживается"
+                }
+            return HTTPStatus.NOT_FOUND, {"error": f"Неизвестный путь {request.path}"}
+
+        try:
+            return await handler(request)
+        except HttpError as e:
+            return e.status, {"error": e.message}
+        except Exception as e:
+            for error_type, status in ERROR_STATUSES:
+                if isinstance(e, error_type):
+                    return status, {"error": str(e)}
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {
+                "error": f"Внутренняя ошибка сервера: {e}"
+            }
+
+    async def _call(self, func: Callable, *args: Any) -> Any:
+        """Выполнить блокирующую операцию в пуле потоков"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, functools.partial(func, *args))
+
+    def _authorize(self, request: Request) -> TradingService:
+        token = _bearer_token(request)
+        session = self._sessions.pop(token, None)
+        if session is None or session[1] <= time.monotonic():
+            raise HttpError(HTTPStatus.UNAUTHORIZED,
+                            "Недействительный или истекший токен, выполните /login")
+        # Срок продлевается, сессия становится самой недавней
+        self._sessions[token] = (session[0], time.monotonic() + self.session_ttl)
+        return session[0]
+
+    def _expire_sessions(self) -> None:
+        """Удалить истекшие сессии и самые давние сверх server_max_sessions"""
+        now = time.monotonic()
+        while self._sessions:
+            token, (_, expires_at) = next(iter(self._sessions.items()))
+            if expires_at > now and len(self._sessions) < self.max_sessions:
+                break
+            del self._sessions[token]
+
+    async def _register(self, request: Request) -> Response:
+        body = request.json()
+        message = await self._call(TradingService().register,
+                                   _field(body, "username", str),
+                                   _field(body, "password", str))
+        return HTTPStatus.CREATED, {"message": message}
+
+    async def _login(self, request: Request) -> Response:
+        body = request.json()
+        service = TradingService()
+        try:
+            message = await self._call(service.login,
+                                       _field(body, "username", str),
+                                       _field(body, "password", str))
+        except (UserNotFoundError, ValueError) as e:
+            raise HttpError(HTTPStatus.UNAUTHORIZED, str(e))
+
+        self._expire_sessions()
+        token = secrets.token_urlsafe(24)
+        self._sessions[token] = (service, time.monotonic() + self.session_ttl)
+        return HTTPStatus.OK, {"token": token, "user": service.username,
+                               "message": message}
+
+    async def _logout(self, request: Request) -> Response:
+        service = self._authorize(request)
+        del self._sessions[_bearer_token(request)]
+        return HTTPStatus.OK, {"message": f"Сессия {service.username} закрыта"}
+
+    async def _trade(self, side: str, request: Request) -> Response:
+        service = self._authorize(request)
+        body = request.json()
+        trade = await self._call(service.trade, side,
+                                 _field(body, "currency", str),
+                                 _field(body, "amount", (int, float)))
+        return HTTPStatus.OK, trade
+
+    async def _get_rate(self, request: Request) -> Response:
+        from_code = validate_currency_code(request.param("from", ""))
+        to_code = validate_currency_code(request.param("to", ""))
+
+        # Матрица в памяти: в цикле событий проверяется только подпись файла
+        cross = RateEngine().get(from_code, to_code)
+        return HTTPStatus.OK, {
+            "from": from_code,
+            "to": to_code,
+            "rate": cross.rate,
+            "path": list(cross.path),
+            "updated_at": cross.updated_at,
+            "estimated": cross.estimated,
+            "stale": from_code != to_code and cross.is_stale(),
+        }
+
+    async def _show_rates(self, request: Request) -> Response:
+        db = DatabaseManager()
+        signature = db.rates_signature()
+        if self._rates is None or self._rates[0] != signature:
+            data = db.get_rates()
+            self._rates = (signature, {"last_refresh": data.get("last_refresh"),
+                                       "pairs": data.get("pairs", {})})
+        payload = self._rates[1]
+
+        currency = request.param("currency")
+        if currency:
+            currency = currency.upper()
+            pairs = {key: value for key, value in payload["pairs"].items()
+                     if currency in key}
+            if not pairs:
+                raise HttpError(HTTPStatus.NOT_FOUND,
+                                f"Курс для '{currency}' не найден в кеше")
+            payload = {**payload, "pairs": pairs}
+        return HTTPStatus.OK, payload
+
+    async def _portfolio(self, request: Request) -> Response:
+        service = self._authorize(request)
+        return HTTPStatus.OK, await self._call(service.portfolio,
+                                               request.param("base", "USD"))
+
+
+async def _read_request(reader: asyncio.StreamReader) -> Request:
+    try:
+        head = await reader.readuntil(b"\r\n\r\n")
+    except asyncio.LimitOverrunError:
+        raise HttpError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE,
+                        "Слишком большие заголовки")
+
+    lines = head.decode("latin-1").split("\r\n")
+    try:
+        method, target, version = lines[0].split(" ", 2)
+    except ValueError:
+        raise HttpError(HTTPStatus.BAD_REQUEST, "Некорректная строка запроса")
+
+    headers = {}
+    for line in lines[1:]:
+        name, sep, value = line.partition(":")
+        if sep:
+            headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise HttpError(HTTPStatus.BAD_REQUEST, "Некорректный Content-Length")
+    if length < 0 or length > MAX_BODY_BYTES:
+        raise HttpError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                        f"Тело запроса больше {MAX_BODY_BYTES} байт")
+    body = await reader.readexactly(length) if length else b""
+
+    url = urlsplit(target)
+    return Request(method.upper(), url.path, version.strip(), headers,
+                   parse_qs(url.query), body)
+
+
+def _encode(status: int, payload: Any, keep_alive: bool) -> bytes:
+    try:
+        body = json.dumps(payload, ensure_ascii=False,
+                          allow_nan=False).encode("utf-8")
+    except ValueError:
+        # NaN и Infinity не входят в JSON: лучше ошибка, чем битый ответ
+        status = HTTPStatus.INTERNAL_SERVER_ERROR
+        body = json.dumps({"error": "Ответ содержит нечисловое значение"},
+                          ensure_ascii=False).encode("utf-8")
+    head = (
+        f"HTTP/1.1 {int(status)} {HTTPStatus(status).phrase}\r\n"
+        f"Content-Type: application/json; charset=utf-8\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    return head.encode("latin-1") + body
+
+
+def _reject_constant(name: str) -> Any:
+    """NaN, Infinity и -Infinity - не JSON, хотя json.loads их принимает"""
+    raise json.JSONDecodeError(f"Недопустимое значение {name}", name, 0)
+
+
+def _field(body: Dict[str, Any], name: str, kind: Any) -> Any:
+    value = body.get(name)
+    if isinstance(value, bool) or not isinstance(value, kind):
+        raise HttpError(HTTPStatus.BAD_REQUEST, f"Поле '{name}' обязательно")
+    return value
+
+
+def _bearer_token(request: Request) -> str:
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token.strip():
+        raise HttpError(HTTPStatus.UNAUTHORIZED,
+                        "Требуется заголовок Authorization: Bearer <токен>")
+    return token.strip()
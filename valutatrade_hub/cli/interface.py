@@ -5,28 +5,17 @@ CLI интерфейс приложения
 import argparse
 import sys
 import os
-from valutatrade_hub.core.usecases import (
-    register,
-    login,
-    show_portfolio,
-    buy,
-    sell,
-    get_rate,
-    logout_user,
-    get_current_user_info,
-    list_supported_currencies
-)
 from valutatrade_hub.core.exceptions import (
     InsufficientFundsError,
     CurrencyNotFoundError,
     ApiRequestError,
-    UserNotFoundError
+    UserNotFoundError,
+    ConcurrentUpdateError
 )
-from valutatrade_hub.parser_service.updater import updater
-from valutatrade_hub.parser_service.scheduler import scheduler
 
 
-def main():
+def build_parser() -> argparse.ArgumentParser:
+    """Парсер всех команд CLI (используется и командной строкой, и shell)"""
     parser = argparse.ArgumentParser(
         description="Валютный кошелек - управление виртуальным портфелем",
         prog="valutatrade",
@@ -142,6 +131,35 @@ def main():
         help="Показать список поддерживаемых валют"
     )
 
+    shell_parser = subparsers.add_parser(
+        "shell",
+        help="Интерактивный режим: команды в одном процессе с прогретыми кэшами"
+    )
+    shell_parser.add_argument(
+        "--timing",
+        action="store_true",
+        help="Показывать время выполнения каждой команды"
+    )
+
+    serve_parser = subparsers.add_parser(
+        "serve",
+        help="Запустить локальный HTTP/JSON API"
+    )
+    serve_parser.add_argument(
+        "--host",
+        help="Адрес (по умолчанию server_host из настроек, 127.0.0.1)"
+    )
+    serve_parser.add_argument(
+        "--port",
+        type=int,
+        help="Порт (по умолчанию server_port из настроек, 8765)"
+    )
+    serve_parser.add_argument(
+        "--workers",
+        type=int,
+        help="Потоков для операций с хранилищем (по умолчанию server_workers, 8)"
+    )
+
     update_parser = subparsers.add_parser(
         "update-rates",
         help="Обновить курсы валют из внешних API"
@@ -189,66 +207,263 @@ def main():
 
     subparsers.add_parser(
         "start-scheduler",
-        help="Запустить планировщик автоматического обновления"
+        help="Запустить планировщик обновления в фоновом процессе"
     )
 
     subparsers.add_parser(
         "stop-scheduler",
-        help="Остановить планировщик автоматического обновления"
+        help="Остановить фоновый процесс планировщика"
+    )
+
+    subparsers.add_parser(
+        "migrate-storage",
+        help="Перенести users.json и portfolios.json в SQLite"
+    )
+
+    subparsers.add_parser(
+        "compact-journal",
+        help="Свернуть журнал сделок в снимок portfolios.json"
+    )
+
+    subparsers.add_parser(
+        "import-history",
+        help="Импортировать exchange_rates.json в хранилище истории курсов"
+    )
+
+    batch_parser = subparsers.add_parser(
+        "batch-trade",
+        help="Исполнить пакет заявок buy/sell из CSV или JSONL"
+    )
+    batch_parser.add_argument(
+        "--file",
+        required=True,
+        help="Файл заявок (.csv или .jsonl, '-' - стандартный ввод)"
+    )
+    batch_parser.add_argument(
+        "--format",
+        dest="fmt",
+        choices=["csv", "jsonl"],
+        help="Формат файла (по умолчанию по расширению)"
+    )
+    batch_parser.add_argument(
+        "--quiet",
+        action="store_true",
+        help="Показывать только отклоненные заявки и итог"
+    )
+
+    order_parser = subparsers.add_parser(
+        "place-order",
+        help="Выставить limit/stop заявку, исполняемую при обновлении курсов"
+    )
+    order_parser.add_argument(
+        "--side",
+        required=True,
+        choices=["buy", "sell"],
+        help="Покупка или продажа"
+    )
+    order_parser.add_argument(
+        "--currency",
+        required=True,
+        help="Код валюты (например, BTC)"
+    )
+    order_parser.add_argument(
+        "--amount",
+        type=float,
+        required=True,
+        help="Количество валюты"
+    )
+    order_parser.add_argument(
+        "--type",
+        dest="kind",
+        default="limit",
+        choices=["limit", "stop"],
+        help="limit - по цене или лучше, stop - при пробое цены"
+    )
+    order_parser.add_argument(
+        "--price",
+        type=float,
+        required=True,
+        help="Цена срабатывания в USD"
+    )
+
+    subparsers.add_parser(
+        "list-orders",
+        help="Показать открытые заявки текущего пользователя"
+    )
+
+    cancel_parser = subparsers.add_parser(
+        "cancel-order",
+        help="Снять открытую заявку"
+    )
+    cancel_parser.add_argument(
+        "--id",
+        dest="order_id",
+        type=int,
+        required=True,
+        help="Номер заявки"
+    )
+
+    trade_history_parser = subparsers.add_parser(
+        "trade-history",
+        help="История сделок пользователя из журнала сделок"
+    )
+    trade_history_parser.add_argument(
+        "--user",
+        help="Имя пользователя (по умолчанию - текущий)"
+    )
+    trade_history_parser.add_argument(
+        "--since",
+        help="Начиная с момента (ISO, например 2025-10-01T12:00:00)"
+    )
+    trade_history_parser.add_argument(
+        "--limit",
+        type=int,
+        help="Максимальное число сделок"
+    )
+
+    aum_parser = subparsers.add_parser(
+        "aum-report",
+        help="Суммарные активы и топ портфелей по всем пользователям"
+    )
+    aum_parser.add_argument(
+        "--base",
+        default="USD",
+        help="Базовая валюта отчета (по умолчанию USD)"
+    )
+    aum_parser.add_argument(
+        "--top",
+        type=int,
+        default=10,
+        help="Размер топа портфелей (по умолчанию 10)"
+    )
+    aum_parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="Число процессов для оценки (0 - в текущем процессе)"
+    )
+    aum_parser.add_argument(
+        "--chunk-size",
+        dest="chunk_size",
+        type=int,
+        default=10000,
+        help="Размер пачки портфелей (по умолчанию 10000)"
+    )
+
+    subparsers.add_parser(
+        "compact-history",
+        help="Удалить историю курсов старше сроков хранения"
     )
 
+    history_parser = subparsers.add_parser(
+        "rate-history",
+        help="Показать историю курса за период"
+    )
+    history_parser.add_argument(
+        "--from",
+        dest="cur_from",
+        required=True,
+        help="Исходная валюта"
+    )
+    history_parser.add_argument(
+        "--to",
+        dest="cur_to",
+        default="USD",
+        help="Целевая валюта (по умолчанию USD)"
+    )
+    history_parser.add_argument(
+        "--start",
+        help="Начало периода (ISO 8601, UTC)"
+    )
+    history_parser.add_argument(
+        "--end",
+        help="Конец периода (ISO 8601, UTC)"
+    )
+    history_parser.add_argument(
+        "--limit",
+        type=int,
+        help="Максимальное количество точек"
+    )
+    history_parser.add_argument(
+        "--interval",
+        choices=["1m", "1h", "1d"],
+        help="Показать агрегаты OHLC за интервал вместо сырых точек"
+    )
+    history_parser.add_argument(
+        "--as-of",
+        dest="as_of",
+        help="Показать курс, действовавший в указанный момент"
+    )
+
+    return parser
+
+
+def main():
+    parser = build_parser()
     args = parser.parse_args()
 
     if not args.command:
         parser.print_help()
         sys.exit(1)
 
+    exit_code = run_command(args)
+    if exit_code:
+        sys.exit(exit_code)
+
+
+def run_command(args) -> int:
+    """Выполнить разобранную команду, напечатать результат. Возвращает код выхода"""
     try:
         result = handle_command(args)
         if result:
             print(result)
+        return 0
     except InsufficientFundsError as e:
         print(f"Ошибка: {e}")
         print("Проверьте баланс и попробуйте снова.")
-        sys.exit(1)
     except CurrencyNotFoundError as e:
         print(f"Ошибка: {e}")
         print("Используйте команду 'list-currencies' чтобы увидеть доступные валюты.")
-        sys.exit(1)
     except ApiRequestError as e:
         print(f"Ошибка API: {e}")
         print("Пожалуйста, повторите попытку позже или проверьте соединение.")
-        sys.exit(1)
     except UserNotFoundError as e:
         print(f"Ошибка: {e}")
-        sys.exit(1)
+    except ConcurrentUpdateError as e:
+        print(f"Ошибка: {e}")
+        print("Данные одновременно изменяются другими процессами.")
     except ValueError as e:
         print(f"Ошибка: {e}")
-        sys.exit(1)
     except Exception as e:
         print(f"Неизвестная ошибка: {e}")
-        sys.exit(1)
+    return 1
 
 
 def handle_command(args):
+    from valutatrade_hub.core import usecases
+
     if args.command == "register":
-        return register(args.username, args.password)
+        return usecases.register(args.username, args.password)
     elif args.command == "login":
-        return login(args.username, args.password)
+        return usecases.login(args.username, args.password)
     elif args.command == "show-portfolio":
-        return show_portfolio(args.base)
+        return usecases.show_portfolio(args.base)
     elif args.command == "buy":
-        return buy(args.currency, args.amount)
+        return usecases.buy(args.currency, args.amount)
     elif args.command == "sell":
-        return sell(args.currency, args.amount)
+        return usecases.sell(args.currency, args.amount)
     elif args.command == "get-rate":
-        return get_rate(args.cur_from, args.cur_to)
+        return usecases.get_rate(args.cur_from, args.cur_to)
     elif args.command == "logout":
-        return logout_user()
+        return usecases.logout_user()
     elif args.command == "whoami":
-        return get_current_user_info()
+        return usecases.get_current_user_info()
     elif args.command == "list-currencies":
-        return list_supported_currencies()
+        return usecases.list_supported_currencies()
+    elif args.command == "shell":
+        return handle_shell(args)
+    elif args.command == "serve":
+        return handle_serve(args)
     elif args.command == "update-rates":
         return handle_update_rates(args)
     elif args.command == "show-rates":
@@ -259,11 +474,115 @@ def handle_command(args):
         return handle_start_scheduler()
     elif args.command == "stop-scheduler":
         return handle_stop_scheduler()
+    elif args.command == "migrate-storage":
+        return handle_migrate_storage()
+    elif args.command == "compact-journal":
+        return handle_compact_journal()
+    elif args.command == "import-history":
+        return handle_import_history()
+    elif args.command == "batch-trade":
+        return usecases.batch_trade(args.file, args.fmt, args.quiet)
+    elif args.command == "place-order":
+        return usecases.place_order(args.side, args.currency, args.amount,
+                                    args.kind, args.price)
+    elif args.command == "list-orders":
+        return usecases.list_orders()
+    elif args.command == "cancel-order":
+        return usecases.cancel_order(args.order_id)
+    elif args.command == "trade-history":
+        return usecases.trade_history(args.user, args.since, args.limit)
+    elif args.command == "aum-report":
+        return usecases.aum_report(args.base, args.top, args.workers, args.chunk_size)
+    elif args.command == "compact-history":
+        return handle_compact_history()
+    elif args.command == "rate-history":
+        return handle_rate_history(args)
     else:
         return "Неизвестная команда"
 
 
+def handle_shell(args) -> str:
+    """
+    REPL с тем же набором команд, что и CLI
+    Настройки, реестр валют, курсы, индексы и сессия остаются в памяти между
+    командами, а запущенный планировщик работает, пока открыт shell
+    """
+    import shlex
+    import time
+    try:
+        import readline  # noqa: F401 - история и редактирование строки
+    except ImportError:
+        pass
+
+    parser = build_parser()
+    _warm_up()
+    print("ValutaTrade shell. Команды те же, что в CLI: 'help' - список команд, "
+          "'exit' - выход")
+
+    while True:
+        try:
+            line = input("valutatrade> ").strip()
+        except EOFError:
+            print()
+            break
+        except KeyboardInterrupt:
+            print()
+            continue
+
+        if not line:
+            continue
+        if line in ("exit", "quit"):
+            break
+        if line == "help":
+            parser.print_help()
+            continue
+
+        try:
+            command_args = parser.parse_args(shlex.split(line))
+        except ValueError as e:
+            print(f"Ошибка: {e}")
+            continue
+        except SystemExit:
+            # argparse уже вывел ошибку или справку
+            continue
+
+        if command_args.command is None:
+            parser.print_help()
+            continue
+        if command_args.command == "shell":
+            print("Shell уже запущен")
+            continue
+
+        started = time.perf_counter()
+        run_command(command_args)
+        if args.timing:
+            print(f"({(time.perf_counter() - started) * 1000:.3f} мс)")
+
+    return "Выход из shell"
+
+
+def _warm_up() -> None:
+    """Заранее загрузить сессию, модули сценариев и матрицу курсов"""
+    from valutatrade_hub.core import usecases
+    from valutatrade_hub.core.valuation import valuator
+
+    usecases.get_current_user_info()
+    try:
+        valuator.vector("USD")
+    except ApiRequestError:
+        pass
+
+
+def handle_serve(args) -> str:
+    from valutatrade_hub.api.server import ApiServer
+
+    ApiServer(args.host, args.port, args.workers).run()
+    return "Сервер остановлен"
+
+
 def handle_update_rates(args) -> str:
+    from valutatrade_hub.parser_service.updater import updater
+
     try:
         if args.force:
             result = updater.force_update()
@@ -271,12 +590,18 @@ def handle_update_rates(args) -> str:
             result = updater.run_update(args.source)
 
         if result["success"]:
-            return (
+            message = (
                 f"Обновление завершено успешно!\n"
                 f"Всего курсов: {result['total_rates']}\n"
                 f"Источников обработано: {result['sources_processed']}\n"
-                f"Время: {result['timestamp']}"
+                f"Время обновления: {result['elapsed']:.2f} с\n"
             )
+            if result["orders"]:
+                executed = sum(1 for item in result["orders"]
+                               if item["status"] == "ok")
+                message += (f"Сработало заявок: {len(result['orders'])}, "
+                            f"исполнено: {executed}\n")
+            return message + f"Время: {result['timestamp']}"
         else:
             return (
                 f"Обновление завершено с ошибками\n"
@@ -289,9 +614,15 @@ def handle_update_rates(args) -> str:
 
 
 def handle_show_rates(args) -> str:
+    from valutatrade_hub.core.exceptions import ParserDaemonError
+    from valutatrade_hub.parser_service.daemon import request
     from valutatrade_hub.parser_service.storage import RatesStorage
-    storage = RatesStorage()
-    cache_data = storage.load_current_rates()
+
+    # Курсы из памяти фонового процесса, без него - из rates.json
+    try:
+        cache_data = request("rates")
+    except ParserDaemonError:
+        cache_data = RatesStorage().load_current_rates()
 
     if not cache_data.get("pairs"):
         return (
@@ -358,6 +689,13 @@ def handle_show_rates(args) -> str:
 
 
 def handle_parser_status() -> str:
+    from valutatrade_hub.core.exceptions import ParserDaemonError
+    from valutatrade_hub.parser_service.config import config
+    from valutatrade_hub.parser_service.daemon import request
+    from valutatrade_hub.parser_service.http_cache import HttpCache
+    from valutatrade_hub.parser_service.rate_limiter import TokenBucket
+    from valutatrade_hub.parser_service.updater import updater
+
     status = updater.get_status()
 
     result = []
@@ -388,12 +726,48 @@ def handle_parser_status() -> str:
 
     rates_size = (os.path.getsize('data/rates.json')
                   if os.path.exists('data/rates.json') else 0)
-    history_size = (os.path.getsize('data/exchange_rates.json')
-                    if os.path.exists('data/exchange_rates.json') else 0)
+    history_size = updater.storage.history_store.total_size()
 
     result.append("\nФайлы данных:")
     result.append(f"  rates.json: {rates_size / 1024:.1f} KB")
-    result.append(f"  exchange_rates.json: {history_size / 1024:.1f} KB")
+    result.append(f"  history/: {history_size / 1024:.1f} KB "
+                  f"({len(updater.storage.history_store.pairs())} пар)")
+    cache_entries, cache_size = HttpCache(config.HTTP_CACHE_DIR).stats()
+    result.append(f"  http_cache/: {cache_size / 1024:.1f} KB "
+                  f"(ответов: {cache_entries})")
+
+    result.append("\nИсточники (circuit breaker):")
+    if not status["breakers"]:
+        result.append("  Источники еще не опрашивались")
+    for source, breaker in sorted(status["breakers"].items()):
+        line = f"  {source}: {breaker['state']}"
+        if breaker.get("failures"):
+            line += f", ошибок подряд: {breaker['failures']}"
+        if breaker.get("retry_at"):
+            line += f", пробный запрос после {breaker['retry_at']}"
+        result.append(line)
+        if breaker.get("last_error") and breaker.get("failures"):
+            result.append(f"    последняя ошибка: {breaker['last_error']}")
+
+    result.append("\nПланировщик:")
+    try:
+        daemon = request("status")
+        result.append(f"  Фоновый процесс: PID {daemon['pid']}, работает "
+                      f"{daemon['uptime']:.0f} с, запросов: {daemon['requests']}, "
+                      f"пар в памяти: {daemon['pairs']}")
+        result.append(f"  Следующее обновление: {daemon['scheduler']['next_run']}")
+    except ParserDaemonError:
+        result.append("  Фоновый процесс: не запущен")
+    for job, state in sorted(status["scheduler"].items()):
+        result.append(f"  {job}: последний запуск {state['last_run']} "
+                      f"({state['status']}), следующий {state['next_run']}")
+
+    result.append("\nЛимиты запросов (на все процессы):")
+    for source in sorted(config.RATE_LIMITS):
+        bucket = TokenBucket(source)
+        tokens, burst = bucket.state()
+        result.append(f"  {source}: {bucket.rate:g} запр/с, всплеск {bucket.burst}, "
+                      f"доступно токенов: {max(tokens, 0):.1f} из {burst:g}")
 
     result.append("\nРекомендации:")
     if not status['config']['has_api_key']:
@@ -402,29 +776,141 @@ def handle_parser_status() -> str:
         result.append("  Выполните 'update-rates' для загрузки курсов")
     elif not status['cache_valid']:
         result.append("  Выполните 'update-rates' для обновления кеша")
+    if any(breaker["state"] != "closed" for breaker in status["breakers"].values()):
+        result.append("  Источники с открытым breaker пропускаются до пробного "
+                      "запроса")
 
     return "\n".join(result)
 
 
 def handle_start_scheduler() -> str:
+    from valutatrade_hub.core.exceptions import ParserDaemonError
+    from valutatrade_hub.parser_service.config import config
+    from valutatrade_hub.parser_service.daemon import request, start_daemon
+
     try:
-        scheduler.start()
+        pid = start_daemon()
+        status = request("status")
         return (
-            "Планировщик запущен\n"
-            "Курсы будут автоматически обновляться каждый час\n"
+            f"Планировщик запущен в фоновом процессе (PID {pid})\n"
+            f"Следующее обновление: {status['scheduler']['next_run']}\n"
+            f"Журнал: {config.DAEMON_LOG_FILE}\n"
             "Используйте 'stop-scheduler' для остановки"
         )
-    except Exception as e:
+    except ParserDaemonError as e:
         return f"Ошибка при запуске планировщика: {e}"
 
 
 def handle_stop_scheduler() -> str:
+    from valutatrade_hub.core.exceptions import ParserDaemonError
+    from valutatrade_hub.parser_service.daemon import stop_daemon
+
     try:
-        scheduler.stop()
-        return "Планировщик остановлен"
-    except Exception as e:
+        pid = stop_daemon()
+        return f"Планировщик остановлен (PID {pid})"
+    except ParserDaemonError as e:
         return f"Ошибка при остановке планировщика: {e}"
 
 
+def handle_migrate_storage() -> str:
+    from valutatrade_hub.infra.database import DatabaseManager
+
+    result = DatabaseManager().migrate_to_sqlite()
+    return (
+        f"Миграция завершена: {result['db_path']}\n"
+        f"Пользователей: {result['users']}\n"
+        f"Портфелей: {result['portfolios']}\n"
+        f"Для переключения установите storage_backend = \"sqlite\" "
+        f"в [tool.valutatrade] или VALUTATRADE_STORAGE_BACKEND=sqlite"
+    )
+
+
+def handle_compact_journal() -> str:
+    from valutatrade_hub.infra.database import DatabaseManager
+
+    result = DatabaseManager().compact_journal()
+    if result["records"] == 0:
+        return "Журнал сделок пуст, компакция не требуется"
+    return (
+        f"Журнал свернут в portfolios.json\n"
+        f"Записей: {result['records']}\n"
+        f"Освобождено: {result['bytes'] / 1024:.1f} KB"
+    )
+
+
+def handle_import_history() -> str:
+    from valutatrade_hub.parser_service.storage import RatesStorage
+
+    storage = RatesStorage()
+    imported = storage.import_legacy_history()
+    return (
+        f"Импортировано записей из {storage.history_file}: {imported}\n"
+        f"Хранилище истории: {storage.history_store.root}"
+    )
+
+
+def handle_compact_history() -> str:
+    from valutatrade_hub.parser_service.storage import RatesStorage
+
+    report = RatesStorage().compact_history()
+    return (
+        "Компакция истории курсов завершена\n"
+        f"  Удалено сегментов сырых точек: {report['segments']}\n"
+        f"  Удалено интервалов OHLC: {report['buckets']}\n"
+        f"  Освобождено: {report['bytes'] / 1024:.1f} KB "
+        f"({report['size_before'] / 1024:.1f} KB -> "
+        f"{report['size_after'] / 1024:.1f} KB)"
+    )
+
+
+def handle_rate_history(args) -> str:
+    from valutatrade_hub.parser_service.storage import RatesStorage
+
+    storage = RatesStorage()
+    pair = f"{args.cur_from.upper()}_{args.cur_to.upper()}"
+
+    if args.as_of:
+        point = storage.as_of(pair, args.as_of)
+        if point is None:
+            return f"Нет данных по {pair} на {args.as_of}"
+        return (f"{pair} на {args.as_of}: {point['rate']:.8f} "
+                f"(от {point['timestamp']}, источник: {point['source']})")
+
+    if args.interval:
+        return _print_ohlc(storage, pair, args)
+
+    # Точки печатаются по мере чтения, без загрузки всего периода в память
+    count = 0
+    for point in storage.history(pair, args.start, args.end, args.limit):
+        if count == 0:
+            print(f"История {pair}")
+            print("=" * 50)
+        print(f"{point['timestamp']:32} {point['rate']:>15.8f}  {point['source']}")
+        count += 1
+
+    if count == 0:
+        return f"Нет данных по {pair} за указанный период"
+    return f"\nВсего точек: {count}"
+
+
+def _print_ohlc(storage, pair: str, args) -> str:
+    count = 0
+    buckets = storage.ohlc(pair, args.interval, args.start, args.end, args.limit)
+    for bucket in buckets:
+        if count == 0:
+            print(f"OHLC {pair} ({args.interval})")
+            print("=" * 90)
+            print(f"{'Начало':28} {'Open':>14} {'High':>14} {'Low':>14} "
+                  f"{'Close':>14} {'N':>4}")
+        print(f"{bucket['timestamp']:28} {bucket['open']:>14.6f} "
+              f"{bucket['high']:>14.6f} {bucket['low']:>14.6f} "
+              f"{bucket['close']:>14.6f} {bucket['count']:>4}")
+        count += 1
+
+    if count == 0:
+        return f"Нет данных по {pair} за указанный период"
+    return f"\nВсего интервалов: {count}"
+
+
 if __name__ == "__main__":
     main()
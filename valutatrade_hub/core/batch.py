@@ -0,0 +1,204 @@
+"""
+Пакетное исполнение заявок buy/sell из CSV или JSONL
+Все заявки исполняются над одним состоянием портфелей в памяти и одним
+снимком курсов, а изменения записываются одной операцией в конце
+"""
+
+import csv
+import json
+import math
+import sys
+import time
+from pathlib import Path
+from typing import IO, Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from .exceptions import (
+    ApiRequestError, CurrencyNotFoundError, InsufficientFundsError,
+    UserNotFoundError
+)
+from .rate_engine import CrossRate, RateEngine
+from .trading import apply_buy, apply_sell, ledger_entry
+from .utils import (
+    load_portfolios_for, load_user, load_user_by_id, portfolios_write_lock,
+    record_trades, save_wallet_balances_many, validate_amount,
+    validate_trade_currency
+)
+
+ORDER_FORMATS = ("csv", "jsonl")
+
+# Ошибки, которые отклоняют только свою заявку
+ORDER_ERRORS = (InsufficientFundsError, CurrencyNotFoundError, UserNotFoundError,
+                ApiRequestError, ValueError, TypeError)
+
+
+def read_orders(path: str, fmt: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Прочитать заявки из файла ('-' - стандартный ввод)
+    Формат определяется по расширению: .csv - CSV с заголовком
+    user,side,currency,amount (или user_id вместо user), иначе JSONL
+    """
+    if fmt is None:
+        fmt = "csv" if Path(path).suffix.lower() == ".csv" else "jsonl"
+    if fmt not in ORDER_FORMATS:
+        raise ValueError(f"Неизвестный формат заявок: {fmt}. "
+                         f"Доступны: {', '.join(ORDER_FORMATS)}")
+
+    if path == "-":
+        yield from _parse_orders(sys.stdin, fmt)
+        return
+
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        yield from _parse_orders(f, fmt)
+
+
+def _parse_orders(stream: IO, fmt: str) -> Iterator[Dict[str, Any]]:
+    if fmt == "csv":
+        for line, row in enumerate(csv.DictReader(stream), 2):
+            yield {"line": line, **row}
+        return
+
+    for line, text in enumerate(stream, 1):
+        if not text.strip():
+            continue
+        try:
+            order = json.loads(text)
+        except ValueError as e:
+            order = {"error": f"некорректный JSON: {e}"}
+        if not isinstance(order, dict):
+            order = {"error": "заявка должна быть JSON-объектом"}
+        yield {"line": line, **order}
+
+
+def execute_orders(orders: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Исполнить заявки по порядку и записать изменения одной операцией
+    Ошибочная заявка не меняет состояние и не мешает остальным.
+    Пакет выполняется под блокировкой портфелей, которую берет любая запись
+    портфелей в обоих бэкендах (в SQLite - вокруг транзакции), поэтому
+    версии загруженных портфелей не могут устареть до записи пакета
+    """
+    started = time.perf_counter()
+    orders = list(orders)
+    matrix = RateEngine().matrix()
+    results: List[Dict[str, Any]] = []
+
+    with portfolios_write_lock():
+        user_ids = _resolve_users(orders)
+        state = load_portfolios_for(sorted(set(user_ids.values())))
+        loaded_versions = {user_id: portfolio.get("version", 0)
+                           for user_id, portfolio in state.items()}
+        changed: Dict[int, Dict[str, float]] = {}
+        entries: List[Dict[str, Any]] = []
+
+        for order in orders:
+            result = {
+                "line": order.get("line"),
+                "user": order.get("user", order.get("user_id")),
+                "side": order.get("side"),
+                "currency": order.get("currency"),
+                "amount": order.get("amount"),
+            }
+            try:
+                user_id, side, code, amt = _validate_order(order, user_ids)
+                rate = _snapshot_usd_rate(matrix, code)
+                apply = apply_buy if side == "buy" else apply_sell
+
+                balances, details = apply(state.get(user_id), code, amt, rate)
+
+                portfolio = state.setdefault(
+                    user_id, {"user_id": user_id, "wallets": {}, "version": 0}
+                )
+                for wallet_code, balance in balances.items():
+                    portfolio["wallets"][wallet_code] = {"balance": balance}
+                changed.setdefault(user_id, {}).update(balances)
+                entries.append(ledger_entry(user_id, side, code, amt, rate,
+                                            balances, details))
+
+                result.update(
+                    status="ok", rate=rate,
+                    usd=details.get("cost_usd", details.get("revenue_usd"))
+                )
+            except ORDER_ERRORS as e:
+                result.update(status="error", error=str(e))
+            results.append(result)
+
+        versions = save_wallet_balances_many([
+            (user_id, balances, loaded_versions.get(user_id, 0))
+            for user_id, balances in changed.items()
+        ])
+        record_trades(entries)
+
+    elapsed = time.perf_counter() - started
+    executed = sum(1 for result in results if result["status"] == "ok")
+    return {
+        "results": results,
+        "orders": len(results),
+        "executed": executed,
+        "failed": len(results) - executed,
+        "portfolios": len(versions),
+        "elapsed": elapsed,
+    }
+
+
+def _resolve_users(orders: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Сопоставить пользователей заявок с user_id, каждого - один раз"""
+    user_ids: Dict[str, int] = {}
+    for order in orders:
+        key = _user_key(order)
+        if key is None or key in user_ids:
+            continue
+        if key.startswith("#"):
+            try:
+                user_data = load_user_by_id(int(key[1:]))
+            except ValueError:
+                continue
+        else:
+            user_data = load_user(key)
+        if user_data:
+            user_ids[key] = user_data["user_id"]
+    return user_ids
+
+
+def _user_key(order: Dict[str, Any]) -> Optional[str]:
+    if order.get("user_id") not in (None, ""):
+        return f"#{order['user_id']}"
+    if order.get("user"):
+        return str(order["user"])
+    return None
+
+
+def _validate_order(order: Dict[str, Any],
+                    user_ids: Dict[str, int]) -> Tuple[int, str, str, float]:
+    if "error" in order:
+        raise ValueError(order["error"])
+
+    key = _user_key(order)
+    if key is None:
+        raise ValueError("Не указан пользователь (user или user_id)")
+    if key not in user_ids:
+        if key.startswith("#"):
+            raise UserNotFoundError(user_id=key[1:])
+        raise UserNotFoundError(username=key)
+
+    side = str(order.get("side") or "").strip().lower()
+    if side not in ("buy", "sell"):
+        raise ValueError(f"Неизвестный тип заявки '{order.get('side')}'. "
+                         f"Используйте buy или sell")
+
+    code = validate_trade_currency(str(order.get("currency") or ""))
+
+    try:
+        amount = float(order.get("amount"))
+    except (TypeError, ValueError):
+        amount = math.nan
+    if not math.isfinite(amount):
+        raise ValueError(f"Некорректное количество '{order.get('amount')}'")
+
+    return user_ids[key], side, code, validate_amount(amount)
+
+
+def _snapshot_usd_rate(matrix: Dict[Tuple[str, str], CrossRate], code: str) -> float:
+    """Курс к USD из снимка матрицы, взятого в начале пакета"""
+    cross = matrix.get((code, "USD"))
+    if cross is None:
+        raise ApiRequestError(f"Не удалось получить курс для {code}→USD")
+    return cross.rate
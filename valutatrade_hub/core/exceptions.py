@@ -40,3 +40,18 @@ class UserNotFoundError(Exception):
             message = "Пользователь не найден"
 
         super().__init__(message)
+
+
+class ConcurrentUpdateError(Exception):
+    def __init__(self, document: str):
+        self.document = document
+        message = (f"Документ '{document}' был изменен другим процессом, "
+                   f"повторите операцию")
+        super().__init__(message)
+
+
+class ParserDaemonError(Exception):
+    def __init__(self, reason: str):
+        self.reason = reason
+        message = f"Фоновый процесс Parser Service: {reason}"
+        super().__init__(message)
@@ -141,31 +141,7 @@ class Portfolio:
         return self._wallets[currency_code]
 
     def get_total_value(self, base_currency: str = 'USD') -> float:
+        from .valuation import valuator
 
-        exchange_rates = {
-            "USD": 1.0,
-            "EUR": 1.0786,
-            "BTC": 59337.21,
-            "RUB": 0.01016,
-            "ETH": 3720.00
-        }
-        total = 0.0
-        for currency_code, wallet in self._wallets.items():
-            balance = wallet.balance
-            if currency_code == base_currency:
-                total += balance
-            else:
-                rate_to_usd = exchange_rates.get(currency_code, 0)
-                if rate_to_usd == 0:
-                    continue
-                value_in_usd = balance * rate_to_usd
-                if base_currency != "USD":
-                    rate_from_usd = exchange_rates.get(base_currency, 1.0)
-                    if rate_from_usd != 0:
-                        value_in_base = value_in_usd / rate_from_usd
-                    else:
-                        value_in_base = 0
-                else:
-                    value_in_base = value_in_usd
-                total += value_in_base
-        return total
+        balances = {code: wallet.balance for code, wallet in self._wallets.items()}
+        return valuator.value(balances, base_currency).total
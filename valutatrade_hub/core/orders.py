@@ -0,0 +1,235 @@
+"""
+Книга отложенных заявок (limit/stop), срабатывающих при обновлении курсов
+Для каждой пары хранятся две кучи: заявки "курс опустился до цены" (max-куча
+по цене) и "курс поднялся до цены" (min-куча), поэтому проверка после
+обновления курсов смотрит только вершины куч и снимает лишь пересеченные
+заявки. Книга хранится в orders.json
+"""
+
+import heapq
+import threading
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from .exceptions import (
+    ApiRequestError, ConcurrentUpdateError, CurrencyNotFoundError,
+    InsufficientFundsError
+)
+from .rate_engine import RateEngine
+from .trading import commit_trade
+from ..infra.database import DatabaseManager
+
+ORDER_SIDES = ("buy", "sell")
+ORDER_KINDS = ("limit", "stop")
+
+# Ошибки исполнения, после которых заявка снимается как отклоненная
+TRIGGER_ERRORS = (InsufficientFundsError, CurrencyNotFoundError,
+                  ConcurrentUpdateError, ValueError)
+
+
+@dataclass(frozen=True)
+class Order:
+    """Отложенная заявка на покупку или продажу валюты за USD"""
+
+    order_id: int
+    user_id: int
+    side: str
+    kind: str
+    currency: str
+    amount: float
+    price: float
+    created_at: str
+
+    @property
+    def pair(self) -> str:
+        return f"{self.currency}_USD"
+
+    @property
+    def triggers_below(self) -> bool:
+        """
+        Срабатывает ли заявка, когда курс опускается до цены
+        limit buy и stop sell - при курсе <= цены, limit sell и stop buy -
+        при курсе >= цены
+        """
+        return (self.side == "buy") == (self.kind == "limit")
+
+
+class OrderBook:
+    """Singleton с кучами заявок по парам, перестраиваемыми при смене файла"""
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if not self._initialized:
+            self._initialized = True
+            self._lock = threading.RLock()
+            self._signature: Optional[Tuple] = None
+            self._next_id = 1
+            self._orders: Dict[int, Order] = {}
+            # Пара -> куча (-цена, id) и куча (цена, id); снятые заявки
+            # удаляются из куч лениво, при выходе на вершину
+            self._below: Dict[str, List[Tuple[float, int]]] = {}
+            self._above: Dict[str, List[Tuple[float, int]]] = {}
+
+    def place(self, user_id: int, side: str, kind: str, currency: str,
+              amount: float, price: float) -> Order:
+        """Добавить заявку в книгу"""
+        with self._lock, DatabaseManager().orders_lock():
+            self._refresh()
+            order = Order(
+                order_id=self._next_id,
+                user_id=user_id,
+                side=side,
+                kind=kind,
+                currency=currency,
+                amount=amount,
+                price=price,
+                created_at=datetime.now(timezone.utc).isoformat(),
+            )
+            self._next_id += 1
+            self._orders[order.order_id] = order
+            self._push(order)
+            self._save()
+            return order
+
+    def cancel(self, user_id: int, order_id: int) -> Order:
+        """Снять заявку пользователя"""
+        with self._lock, DatabaseManager().orders_lock():
+            self._refresh()
+            order = self._orders.get(order_id)
+            if order is None or order.user_id != user_id:
+                raise ValueError(f"Заявка #{order_id} не найдена")
+            del self._orders[order_id]
+            self._save()
+            return order
+
+    def orders_for(self, user_id: int) -> List[Order]:
+        """Открытые заявки пользователя"""
+        with self._lock:
+            self._refresh()
+            return [order for order in self._orders.values()
+                    if order.user_id == user_id]
+
+    def pairs(self) -> List[str]:
+        """Пары, по которым есть заявки в кучах (без обхода самих заявок)"""
+        with self._lock:
+            self._refresh()
+            return sorted({pair for heaps in (self._below, self._above)
+                           for pair, heap in heaps.items() if heap})
+
+    def trigger(self, rates: Dict[str, float]) -> List[Dict[str, Any]]:
+        """
+        Исполнить заявки, пересеченные курсами {пара: курс к USD}
+        Заявки исполняются через commit_trade, как команды buy/sell. Заявка
+        снимается из книги и при успехе, и при ошибке исполнения
+        """
+        results: List[Dict[str, Any]] = []
+        with self._lock, DatabaseManager().orders_lock():
+            self._refresh()
+            crossed = [order for pair, rate in rates.items()
+                       for order in self._pop_crossed(pair, rate)]
+            if not crossed:
+                return results
+
+            crossed.sort(key=lambda order: order.order_id)
+            for order in crossed:
+                del self._orders[order.order_id]
+            self._save()
+
+        for order in crossed:
+            rate = rates[order.pair]
+            result: Dict[str, Any] = {"order": order, "rate": rate}
+            try:
+                result["details"] = commit_trade(order.user_id, order.side,
+                                                 order.currency, order.amount, rate)
+                result["status"] = "ok"
+            except TRIGGER_ERRORS as e:
+                result.update(status="error", error=str(e))
+            results.append(result)
+        return results
+
+    def _pop_crossed(self, pair: str, rate: float) -> List[Order]:
+        crossed = []
+        below = self._below.get(pair, [])
+        while below and -below[0][0] >= rate:
+            order = self._orders.get(heapq.heappop(below)[1])
+            if order is not None:
+                crossed.append(order)
+
+        above = self._above.get(pair, [])
+        while above and above[0][0] <= rate:
+            order = self._orders.get(heapq.heappop(above)[1])
+            if order is not None:
+                crossed.append(order)
+        return crossed
+
+    def _push(self, order: Order) -> None:
+        if order.triggers_below:
+            heapq.heappush(self._below.setdefault(order.pair, []),
+                           (-order.price, order.order_id))
+        else:
+            heapq.heappush(self._above.setdefault(order.pair, []),
+                           (order.price, order.order_id))
+
+    def _refresh(self) -> None:
+        """Перестроить кучи, если orders.json изменил другой процесс"""
+        db = DatabaseManager()
+        signature = db.orders_signature()
+        if signature == self._signature:
+            return
+
+        data = db.get_orders()
+        self._next_id = data.get("next_id", 1)
+        self._orders = {}
+        self._below, self._above = {}, {}
+        for item in data.get("orders", []):
+            order = Order(**item)
+            self._orders[order.order_id] = order
+            heap = self._below if order.triggers_below else self._above
+            key = -order.price if order.triggers_below else order.price
+            heap.setdefault(order.pair, []).append((key, order.order_id))
+        for heap in (*self._below.values(), *self._above.values()):
+            heapq.heapify(heap)
+        self._signature = signature
+
+    def _save(self) -> None:
+        db = DatabaseManager()
+        db.save_orders({
+            "next_id": self._next_id,
+            "orders": [asdict(order) for order in self._orders.values()],
+        })
+        self._signature = db.orders_signature()
+
+
+def trigger_orders(refreshed: Optional[Iterable[str]] = None
+                   ) -> List[Dict[str, Any]]:
+    """
+    Проверить книгу заявок по актуальной матрице кросс-курсов
+    refreshed - пары, только что полученные обновлением курсов: проверяются
+    лишь заявки по валютам из них. Курс по запасным значениям
+    (CrossRate.estimated) заявку не исполняет - нужна реальная котировка
+    """
+    book = OrderBook()
+    engine = RateEngine()
+    currencies = None
+    if refreshed is not None:
+        currencies = {code for pair in refreshed for code in pair.split("_")}
+
+    rates = {}
+    for pair in book.pairs():
+        code = pair.split("_")[0]
+        if currencies is not None and code not in currencies:
+            continue
+        try:
+            cross = engine.get(code, "USD")
+        except ApiRequestError:
+            continue
+        if not cross.estimated:
+            rates[pair] = cross.rate
+    return book.trigger(rates)
@@ -0,0 +1,216 @@
+"""
+Движок кросс-курсов
+Строит граф валют по парам из rates.json и при каждом изменении файла один
+раз пересчитывает полную матрицу кросс-курсов с путем и временем обновления,
+после чего поиск курса - обращение к словарю
+"""
+
+import threading
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from .exceptions import ApiRequestError
+from ..infra.database import DatabaseManager
+from ..infra.settings import SettingsLoader
+
+# Запасные курсы к USD, если валюта недостижима по актуальным парам
+DEFAULT_USD_RATES: Dict[str, float] = {
+    "EUR": 1.0786,
+    "BTC": 59337.21,
+    "RUB": 0.01016,
+    "ETH": 3720.00,
+    "GBP": 1.2589,
+    "JPY": 0.0064,
+}
+
+# Ребро графа: (курс, время обновления, источник)
+Edge = Tuple[float, Optional[str], str]
+
+
+@dataclass(frozen=True)
+class CrossRate:
+    """Курс пары с путем в графе и временем обновления самой старой пары"""
+
+    rate: float
+    path: Tuple[str, ...]
+    updated_at: Optional[str]
+    estimated: bool = False
+
+    @property
+    def is_direct(self) -> bool:
+        return len(self.path) == 2
+
+    @property
+    def path_display(self) -> str:
+        return "→".join(self.path)
+
+    def age_seconds(self) -> Optional[float]:
+        """Возраст курса в секундах (по самой старой паре пути)"""
+        if not self.updated_at:
+            return None
+        try:
+            updated = datetime.fromisoformat(
+                self.updated_at.replace("+00:00Z", "+00:00").replace("Z", "+00:00")
+            )
+        except ValueError:
+            return None
+        if updated.tzinfo is None:
+            updated = updated.replace(tzinfo=timezone.utc)
+        return (datetime.now(timezone.utc) - updated).total_seconds()
+
+    def is_stale(self, ttl_seconds: Optional[int] = None) -> bool:
+        """Курс запасной или старше TTL из настроек"""
+        if self.estimated:
+            return True
+        if ttl_seconds is None:
+            ttl_seconds = SettingsLoader().get("rates_ttl_seconds", 3600)
+        age = self.age_seconds()
+        return age is None or age > ttl_seconds
+
+
+class RateEngine:
+    """Singleton с матрицей кросс-курсов, пересчитываемой при смене rates.json"""
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance._initialized = False
+        return cls._instance
+
+    def __init__(self):
+        if not self._initialized:
+            self._initialized = True
+            self._lock = threading.Lock()
+            self._signature: Optional[Tuple] = None
+            self._matrix: Dict[Tuple[str, str], CrossRate] = {}
+            self._rebuilds = 0
+
+    def get(self, from_code: str, to_code: str) -> CrossRate:
+        """Курс from_code→to_code. ApiRequestError, если пути нет"""
+        if from_code == to_code:
+            return CrossRate(1.0, (from_code, to_code), None)
+
+        rate = self.matrix().get((from_code, to_code))
+        if rate is None:
+            raise ApiRequestError(f"Курс {from_code}→{to_code} недоступен")
+        return rate
+
+    def usd_rate(self, code: str) -> float:
+        """Курс валюты к USD"""
+        if code == "USD":
+            return 1.0
+        try:
+            return self.get(code, "USD").rate
+        except ApiRequestError:
+            raise ApiRequestError(f"Не удалось получить курс для {code}→USD")
+
+    def convert(self, amount: float, from_code: str, to_code: str) -> float:
+        """Перевести сумму из одной валюты в другую"""
+        return amount * self.get(from_code, to_code).rate
+
+    def matrix(self) -> Dict[Tuple[str, str], CrossRate]:
+        """Актуальная матрица кросс-курсов (пересчитывается при смене файла)"""
+        db = DatabaseManager()
+        signature = db.rates_signature()
+        if signature != self._signature:
+            with self._lock:
+                if signature != self._signature:
+                    self._matrix = build_matrix(db.get_rates().get("pairs", {}))
+                    self._signature = signature
+                    self._rebuilds += 1
+        return self._matrix
+
+    def stats(self) -> Dict[str, int]:
+        return {"pairs": len(self._matrix), "rebuilds": self._rebuilds}
+
+
+def build_matrix(pairs: Dict[str, Dict]) -> Dict[Tuple[str, str], CrossRate]:
+    """
+    Полная матрица кросс-курсов по парам кеша
+    Для каждой валюты выполняется обход в ширину, поэтому курс берется по
+    кратчайшему пути, а среди равных - по более свежим парам. Запасные курсы
+    используются только для пар, недостижимых по актуальным данным
+    """
+    graph = _build_graph(pairs)
+    matrix = _all_paths(graph, estimated=False)
+
+    for code, rate in DEFAULT_USD_RATES.items():
+        edges = graph.setdefault(code, {})
+        if "USD" not in edges:
+            edges["USD"] = (rate, None, "default")
+            graph.setdefault("USD", {}).setdefault(code, (1.0 / rate, None, "default"))
+
+    for key, cross in _all_paths(graph, estimated=True).items():
+        matrix.setdefault(key, cross)
+
+    return matrix
+
+
+def _build_graph(pairs: Dict[str, Dict]) -> Dict[str, Dict[str, Edge]]:
+    edges = []
+    for pair_key, pair_data in pairs.items():
+        parts = pair_key.split("_")
+        rate = pair_data.get("rate") if isinstance(pair_data, dict) else None
+        if len(parts) != 2 or not rate or rate <= 0:
+            continue
+        edges.append((parts[0], parts[1], float(rate),
+                      pair_data.get("updated_at"), pair_data.get("source", "")))
+
+    # Сначала обратные ребра, затем явные пары, чтобы явные были важнее
+    graph: Dict[str, Dict[str, Edge]] = {}
+    for from_code, to_code, rate, updated_at, source in edges:
+        graph.setdefault(from_code, {})
+        graph.setdefault(to_code, {})[from_code] = (1.0 / rate, updated_at, source)
+    for from_code, to_code, rate, updated_at, source in edges:
+        graph[from_code][to_code] = (rate, updated_at, source)
+    return graph
+
+
+def _all_paths(graph: Dict[str, Dict[str, Edge]],
+               estimated: bool) -> Dict[Tuple[str, str], CrossRate]:
+    # Соседей обходим от более свежих пар к более старым
+    neighbours = {
+        code: sorted(edges.items(), key=lambda item: item[1][1] or "",
+                     reverse=True)
+        for code, edges in graph.items()
+    }
+
+    matrix: Dict[Tuple[str, str], CrossRate] = {}
+    for origin in graph:
+        # rate, путь, самое старое время, признак запасного курса
+        reached: Dict[str, Tuple[float, List[str], Optional[str], bool]] = {
+            origin: (1.0, [origin], None, False)
+        }
+        queue = deque([origin])
+        while queue:
+            code = queue.popleft()
+            rate, path, oldest, uses_default = reached[code]
+            for target, (edge_rate, updated_at, source) in neighbours[code]:
+                if target in reached:
+                    continue
+                reached[target] = (
+                    rate * edge_rate,
+                    path + [target],
+                    _older(oldest, updated_at),
+                    uses_default or source == "default",
+                )
+                queue.append(target)
+
+        for target, (rate, path, oldest, uses_default) in reached.items():
+            if target != origin:
+                matrix[(origin, target)] = CrossRate(
+                    rate, tuple(path), oldest, estimated and uses_default
+                )
+
+    return matrix
+
+
+def _older(first: Optional[str], second: Optional[str]) -> Optional[str]:
+    if first is None:
+        return second
+    if second is None:
+        return first
+    return min(first, second)
@@ -0,0 +1,497 @@
+"""
+Сервис сценариев использования с явной сессией пользователя
+Каждый TradingService работает со своей сессией, поэтому один процесс может
+обслуживать многих пользователей из разных потоков. Сделки одного
+пользователя сериализуются блокировкой этого пользователя, сделки разных
+пользователей выполняются параллельно
+"""
+
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, Optional
+from .models import User
+from .utils import (
+    load_user, load_user_by_id,
+    add_user, allocate_user_id,
+    load_portfolio, save_wallet_balances, iter_portfolios, load_trade_history,
+    conflict_backoff,
+    validate_currency_code, validate_trade_currency, validate_amount,
+    load_session,
+    save_session, clear_session,
+    get_currency_display_info
+)
+from .exceptions import (
+    CurrencyNotFoundError, UserNotFoundError, ConcurrentUpdateError
+)
+from .currencies import get_currency
+from ..decorators import log_action
+from ..infra.settings import SettingsLoader
+
+
+@dataclass
+class Session:
+    """
+    Сессия пользователя
+    persistent - сессия CLI, которая сохраняется в session.json между запусками
+    """
+
+    user: Optional[User] = None
+    persistent: bool = False
+
+    @classmethod
+    def restore(cls) -> "Session":
+        """Восстановить сессию CLI из session.json"""
+        session = cls(persistent=True)
+        data = load_session()
+        if data and "user_id" in data:
+            user_data = load_user_by_id(data["user_id"])
+            if user_data:
+                session.user = _user_from_data(user_data)
+        return session
+
+
+class TradingService:
+    """Сценарии использования для одной сессии"""
+
+    _user_locks: Dict[int, threading.Lock] = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(self, session: Optional[Session] = None):
+        self.session = session or Session()
+
+    @property
+    def username(self) -> Optional[str]:
+        """Имя пользователя сессии (используется в логах @log_action)"""
+        return self.session.user.username if self.session.user else None
+
+    @classmethod
+    def user_lock(cls, user_id: int) -> threading.Lock:
+        """Общая для процесса блокировка сделок пользователя"""
+        with cls._registry_lock:
+            lock = cls._user_locks.get(user_id)
+            if lock is None:
+                lock = threading.Lock()
+                cls._user_locks[user_id] = lock
+            return lock
+
+    def _require_user(self, message: str = "Сначала выполните login") -> User:
+        if self.session.user is None:
+            raise ValueError(message)
+        return self.session.user
+
+    @log_action
+    def register(self, username: str, password: str) -> str:
+        if not username or not username.strip():
+            raise ValueError("Имя не может быть пустым")
+
+        settings = SettingsLoader()
+        min_password_length = settings.get("min_password_length", 4)
+
+        if len(password) < min_password_length:
+            raise ValueError(
+                f"Пароль должен быть минимум {min_password_length} символа"
+            )
+
+        max_retries = settings.get("write_conflict_retries", 10)
+        for attempt in range(max_retries):
+            if load_user(username):
+                raise ValueError(f'Имя {username} занято')
+
+            user_id = allocate_user_id()
+            user = User(user_id, username, password=password)
+
+            try:
+                add_user({
+                    "user_id": user.user_id,
+                    "username": user.username,
+                    "hashed_password": user.hashed_password,
+                    "salt": user.salt,
+                    "registration_date": user.registration_date.isoformat()
+                })
+                break
+            except ConcurrentUpdateError:
+                conflict_backoff(attempt)
+        else:
+            raise ConcurrentUpdateError("users.json")
+
+        initial_balance = settings.get("initial_usd_balance", 1000.0)
+        save_wallet_balances(user_id, {"USD": initial_balance})
+
+        return (f"Пользователь '{username}' зарегистрирован (id={user_id}). "
+                f"Начальный баланс: {initial_balance:.2f} USD")
+
+    @log_action
+    def login(self, username: str, password: str) -> str:
+        user_data = load_user(username)
+        if not user_data:
+            raise UserNotFoundError(username=username)
+
+        user = _user_from_data(user_data)
+        if not user.verify_password(password):
+            raise ValueError("Неверный пароль")
+
+        self.session.user = user
+        if self.session.persistent:
+            save_session(user.user_id, user.username)
+
+        return f"Вы вошли как '{username}'"
+
+    def logout(self) -> str:
+        if self.session.user is None:
+            return "Вы не вошли в систему"
+
+        username = self.session.user.username
+        self.session.user = None
+        if self.session.persistent:
+            clear_session()
+        return f"Вы вышли из системы. До свидания, {username}!"
+
+    def whoami(self) -> str:
+        user = self.session.user
+        if user:
+            return f"Текущий пользователь: {user.username} (id={user.user_id})"
+        return "Вы не вошли в систему"
+
+    @log_action
+    def buy(self, currency: str, amount: float) -> str:
+        trade = self._trade("buy", currency, amount)
+        code = trade["currency"]
+        return (
+            f"Покупка выполнена: {trade['amount']:.4f} {code} ({trade['name']}) "
+            f"по курсу {trade['rate']:.4f} USD/{code}\n"
+            f"Изменения в портфеле:\n"
+            f"- USD: было {trade['old_usd_balance']:.2f} → "
+            f"стало {trade['new_usd_balance']:.2f}\n"
+            f"- {code}: было {trade['old_balance']:.4f} → "
+            f"стало {trade['new_balance']:.4f}\n"
+            f"Стоимость покупки: {trade['cost_usd']:,.2f} USD"
+        )
+
+    @log_action
+    def sell(self, currency: str, amount: float) -> str:
+        trade = self._trade("sell", currency, amount)
+        code = trade["currency"]
+        return (
+            f"Продажа выполнена: {trade['amount']:.4f} {code} ({trade['name']}) "
+            f"по курсу {trade['rate']:.4f} USD/{code}\n"
+            f"Изменения в портфеле:\n"
+            f"- {code}: было {trade['old_balance']:.4f} → "
+            f"стало {trade['new_balance']:.4f}\n"
+            f"- USD: было {trade['old_usd_balance']:.2f} → "
+            f"стало {trade['new_usd_balance']:.2f}\n"
+            f"Выручка от продажи: {trade['revenue_usd']:,.2f} USD"
+        )
+
+    @log_action
+    def trade(self, side: str, currency: str, amount: float) -> Dict:
+        """Сделка buy/sell с результатом в виде словаря (для HTTP API)"""
+        if side not in ("buy", "sell"):
+            raise ValueError(f"Неизвестный тип сделки '{side}'. "
+                             f"Используйте buy или sell")
+        return self._trade(side, currency, amount)
+
+    def _trade(self, side: str, currency: str, amount: float) -> Dict:
+        from .rate_engine import RateEngine
+        from .trading import commit_trade
+
+        user = self._require_user()
+
+        code = validate_trade_currency(currency)
+        amt = validate_amount(amount)
+
+        currency_obj = get_currency(code)
+        rate = RateEngine().usd_rate(code)
+
+        with self.user_lock(user.user_id):
+            details = commit_trade(user.user_id, side, code, amt, rate)
+
+        return {"side": side, "currency": code, "name": currency_obj.name,
+                "amount": amt, "rate": rate, **details}
+
+    @log_action
+    def get_rate(self, cur_from: str, cur_to: str) -> str:
+        from .rate_engine import RateEngine
+
+        from_curr = validate_currency_code(cur_from)
+        to_curr = validate_currency_code(cur_to)
+
+        if from_curr == to_curr:
+            return f"Курс {from_curr} -> {to_curr}: 1.0"
+
+        from_currency = get_currency(from_curr)
+        to_currency = get_currency(to_curr)
+
+        cross = RateEngine().get(from_curr, to_curr)
+        rate = cross.rate
+        reverse_rate = 1.0 / rate if rate != 0 else 0
+
+        result = (
+            f"Курс {from_curr}→{to_curr}: {rate:.6f}"
+            f"{' (расчетный)' if cross.estimated else ''}\n"
+            f"{from_currency.get_display_info()}\n"
+            f"{to_currency.get_display_info()}\n"
+            f"Обратный курс {to_curr}→{from_curr}: {reverse_rate:.6f}"
+        )
+
+        if not cross.is_direct:
+            result += f"\nКросс-курс через: {cross.path_display}"
+        if cross.updated_at:
+            result += f"\n(обновлено: {cross.updated_at})"
+        if not cross.estimated and cross.is_stale():
+            result += "\nКурс устарел, выполните 'update-rates'"
+
+        return result
+
+    def show_portfolio(self, base: str = "USD") -> str:
+        from .valuation import valuator
+
+        user = self.session.user
+        if user is None:
+            return "Сначала введите логин"
+
+        try:
+            base = validate_currency_code(base)
+        except CurrencyNotFoundError:
+            return f"Неизвестная базовая валюта: {base}"
+
+        portfolio_data = load_portfolio(user.user_id)
+
+        if portfolio_data is None:
+            return "Портфель не найден"
+
+        if not portfolio_data.get("wallets"):
+            return "Портфель пуст"
+
+        valuation = valuator.value_wallets(portfolio_data["wallets"], base)
+
+        result = f"Портфель пользователя '{user.username}' (база: {base}):\n"
+
+        for code, balance, value_in_base in valuation.items():
+            try:
+                currency_info = get_currency_display_info(code)
+            except CurrencyNotFoundError:
+                currency_info = f"[UNKNOWN] {code}"
+
+            result += f"- {currency_info}\n"
+            result += f"  Баланс: {balance:.4f} {code} → "
+            result += f"{value_in_base:.2f} {base}\n"
+
+        result += "---------------------------------\n"
+        result += f"ИТОГО: {valuation.total:.2f} {base}"
+
+        return result
+
+    def portfolio(self, base: str = "USD") -> Dict:
+        """Кошельки и стоимость портфеля в базовой валюте (для HTTP API)"""
+        from .valuation import valuator
+
+        user = self._require_user()
+        base = validate_currency_code(base)
+
+        portfolio_data = load_portfolio(user.user_id)
+        if portfolio_data is None:
+            raise ValueError("Портфель не найден")
+
+        valuation = valuator.value_wallets(portfolio_data.get("wallets", {}), base)
+        return {
+            "user": user.username,
+            "base": base,
+            "wallets": {code: {"balance": balance, "value": value}
+                        for code, balance, value in valuation.items()},
+            "total": valuation.total,
+            "unpriced": list(valuation.unpriced),
+        }
+
+    @log_action
+    def aum_report(self, base: str = "USD", top: int = 10, workers: int = 0,
+                   chunk_size: int = 10000) -> str:
+        from .valuation import aum_report as compute_aum_report
+
+        base = validate_currency_code(base)
+        if top <= 0:
+            raise ValueError("Размер топа должен быть положительным")
+        if chunk_size <= 0:
+            raise ValueError("Размер пачки должен быть положительным")
+
+        report = compute_aum_report(iter_portfolios(chunk_size), base, top, workers)
+
+        result = f"Активы под управлением (база: {base})\n"
+        result += f"Портфелей: {report['portfolios']:,}\n"
+        result += f"ИТОГО: {report['aum']:,.2f} {base}\n"
+
+        if report["holdings"]:
+            result += "---------------------------------\n"
+            result += "По валютам:\n"
+            for code, balance in sorted(report["holdings"].items()):
+                value = report["holdings_value"].get(code)
+                value_str = (f"{value:,.2f} {base}" if value is not None
+                             else "нет курса")
+                result += f"- {code}: {balance:,.4f} → {value_str}\n"
+
+        if report["top"]:
+            result += "---------------------------------\n"
+            result += f"Топ-{len(report['top'])} портфелей:\n"
+            for place, (value, user_id) in enumerate(report["top"], 1):
+                user_data = load_user_by_id(user_id)
+                username = user_data["username"] if user_data else "?"
+                result += f"{place}. {username} (id={user_id}): {value:,.2f} {base}\n"
+
+        if report["unpriced"]:
+            result += f"Без курса (не учтены): {', '.join(report['unpriced'])}\n"
+
+        speed = report["portfolios"] / report["elapsed"] if report["elapsed"] else 0
+        result += (f"Время: {report['elapsed']:.2f} с, пачек: {report['chunks']} "
+                   f"({speed:,.0f} портфелей/с)")
+        return result
+
+    @log_action
+    def batch_trade(self, path: str, fmt: Optional[str] = None,
+                    quiet: bool = False) -> str:
+        from .batch import execute_orders, read_orders
+
+        summary = execute_orders(read_orders(path, fmt))
+
+        lines = []
+        for result in summary["results"]:
+            if result["status"] == "ok":
+                if quiet:
+                    continue
+                lines.append(
+                    f"[{result['line']}] OK {result['side']} {result['amount']} "
+                    f"{result['currency']} ({result['user']}) по курсу "
+                    f"{result['rate']:.4f} USD: {result['usd']:,.2f} USD"
+                )
+            else:
+                lines.append(f"[{result['line']}] ОШИБКА ({result['user']}): "
+                             f"{result['error']}")
+
+        speed = summary["orders"] / summary["elapsed"] if summary["elapsed"] else 0
+        lines.append("---------------------------------")
+        lines.append(
+            f"Заявок: {summary['orders']}, исполнено: {summary['executed']}, "
+            f"отклонено: {summary['failed']}, изменено портфелей: "
+            f"{summary['portfolios']}"
+        )
+        lines.append(f"Время: {summary['elapsed']:.3f} с ({speed:,.0f} заявок/с)")
+        return "\n".join(lines)
+
+    @log_action
+    def place_order(self, side: str, currency: str, amount: float, kind: str,
+                    price: float) -> str:
+        from .orders import ORDER_KINDS, ORDER_SIDES, OrderBook
+
+        user = self._require_user()
+        if side not in ORDER_SIDES:
+            raise ValueError(f"Неизвестный тип заявки '{side}'. "
+                             f"Используйте buy или sell")
+        if kind not in ORDER_KINDS:
+            raise ValueError(f"Неизвестный вид заявки '{kind}'. "
+                             f"Используйте {' или '.join(ORDER_KINDS)}")
+
+        code = validate_trade_currency(currency)
+        amt = validate_amount(amount)
+        if price <= 0:
+            raise ValueError("Цена должна быть положительной")
+
+        order = OrderBook().place(user.user_id, side, kind, code, amt, price)
+        condition = "<=" if order.triggers_below else ">="
+        return (f"Заявка #{order.order_id} выставлена: {side} {amt:.4f} {code}, "
+                f"{kind}, исполнится при курсе {order.pair} {condition} "
+                f"{price:.4f}")
+
+    def list_orders(self) -> str:
+        from .orders import OrderBook
+
+        user = self._require_user()
+
+        orders = OrderBook().orders_for(user.user_id)
+        if not orders:
+            return "Открытых заявок нет"
+
+        lines = [f"Открытые заявки пользователя '{user.username}':"]
+        for order in sorted(orders, key=lambda order: order.order_id):
+            condition = "<=" if order.triggers_below else ">="
+            lines.append(f"#{order.order_id} {order.side} {order.amount:.4f} "
+                         f"{order.currency} {order.kind}: {order.pair} "
+                         f"{condition} {order.price:.4f} "
+                         f"(создана {order.created_at})")
+        return "\n".join(lines)
+
+    @log_action
+    def cancel_order(self, order_id: int) -> str:
+        from .orders import OrderBook
+
+        user = self._require_user()
+
+        order = OrderBook().cancel(user.user_id, order_id)
+        return (f"Заявка #{order.order_id} снята: {order.side} "
+                f"{order.amount:.4f} {order.currency}")
+
+    def trade_history(self, username: Optional[str] = None,
+                      since: Optional[str] = None,
+                      limit: Optional[int] = None) -> str:
+        """История сделок пользователя из журнала (по умолчанию - своя)"""
+        if username is None:
+            user = self._require_user("Сначала выполните login или укажите --user")
+            user_id, username = user.user_id, user.username
+        else:
+            user_data = load_user(username)
+            if user_data is None:
+                raise UserNotFoundError(username=username)
+            user_id = user_data["user_id"]
+
+        since_us = None
+        if since is not None:
+            try:
+                moment = datetime.fromisoformat(since.replace("Z", "+00:00"))
+            except ValueError:
+                raise ValueError(
+                    f"Некорректное время '{since}'. "
+                    f"Используйте ISO-формат, например 2025-10-01T12:00:00"
+                )
+            if moment.tzinfo is None:
+                moment = moment.replace(tzinfo=timezone.utc)
+            since_us = int(moment.timestamp() * 1_000_000)
+        if limit is not None and limit <= 0:
+            raise ValueError("Лимит должен быть положительным")
+
+        lines = []
+        for entry in load_trade_history(user_id, since_us, limit):
+            code = entry["pair"].split("_")[0]
+            balances = ", ".join(f"{wallet}: {balance:.4f}"
+                                 for wallet, balance in entry["balances"].items())
+            lines.append(
+                f"{entry['ts']} {entry['side'].upper()} {entry['amount']:.4f} "
+                f"{code} по курсу {entry['rate']:.4f} USD = {entry['usd']:,.2f} "
+                f"USD | {balances}"
+            )
+
+        if not lines:
+            return f"Сделок пользователя '{username}' не найдено"
+        return (f"Сделки пользователя '{username}' ({len(lines)}):\n"
+                + "\n".join(lines))
+
+    def list_supported_currencies(self) -> str:
+        from .utils import get_supported_currencies_list
+
+        currencies = get_supported_currencies_list()
+        result = "Поддерживаемые валюты:\n"
+
+        for code in currencies:
+            try:
+                currency = get_currency(code)
+                result += f"- {currency.get_display_info()}\n"
+            except CurrencyNotFoundError:
+                result += f"- {code} (информация недоступна)\n"
+
+        return result
+
+
+def _user_from_data(user_data: Dict) -> User:
+    return User(
+        user_data["user_id"], user_data["username"],
+        hashed_password=user_data["hashed_password"],
+        salt=user_data["salt"],
+        registration_date=datetime.fromisoformat(user_data["registration_date"]),
+    )
@@ -0,0 +1,144 @@
+"""
+Расчет сделок над состоянием портфеля и их исполнение
+Расчет используется и одиночными командами buy/sell, и пакетным исполнением,
+а commit_trade - общий путь записи для buy/sell и сработавших заявок
+"""
+
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Tuple
+from .exceptions import ConcurrentUpdateError, InsufficientFundsError
+from .models import Wallet
+from .utils import (
+    conflict_backoff, load_portfolio, portfolios_write_lock, record_trades,
+    save_wallet_balances, validate_trade_currency
+)
+from ..infra.settings import SettingsLoader
+
+
+def apply_buy(portfolio_data: Optional[dict], code: str, amt: float,
+               rate: float) -> Tuple[Dict[str, float], dict]:
+    """Рассчитать новые балансы после покупки. Возвращает (балансы, детали)"""
+    validate_trade_currency(code)
+    cost_usd = amt * rate
+    wallets_dict = portfolio_data.get("wallets", {}) if portfolio_data else {}
+
+    if "USD" not in wallets_dict:
+        raise InsufficientFundsError(available=0.0, required=cost_usd, code="USD")
+
+    usd_wallet = Wallet("USD", wallets_dict["USD"].get("balance", 0.0))
+
+    if usd_wallet.balance < cost_usd:
+        raise InsufficientFundsError(
+            available=usd_wallet.balance,
+            required=cost_usd,
+            code="USD"
+        )
+
+    old_usd_balance = usd_wallet.balance
+    usd_wallet.withdraw(cost_usd)
+
+    target_wallet = Wallet(code, wallets_dict.get(code, {}).get("balance", 0.0))
+    old_target_balance = target_wallet.balance
+    target_wallet.deposit(amt)
+
+    balances = {"USD": usd_wallet.balance, code: target_wallet.balance}
+    details = {
+        "cost_usd": cost_usd,
+        "old_usd_balance": old_usd_balance,
+        "new_usd_balance": usd_wallet.balance,
+        "old_balance": old_target_balance,
+        "new_balance": target_wallet.balance,
+    }
+    return balances, details
+
+
+def apply_sell(portfolio_data: Optional[dict], code: str, amt: float,
+                rate: float) -> Tuple[Dict[str, float], dict]:
+    """Рассчитать новые балансы после продажи. Возвращает (балансы, детали)"""
+    validate_trade_currency(code)
+    if portfolio_data is None:
+        raise ValueError("Портфель не найден")
+
+    revenue_usd = amt * rate
+    wallets_dict = portfolio_data.get("wallets", {})
+
+    if code not in wallets_dict:
+        raise InsufficientFundsError(available=0.0, required=amt, code=code)
+
+    wallet = Wallet(code, wallets_dict[code].get("balance", 0.0))
+
+    if wallet.balance < amt:
+        raise InsufficientFundsError(
+            available=wallet.balance,
+            required=amt,
+            code=code
+        )
+
+    usd_wallet = Wallet("USD", wallets_dict.get("USD", {}).get("balance", 0.0))
+
+    old_balance = wallet.balance
+    old_usd_balance = usd_wallet.balance
+
+    wallet.withdraw(amt)
+    usd_wallet.deposit(revenue_usd)
+
+    balances = {code: wallet.balance, "USD": usd_wallet.balance}
+    details = {
+        "revenue_usd": revenue_usd,
+        "old_usd_balance": old_usd_balance,
+        "new_usd_balance": usd_wallet.balance,
+        "old_balance": old_balance,
+        "new_balance": wallet.balance,
+    }
+    return balances, details
+
+
+def ledger_entry(user_id: int, side: str, code: str, amt: float, rate: float,
+                 balances: Dict[str, float], details: dict,
+                 moment: Optional[datetime] = None) -> Dict[str, Any]:
+    """Запись журнала сделок: время, пользователь, пара, объем, курс и балансы"""
+    moment = moment or datetime.now(timezone.utc)
+    return {
+        "ts": moment.isoformat().replace("+00:00", "Z"),
+        "ts_us": int(moment.timestamp() * 1_000_000),
+        "user_id": user_id,
+        "side": side,
+        "pair": f"{code}_USD",
+        "amount": amt,
+        "rate": rate,
+        "usd": details.get("cost_usd", details.get("revenue_usd")),
+        "balances": dict(balances),
+    }
+
+
+def commit_trade(user_id: int, side: str, code: str, amt: float,
+                 rate: float) -> dict:
+    """
+    Прочитать портфель, применить сделку и сохранить с проверкой версии
+    При конфликте с параллельной записью операция повторяется, а последняя
+    попытка выполняется под блокировкой портфелей и поэтому гарантированно
+    завершается: эту блокировку берет любая запись портфелей, в том числе
+    в SQLite. Исполненная сделка ставится в очередь журнала сделок
+    """
+    settings = SettingsLoader()
+    max_retries = settings.get("write_conflict_retries", 10)
+    apply = apply_buy if side == "buy" else apply_sell
+
+    for attempt in range(max_retries - 1):
+        portfolio_data = load_portfolio(user_id)
+        version = portfolio_data.get("version", 0) if portfolio_data else 0
+        balances, details = apply(portfolio_data, code, amt, rate)
+        try:
+            save_wallet_balances(user_id, balances, expected_version=version)
+            break
+        except ConcurrentUpdateError:
+            conflict_backoff(attempt)
+    else:
+        with portfolios_write_lock():
+            portfolio_data = load_portfolio(user_id)
+            version = portfolio_data.get("version", 0) if portfolio_data else 0
+            balances, details = apply(portfolio_data, code, amt, rate)
+            save_wallet_balances(user_id, balances, expected_version=version)
+
+    record_trades([ledger_entry(user_id, side, code, amt, rate, balances, details)])
+    return details
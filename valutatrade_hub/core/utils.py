@@ -3,9 +3,12 @@
 """
 
 import json
+import math
 import os
+import random
+import time
 from datetime import datetime, timezone
-from typing import Dict, List, Any, Optional
+from typing import Dict, Iterator, List, Any, Optional
 from .currencies import get_currency, get_supported_currencies
 from ..infra.database import DatabaseManager
 from ..infra.settings import SettingsLoader
@@ -39,6 +42,19 @@ def validate_currency_code(code: str) -> str:
     return code
 
 
+def validate_trade_currency(code: str) -> str:
+    """
+    Валидация валюты сделки: любая поддерживаемая, кроме самого USD
+    Raises:
+        CurrencyNotFoundError: если валюта не поддерживается
+        ValueError: если указан USD - сделки идут против USD
+    """
+    code = validate_currency_code(code)
+    if code == "USD":
+        raise ValueError("Сделки выполняются с валютами против USD")
+    return code
+
+
 def validate_amount(amount: float) -> float:
     """
     Валидация суммы
@@ -51,6 +67,8 @@ def validate_amount(amount: float) -> float:
     """
     if not isinstance(amount, (int, float)):
         raise ValueError("Сумма должна быть числом")
+    if not math.isfinite(amount):
+        raise ValueError("Сумма должна быть конечным числом")
     if amount <= 0:
         raise ValueError("Сумма должна быть положительной")
     return float(amount)
@@ -80,6 +98,93 @@ def save_portfolios(portfolios: List[Dict[str, Any]]) -> None:
     db.save_portfolios(portfolios)
 
 
+def load_user(username: str) -> Optional[Dict[str, Any]]:
+    """Найти пользователя по имени через DatabaseManager"""
+    db = DatabaseManager()
+    return db.get_user(username)
+
+
+def load_user_by_id(user_id: int) -> Optional[Dict[str, Any]]:
+    """Найти пользователя по ID через DatabaseManager"""
+    db = DatabaseManager()
+    return db.get_user_by_id(user_id)
+
+
+def add_user(user: Dict[str, Any]) -> None:
+    """Добавить пользователя через DatabaseManager"""
+    db = DatabaseManager()
+    db.add_user(user)
+
+
+def allocate_user_id() -> int:
+    """Получить следующий ID пользователя через DatabaseManager"""
+    db = DatabaseManager()
+    return db.next_user_id()
+
+
+def iter_portfolios(chunk_size: int = 10000) -> Iterator[List[Dict[str, Any]]]:
+    """Потоково перебрать все портфели пачками через DatabaseManager"""
+    db = DatabaseManager()
+    return db.iter_portfolios(chunk_size)
+
+
+def load_portfolio(user_id: int) -> Optional[Dict[str, Any]]:
+    """Загрузить портфель пользователя через DatabaseManager"""
+    db = DatabaseManager()
+    return db.get_portfolio(user_id)
+
+
+def save_wallet_balances(user_id: int, balances: Dict[str, float],
+                         expected_version: Optional[int] = None) -> int:
+    """
+    Сохранить только изменившиеся балансы кошельков пользователя
+    Raises:
+        ConcurrentUpdateError: если портфель изменился после чтения
+    """
+    db = DatabaseManager()
+    return db.update_wallets(user_id, balances, expected_version)
+
+
+def load_portfolios_for(user_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+    """Загрузить портфели нескольких пользователей через DatabaseManager"""
+    db = DatabaseManager()
+    return db.get_portfolios_for(user_ids)
+
+
+def save_wallet_balances_many(updates: List[tuple]) -> Dict[int, int]:
+    """
+    Сохранить балансы нескольких портфелей одной записью
+    Raises:
+        ConcurrentUpdateError: если какой-либо портфель изменился после чтения
+    """
+    db = DatabaseManager()
+    return db.update_wallets_many(updates)
+
+
+def record_trades(entries: List[Dict[str, Any]]) -> None:
+    """Записать сделки в журнал сделок через DatabaseManager"""
+    db = DatabaseManager()
+    db.record_trades(entries)
+
+
+def load_trade_history(user_id: int, since_us: Optional[int] = None,
+                       limit: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """Сделки пользователя из журнала через DatabaseManager"""
+    db = DatabaseManager()
+    return db.get_trade_history(user_id, since_us, limit)
+
+
+def conflict_backoff(attempt: int) -> None:
+    """Экспоненциальная пауза со случайным разбросом перед повтором записи"""
+    time.sleep(random.uniform(0, min(0.002 * 2 ** attempt, 0.2)))
+
+
+def portfolios_write_lock():
+    """Межпроцессная блокировка портфелей на время чтения-изменения-записи"""
+    db = DatabaseManager()
+    return db.portfolios_lock()
+
+
 def load_rates() -> Dict[str, Any]:
     """Загрузить курсы валют через DatabaseManager"""
     db = DatabaseManager()
@@ -120,29 +225,6 @@ def clear_session() -> None:
         pass
 
 
-def find_user(users: List[Dict], username: str) -> Optional[Dict]:
-    """Найти пользователя по имени"""
-    for user in users:
-        if user.get("username") == username:
-            return user
-    return None
-
-
-def find_user_by_id(users: List[Dict], user_id: int) -> Optional[Dict]:
-    """Найти пользователя по ID"""
-    for user in users:
-        if user.get("user_id") == user_id:
-            return user
-    return None
-
-
-def next_user_id(users: List[Dict]) -> int:
-    """Получить следующий ID пользователя"""
-    if not users:
-        return 1
-    return max(user.get("user_id", 0) for user in users) + 1
-
-
 def should_refresh_rates() -> bool:
 
     """
@@ -0,0 +1,204 @@
+"""
+Оценка портфелей по актуальной матрице кросс-курсов
+Балансы и курсы к базовой валюте хранятся в array('d'), стоимость всех
+кошельков считается одним проходом поэлементного умножения
+"""
+
+import heapq
+import math
+import threading
+import time
+from array import array
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from operator import mul
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from .exceptions import ApiRequestError
+from .rate_engine import CrossRate, RateEngine
+
+
+@dataclass(frozen=True)
+class Valuation:
+    """Стоимость кошельков портфеля в базовой валюте"""
+
+    base: str
+    codes: Tuple[str, ...]
+    balances: array
+    values: array
+    total: float
+    unpriced: Tuple[str, ...] = ()
+
+    def items(self) -> Iterator[Tuple[str, float, float]]:
+        """Тройки (валюта, баланс, стоимость в базе)"""
+        return zip(self.codes, self.balances, self.values)
+
+    def value_of(self, code: str) -> float:
+        return self.values[self.codes.index(code)]
+
+
+class RateVector:
+    """Курсы всех валют матрицы к одной базовой валюте"""
+
+    def __init__(self, base: str, matrix: Dict[Tuple[str, str], CrossRate]):
+        codes = sorted({code for code, target in matrix if target == base})
+        if not codes:
+            raise ApiRequestError(f"Нет курсов к базовой валюте {base}")
+
+        self.base = base
+        self.index: Dict[str, int] = {base: 0}
+        self.rates = array("d", [1.0])
+        for code in codes:
+            self.index[code] = len(self.rates)
+            self.rates.append(matrix[(code, base)].rate)
+
+    def gather(self, codes: Iterable[str], missing: float = math.nan) -> array:
+        """Вектор курсов для списка валют (missing, если курса нет)"""
+        index, rates = self.index, self.rates
+        return array("d", [rates[index[code]] if code in index else missing
+                           for code in codes])
+
+
+class PortfolioValuator:
+    """Оценка портфелей с кэшем векторов курсов по базовым валютам"""
+
+    def __init__(self, engine: Optional[RateEngine] = None):
+        self._engine = engine
+        self._lock = threading.Lock()
+        self._matrix: Optional[Dict] = None
+        self._vectors: Dict[str, RateVector] = {}
+
+    def vector(self, base: str) -> RateVector:
+        """Вектор курсов к базе для текущей матрицы"""
+        engine = self._engine or RateEngine()
+        matrix = engine.matrix()
+        with self._lock:
+            if matrix is not self._matrix:
+                self._matrix = matrix
+                self._vectors = {}
+            vector = self._vectors.get(base)
+            if vector is None:
+                vector = RateVector(base, matrix)
+                self._vectors[base] = vector
+        return vector
+
+    def value(self, balances: Dict[str, float], base: str = "USD") -> Valuation:
+        """Стоимость каждого кошелька и всего портфеля в базовой валюте"""
+        codes = tuple(balances)
+        amounts = array("d", balances.values())
+        if not codes:
+            return Valuation(base, codes, amounts, array("d"), 0.0)
+
+        rates = self.vector(base).gather(codes)
+        values = array("d", map(mul, amounts, rates))
+
+        # Валюты без курса не входят в итог, как и раньше
+        unpriced = tuple(code for code, rate in zip(codes, rates) if rate != rate)
+        if unpriced:
+            values = array("d", [0.0 if value != value else value
+                                 for value in values])
+
+        return Valuation(base, codes, amounts, values, math.fsum(values),
+                         unpriced)
+
+    def value_wallets(self, wallets: Dict[str, Dict],
+                      base: str = "USD") -> Valuation:
+        """Оценить кошельки в формате хранилища: {код: {"balance": ...}}"""
+        return self.value(
+            {code: data.get("balance", 0.0) for code, data in wallets.items()},
+            base
+        )
+
+
+valuator = PortfolioValuator()
+
+
+def value_chunk(chunk: List[Dict], vector: RateVector,
+                top_n: int) -> Dict[str, Any]:
+    """
+    Оценить пачку портфелей одним векторным проходом
+    Вызывается и в дочерних процессах, поэтому получает готовый вектор курсов
+    """
+    owners: List[Any] = []
+    offsets = array("q", [0])
+    codes: List[str] = []
+    balances = array("d")
+
+    for portfolio in chunk:
+        for code, wallet in portfolio.get("wallets", {}).items():
+            codes.append(code)
+            balances.append(wallet.get("balance", 0.0))
+        owners.append(portfolio.get("user_id"))
+        offsets.append(len(balances))
+
+    values = array("d", map(mul, balances, vector.gather(codes, missing=0.0)))
+    totals = [math.fsum(values[offsets[i]:offsets[i + 1]])
+              for i in range(len(owners))]
+
+    holdings: Dict[str, float] = {}
+    for code, balance in zip(codes, balances):
+        holdings[code] = holdings.get(code, 0.0) + balance
+
+    return {
+        "portfolios": len(owners),
+        "aum": math.fsum(totals),
+        "holdings": holdings,
+        "top": heapq.nlargest(top_n, zip(totals, owners)),
+        "unpriced": sorted({code for code in holdings if code not in vector.index}),
+    }
+
+
+def aum_report(chunks: Iterable[List[Dict]], base: str = "USD", top_n: int = 10,
+               workers: int = 0) -> Dict[str, Any]:
+    """
+    Суммарные активы и топ-N портфелей по всем пользователям
+    Все пачки оцениваются по одному снимку курсов. При workers > 0 пачки
+    уходят в пул процессов, в работе не больше 2 * workers пачек, поэтому
+    память ограничена независимо от числа портфелей
+    """
+    started = time.perf_counter()
+    vector = valuator.vector(base)
+
+    report: Dict[str, Any] = {
+        "base": base, "portfolios": 0, "chunks": 0, "holdings": {},
+        "unpriced": set(),
+    }
+    chunk_totals: List[float] = []
+    top: List[Tuple[float, Any]] = []
+
+    def merge(part: Dict[str, Any]) -> None:
+        report["portfolios"] += part["portfolios"]
+        report["chunks"] += 1
+        chunk_totals.append(part["aum"])
+        report["unpriced"].update(part["unpriced"])
+        for code, balance in part["holdings"].items():
+            report["holdings"][code] = report["holdings"].get(code, 0.0) + balance
+        for entry in part["top"]:
+            if len(top) < top_n:
+                heapq.heappush(top, entry)
+            elif entry > top[0]:
+                heapq.heapreplace(top, entry)
+
+    if workers > 0:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            in_flight = set()
+            for chunk in chunks:
+                in_flight.add(pool.submit(value_chunk, chunk, vector, top_n))
+                if len(in_flight) >= workers * 2:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        merge(future.result())
+            for future in in_flight:
+                merge(future.result())
+    else:
+        for chunk in chunks:
+            merge(value_chunk(chunk, vector, top_n))
+
+    report["aum"] = math.fsum(chunk_totals)
+    report["top"] = sorted(top, reverse=True)
+    report["holdings_value"] = {
+        code: balance * vector.rates[vector.index[code]]
+        for code, balance in report["holdings"].items() if code in vector.index
+    }
+    report["unpriced"] = sorted(report["unpriced"])
+    report["elapsed"] = time.perf_counter() - started
+    return report
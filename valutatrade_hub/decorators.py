@@ -3,6 +3,7 @@
 """
 
 import functools
+import inspect
 import logging
 from typing import Callable, Any
 
@@ -10,31 +11,40 @@ from typing import Callable, Any
 logger = logging.getLogger("valutatrade.actions")
 
 def log_action(func: Callable) -> Callable:
+    """
+    Логировать вызов, его аргументы и результат
+    Пользователь берется из атрибута username объекта, чей метод вызван
+    (например, TradingService), иначе пишется 'anonymous'
+    """
+    signature = inspect.signature(func)
+
     @functools.wraps(func)
     def wrapper(*args, **kwargs) -> Any:
         action = func.__name__.upper()
-        username = "anonymous"
         try:
-            from valutatrade_hub.core.usecases import current_user
-            if current_user:
-                username = current_user.username
-        except (ImportError, AttributeError):
-            pass
+            params = signature.bind_partial(*args, **kwargs).arguments
+        except TypeError:
+            params = {}
+        if action == 'TRADE':
+            # trade(side, ...) пишется в лог так же, как buy/sell
+            action = str(params.get('side', action)).upper()
+        username = getattr(params.get("self"), "username", None) or "anonymous"
 
         log_message = f"{action} user='{username}'"
 
-        if action in ['BUY', 'SELL'] and len(args) >= 2:
-            currency = args[0] if len(args) > 0 else kwargs.get('currency', 'unknown')
-            amount = args[1] if len(args) > 1 else kwargs.get('amount', 0)
+        if action in ['BUY', 'SELL']:
+            currency = params.get('currency', 'unknown')
+            amount = params.get('amount', 0)
             log_message += f" currency='{currency}' amount={amount}"
-        elif action == 'REGISTER' and len(args) >= 2:
-            username_arg = args[0] if len(args) > 0 else kwargs.get('username',
-            'unknown')
-            log_message += f" new_user='{username_arg}'"
-        elif action == 'LOGIN' and len(args) >= 2:
-            username_arg = args[0] if len(args) > 0 else kwargs.get('username',
-            'unknown')
-            log_message += f" attempt_user='{username_arg}'"
+        elif action == 'REGISTER':
+            log_message += f" new_user='{params.get('username', 'unknown')}'"
+        elif action == 'LOGIN':
+            log_message += f" attempt_user='{params.get('username', 'unknown')}'"
+
+        if not logger.handlers:
+            # Файловый лог настраивается при первом действии, а не при запуске
+            from .logging_config import setup_logging
+            setup_logging()
 
         try:
             result = func(*args, **kwargs)
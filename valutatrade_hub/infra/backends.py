@@ -0,0 +1,828 @@
+"""
+Бэкенды хранения пользователей и портфелей
+Выбираются через SettingsLoader (ключ storage_backend)
+"""
+
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import (
+    IO, Any, Callable, ContextManager, Dict, Iterator, List, Optional, Tuple
+)
+from .journal import TradeJournal, UserJournal, apply_journal, apply_records
+from .user_index import UserIndex
+from ..core.exceptions import ConcurrentUpdateError
+
+# Изменение портфеля: (user_id, балансы кошельков, ожидаемая версия)
+WalletUpdate = Tuple[int, Dict[str, float], Optional[int]]
+
+
+class StorageBackend(ABC):
+    """Абстрактный бэкенд хранения пользователей и портфелей"""
+
+    @abstractmethod
+    def get_users(self) -> List[Dict]:
+        """Получить всех пользователей"""
+        pass
+
+    @abstractmethod
+    def save_users(self, users: List[Dict]) -> None:
+        """Сохранить всех пользователей"""
+        pass
+
+    @abstractmethod
+    def get_portfolios(self) -> List[Dict]:
+        """Получить все портфели"""
+        pass
+
+    @abstractmethod
+    def save_portfolios(self, portfolios: List[Dict]) -> None:
+        """Сохранить все портфели"""
+        pass
+
+    @abstractmethod
+    def get_user(self, username: str) -> Optional[Dict]:
+        """Найти пользователя по имени"""
+        pass
+
+    @abstractmethod
+    def get_user_by_id(self, user_id: int) -> Optional[Dict]:
+        """Найти пользователя по ID"""
+        pass
+
+    @abstractmethod
+    def next_user_id(self) -> int:
+        """Получить следующий ID пользователя"""
+        pass
+
+    @abstractmethod
+    def add_user(self, user: Dict) -> None:
+        """
+        Добавить одного пользователя
+        Raises:
+            ConcurrentUpdateError: если имя или ID уже заняты другой записью
+        """
+        pass
+
+    @abstractmethod
+    def get_portfolio(self, user_id: int) -> Optional[Dict]:
+        """Получить портфель пользователя"""
+        pass
+
+    @abstractmethod
+    def update_wallets(self, user_id: int, balances: Dict[str, float],
+                       expected_version: Optional[int] = None) -> int:
+        """
+        Обновить балансы указанных кошельков (создает портфель при отсутствии)
+        Args:
+            expected_version: версия портфеля, прочитанная до изменения
+        Returns:
+            Новую версию портфеля
+        Raises:
+            ConcurrentUpdateError: если портфель успели изменить
+        """
+        pass
+
+    def get_portfolios_for(self, user_ids: List[int]) -> Dict[int, Dict]:
+        """Портфели нескольких пользователей: user_id -> портфель"""
+        found = {}
+        for user_id in user_ids:
+            portfolio = self.get_portfolio(user_id)
+            if portfolio is not None:
+                found[user_id] = portfolio
+        return found
+
+    def update_wallets_many(self, updates: List[WalletUpdate]) -> Dict[int, int]:
+        """
+        Записать балансы нескольких портфелей
+        Args:
+            updates: список (user_id, балансы, ожидаемая версия)
+        Returns:
+            Новые версии портфелей: user_id -> версия
+        """
+        return {
+            user_id: self.update_wallets(user_id, balances, expected_version)
+            for user_id, balances, expected_version in updates
+        }
+
+    def iter_portfolios(self, chunk_size: int = 10000) -> Iterator[List[Dict]]:
+        """Все портфели пачками по chunk_size (для отчетов по всем пользователям)"""
+        portfolios = self.get_portfolios()
+        for start in range(0, len(portfolios), chunk_size):
+            yield portfolios[start:start + chunk_size]
+
+
+class JsonBackend(StorageBackend):
+    """
+    Бэкенд поверх users.json и portfolios.json
+    При наличии журналов изменения балансов и новые пользователи дописываются
+    в них за O(1), а JSON-файлы служат снимками и обновляются фоновой
+    компакцией. Поиск пользователей идет через персистентный индекс
+    """
+
+    def __init__(self, load_json: Callable[[str], Any],
+                 save_json: Callable[[str, Any], None],
+                 lock: Callable[[str], ContextManager],
+                 journal: Optional[TradeJournal] = None,
+                 compact_threshold: int = 262144,
+                 user_journal: Optional[UserJournal] = None,
+                 user_index: Optional[UserIndex] = None,
+                 file_signature: Optional[Callable[[str], Tuple]] = None,
+                 get_filepath: Optional[Callable[[str], str]] = None):
+        self._load_json = load_json
+        self._save_json = save_json
+        self._lock = lock
+        self._journal = journal
+        self._compact_threshold = compact_threshold
+        self._user_journal = user_journal
+        self._user_index = user_index
+        self._file_signature = file_signature
+        self._get_filepath = get_filepath
+        self._compaction_thread: Optional[threading.Thread] = None
+        # Портфели по user_id (снимок с примененным журналом), подпись снимка
+        # и смещения уже примененных записей журнала по st_ino файла
+        self._portfolio_index: Dict[int, Dict] = {}
+        self._snapshot_signature: Optional[Tuple] = None
+        self._journal_offsets: Dict[int, int] = {}
+
+        # Под блокировкой, чтобы не обрезать запись, которую сейчас
+        # дописывает другой процесс
+        if self._journal is not None:
+            with self._lock("portfolios.json"):
+                self._journal.recover()
+        if self._user_journal is not None:
+            with self._lock("users.json"):
+                self._user_journal.recover()
+
+    def get_users(self) -> List[Dict]:
+        users = self._load_json("users.json")
+        if self._user_journal is not None:
+            users.extend(self._user_journal.records())
+        return users
+
+    def save_users(self, users: List[Dict]) -> None:
+        with self._lock("users.json"):
+            self._save_json("users.json", users)
+            if self._user_journal is not None:
+                self._user_journal.clear()
+            # Индекс перестроится при следующем обращении по новому состоянию
+
+    def _users_state(self) -> Tuple:
+        """Состояние источника пользователей, по которому построен индекс"""
+        signature = (self._file_signature("users.json")
+                     if self._file_signature else (0, 0, 0))
+        journal_size = self._user_journal.size() if self._user_journal else 0
+        return (*signature, journal_size)
+
+    def _ensure_index(self) -> UserIndex:
+        """Перестроить индекс, если users.json менялся в обход него"""
+        state = self._users_state()
+        if not self._user_index.is_synced(state):
+            self._user_index.rebuild(self.get_users(), state)
+        return self._user_index
+
+    def get_portfolios(self) -> List[Dict]:
+        portfolios = self._load_json("portfolios.json")
+        if self._journal is not None:
+            apply_journal(portfolios, self._journal.records())
+        return portfolios
+
+    def iter_portfolios(self, chunk_size: int = 10000) -> Iterator[List[Dict]]:
+        """
+        Читать portfolios.json потоково, не загружая файл целиком
+        Журнал и открытие снимка берутся под одной блокировкой, поэтому
+        компакция не может вклиниться между ними; дальше чтение идет из уже
+        открытого файла, который компакция лишь заменяет
+        """
+        if self._get_filepath is None:
+            yield from super().iter_portfolios(chunk_size)
+            return
+
+        with self._lock("portfolios.json"):
+            records = self._journal.records() if self._journal is not None else []
+            try:
+                snapshot: Optional[IO] = open(
+                    self._get_filepath("portfolios.json"), "r", encoding="utf-8"
+                )
+            except FileNotFoundError:
+                snapshot = None
+
+        pending = {p["user_id"]: p for p in apply_journal([], records)}
+        chunk: List[Dict] = []
+
+        if snapshot is not None:
+            with snapshot:
+                for portfolio in iter_json_array(snapshot):
+                    journaled = pending.pop(portfolio.get("user_id"), None)
+                    if journaled is not None:
+                        portfolio.setdefault("wallets", {}).update(
+                            journaled["wallets"]
+                        )
+                        portfolio["version"] = journaled.get(
+                            "version", portfolio.get("version", 0)
+                        )
+                    chunk.append(portfolio)
+                    if len(chunk) >= chunk_size:
+                        yield chunk
+                        chunk = []
+
+        for portfolio in pending.values():
+            chunk.append(portfolio)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+
+        if chunk:
+            yield chunk
+
+    def save_portfolios(self, portfolios: List[Dict]) -> None:
+        with self._lock("portfolios.json"):
+            self._save_json("portfolios.json", portfolios)
+            if self._journal is not None:
+                self._journal.clear()
+
+    def get_user(self, username: str) -> Optional[Dict]:
+        if self._user_index is not None:
+            with self._lock("users.json"):
+                return self._ensure_index().get_user(username)
+
+        for user in self.get_users():
+            if user.get("username") == username:
+                return user
+        return None
+
+    def get_user_by_id(self, user_id: int) -> Optional[Dict]:
+        if self._user_index is not None:
+            with self._lock("users.json"):
+                return self._ensure_index().get_record(user_id)
+
+        for user in self.get_users():
+            if user.get("user_id") == user_id:
+                return user
+        return None
+
+    def next_user_id(self) -> int:
+        if self._user_index is not None:
+            with self._lock("users.json"):
+                return self._ensure_index().next_id()
+
+        users = self.get_users()
+        if not users:
+            return 1
+        return max(user.get("user_id", 0) for user in users) + 1
+
+    def add_user(self, user: Dict) -> None:
+        if self._user_index is not None and self._user_journal is not None:
+            with self._lock("users.json"):
+                index = self._ensure_index()
+                if (index.get_user_id(user["username"]) is not None
+                        or index.get_record(user["user_id"]) is not None):
+                    raise ConcurrentUpdateError("users.json")
+
+                journal_size = self._user_journal.append_record(user)
+                index.add(user, self._users_state())
+
+            if journal_size >= self._compact_threshold:
+                self.compact_async()
+            return
+
+        with self._lock("users.json"):
+            users = self.get_users()
+            for existing in users:
+                if (existing.get("username") == user["username"]
+                        or existing.get("user_id") == user["user_id"]):
+                    raise ConcurrentUpdateError("users.json")
+            users.append(user)
+            self.save_users(users)
+
+    def _indexed(self) -> bool:
+        return self._journal is not None and self._file_signature is not None
+
+    def _portfolios_by_user(self) -> Dict[int, Dict]:
+        """
+        Портфели по user_id: снимок portfolios.json с примененным журналом
+        Снимок перечитывается только при его смене, из журнала разбираются
+        лишь дописанные с прошлого раза записи. Вызывать под блокировкой
+        portfolios.json и отдавать наружу только копии
+        """
+        signature = self._file_signature("portfolios.json")
+        files = self._journal.files()
+        if (signature != self._snapshot_signature
+                or any(size < self._journal_offsets.get(ino, 0)
+                       for _, ino, size in files)):
+            portfolios = self._load_json("portfolios.json")
+            self._portfolio_index = {p.get("user_id"): p for p in portfolios}
+            self._snapshot_signature = signature
+            self._journal_offsets = {}
+
+        # Ротация для компакции переименовывает файл, но не меняет st_ino,
+        # поэтому уже примененные записи не читаются повторно
+        offsets = {}
+        for path, ino, size in files:
+            offset = self._journal_offsets.get(ino, 0)
+            if size > offset:
+                records, offset = self._journal.records_from(path, offset)
+                apply_records(self._portfolio_index, records)
+            offsets[ino] = offset
+        self._journal_offsets = offsets
+        return self._portfolio_index
+
+    def get_portfolio(self, user_id: int) -> Optional[Dict]:
+        if self._indexed():
+            with self._lock("portfolios.json"):
+                portfolio = self._portfolios_by_user().get(user_id)
+                return _copy_portfolio(portfolio) if portfolio else None
+
+        found = []
+        for portfolio in self._load_json("portfolios.json"):
+            if portfolio.get("user_id") == user_id:
+                found.append(portfolio)
+                break
+
+        if self._journal is not None:
+            records = [r for r in self._journal.records() if r["u"] == user_id]
+            apply_journal(found, records)
+
+        return found[0] if found else None
+
+    def update_wallets(self, user_id: int, balances: Dict[str, float],
+                       expected_version: Optional[int] = None) -> int:
+        if self._journal is not None:
+            with self._lock("portfolios.json"):
+                current = self.get_portfolio(user_id)
+                version = self._check_version(current, expected_version)
+                journal_size = self._journal.append(user_id, balances, version)
+
+            if journal_size >= self._compact_threshold:
+                self.compact_async()
+            return version
+
+        with self._lock("portfolios.json"):
+            portfolios = self.get_portfolios()
+            portfolio = None
+            for p in portfolios:
+                if p.get("user_id") == user_id:
+                    portfolio = p
+                    break
+
+            version = self._check_version(portfolio, expected_version)
+            if portfolio is None:
+                portfolio = {"user_id": user_id, "wallets": {}}
+                portfolios.append(portfolio)
+
+            wallets = portfolio.setdefault("wallets", {})
+            for code, balance in balances.items():
+                wallets[code] = {"balance": balance}
+            portfolio["version"] = version
+
+            self.save_portfolios(portfolios)
+            return version
+
+    def get_portfolios_for(self, user_ids: List[int]) -> Dict[int, Dict]:
+        if self._indexed():
+            with self._lock("portfolios.json"):
+                by_user = self._portfolios_by_user()
+                return {user_id: _copy_portfolio(by_user[user_id])
+                        for user_id in user_ids if user_id in by_user}
+
+        wanted = set(user_ids)
+        found = [p for p in self._load_json("portfolios.json")
+                 if p.get("user_id") in wanted]
+
+        if self._journal is not None:
+            records = [r for r in self._journal.records() if r["u"] in wanted]
+            apply_journal(found, records)
+
+        return {p["user_id"]: p for p in found}
+
+    def update_wallets_many(self, updates: List[WalletUpdate]) -> Dict[int, int]:
+        if self._journal is None:
+            return super().update_wallets_many(updates)
+
+        with self._lock("portfolios.json"):
+            current = self.get_portfolios_for([user_id for user_id, _, _ in updates])
+            # Все версии проверяются до записи: пакет пишется целиком или никак
+            versions: Dict[int, int] = {}
+            entries = []
+            for user_id, balances, expected_version in updates:
+                if user_id in versions:
+                    raise ValueError(f"Портфель {user_id} повторяется в пакете")
+                versions[user_id] = self._check_version(current.get(user_id),
+                                                        expected_version)
+                entries.append((user_id, balances, versions[user_id]))
+            journal_size = self._journal.append_many(entries) if entries else 0
+
+        if journal_size >= self._compact_threshold:
+            self.compact_async()
+        return versions
+
+    @staticmethod
+    def _check_version(portfolio: Optional[Dict],
+                       expected_version: Optional[int]) -> int:
+        """Сверить версию портфеля и вернуть следующую"""
+        current_version = portfolio.get("version", 0) if portfolio else 0
+        if expected_version is not None and expected_version != current_version:
+            raise ConcurrentUpdateError("portfolios.json")
+        return current_version + 1
+
+    def compact(self) -> Dict[str, int]:
+        """Свернуть журналы в снимки portfolios.json и users.json"""
+        result = {"records": 0, "bytes": 0}
+
+        if self._journal is not None:
+            with self._lock("portfolios.json"):
+                if self._journal.rotate():
+                    records, journal_bytes = self._journal.rotated_records()
+                    portfolios = self._load_json("portfolios.json")
+                    apply_journal(portfolios, records)
+                    self._save_json("portfolios.json", portfolios)
+                    self._journal.discard_compacted()
+                    result["records"] += len(records)
+                    result["bytes"] += journal_bytes
+
+        if self._user_journal is not None:
+            with self._lock("users.json"):
+                if self._user_journal.rotate():
+                    records, journal_bytes = self._user_journal.rotated_records()
+                    users = self._load_json("users.json")
+                    users.extend(records)
+                    self._save_json("users.json", users)
+                    self._user_journal.discard_compacted()
+                    if self._user_index is not None:
+                        # Записи уже в индексе, меняется только снимок
+                        self._user_index.mark_synced(self._users_state())
+                    result["records"] += len(records)
+                    result["bytes"] += journal_bytes
+
+        return result
+
+    def compact_async(self) -> None:
+        """Запустить компакцию в фоновом потоке (если она еще не идет)"""
+        if self._compaction_thread and self._compaction_thread.is_alive():
+            return
+
+        # Поток не daemon: процесс CLI дождется окончания записи снимка
+        self._compaction_thread = threading.Thread(
+            target=self.compact,
+            name="journal-compaction"
+        )
+        self._compaction_thread.start()
+
+
+class SqliteBackend(StorageBackend):
+    """Бэкенд на stdlib sqlite3 с индексами и построчными обновлениями"""
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT NOT NULL,
+            hashed_password TEXT NOT NULL,
+            salt TEXT NOT NULL,
+            registration_date TEXT NOT NULL
+        );
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_users_username ON users(username);
+
+        CREATE TABLE IF NOT EXISTS portfolios (
+            user_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        );
+
+        CREATE TABLE IF NOT EXISTS wallets (
+            user_id INTEGER NOT NULL,
+            currency_code TEXT NOT NULL,
+            balance REAL NOT NULL,
+            PRIMARY KEY (user_id, currency_code)
+        );
+        CREATE INDEX IF NOT EXISTS idx_wallets_user_id ON wallets(user_id);
+    """
+
+    _USER_COLUMNS = "user_id, username, hashed_password, salt, registration_date"
+
+    def __init__(self, db_path: str,
+                 lock: Optional[Callable[[str], ContextManager]] = None):
+        self.db_path = db_path
+        self._lock = lock
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(self._SCHEMA)
+        self._upgrade_schema()
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        """Соединение текущего потока (sqlite3 не разделяет их между потоками)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30,
+                                   check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def _upgrade_schema(self) -> None:
+        """Добавить колонку версии в базы, созданные до ее появления"""
+        columns = {row["name"] for row in
+                   self._conn.execute("PRAGMA table_info(portfolios)")}
+        if "version" not in columns:
+            with self._conn:
+                self._conn.execute(
+                    "ALTER TABLE portfolios "
+                    "ADD COLUMN version INTEGER NOT NULL DEFAULT 0"
+                )
+
+    def _portfolios_lock(self) -> ContextManager:
+        """
+        Та же межпроцессная блокировка, что у JSON-бэкенда: пока ее держит
+        portfolios_write_lock(), портфели не меняет ни один процесс
+        """
+        if self._lock is None:
+            return contextlib.nullcontext()
+        return self._lock("portfolios.json")
+
+    def close(self) -> None:
+        """Закрыть соединения с базой всех потоков"""
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+    @staticmethod
+    def _user_from_row(row: sqlite3.Row) -> Dict:
+        return {
+            "user_id": row["user_id"],
+            "username": row["username"],
+            "hashed_password": row["hashed_password"],
+            "salt": row["salt"],
+            "registration_date": row["registration_date"],
+        }
+
+    def get_users(self) -> List[Dict]:
+        rows = self._conn.execute(
+            f"SELECT {self._USER_COLUMNS} FROM users ORDER BY user_id"
+        )
+        return [self._user_from_row(row) for row in rows]
+
+    def save_users(self, users: List[Dict]) -> None:
+        with self._conn:
+            self._conn.execute("DELETE FROM users")
+            self._conn.executemany(
+                f"INSERT INTO users ({self._USER_COLUMNS}) VALUES (?, ?, ?, ?, ?)",
+                [self._user_params(user) for user in users]
+            )
+
+    def get_portfolios(self) -> List[Dict]:
+        portfolios: Dict[int, Dict] = {}
+        for row in self._conn.execute(
+                "SELECT user_id, version FROM portfolios ORDER BY user_id"):
+            portfolios[row["user_id"]] = {
+                "user_id": row["user_id"],
+                "wallets": {},
+                "version": row["version"],
+            }
+
+        for row in self._conn.execute(
+                "SELECT user_id, currency_code, balance FROM wallets "
+                "ORDER BY user_id, rowid"):
+            portfolio = portfolios.setdefault(
+                row["user_id"], {"user_id": row["user_id"], "wallets": {}}
+            )
+            portfolio["wallets"][row["currency_code"]] = {"balance": row["balance"]}
+
+        return list(portfolios.values())
+
+    def iter_portfolios(self, chunk_size: int = 10000) -> Iterator[List[Dict]]:
+        """Портфели пачками одним проходом по кошелькам, упорядоченным по user_id"""
+        cursor = self._conn.execute(
+            "SELECT p.user_id, p.version, w.currency_code, w.balance "
+            "FROM portfolios p LEFT JOIN wallets w ON w.user_id = p.user_id "
+            "ORDER BY p.user_id"
+        )
+        chunk: List[Dict] = []
+        current: Optional[Dict] = None
+
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            for row in rows:
+                if current is None or current["user_id"] != row["user_id"]:
+                    if len(chunk) >= chunk_size:
+                        yield chunk
+                        chunk = []
+                    current = {"user_id": row["user_id"], "wallets": {},
+                               "version": row["version"]}
+                    chunk.append(current)
+                if row["currency_code"] is not None:
+                    current["wallets"][row["currency_code"]] = {
+                        "balance": row["balance"]
+                    }
+
+        if chunk:
+            yield chunk
+
+    def save_portfolios(self, portfolios: List[Dict]) -> None:
+        with self._portfolios_lock(), self._conn:
+            self._conn.execute("DELETE FROM wallets")
+            self._conn.execute("DELETE FROM portfolios")
+            for portfolio in portfolios:
+                user_id = portfolio["user_id"]
+                self._conn.execute(
+                    "INSERT INTO portfolios (user_id, version) VALUES (?, ?)",
+                    (user_id, portfolio.get("version", 0))
+                )
+                self._conn.executemany(
+                    "INSERT INTO wallets (user_id, currency_code, balance) "
+                    "VALUES (?, ?, ?)",
+                    [(user_id, code, wallet.get("balance", 0.0))
+                     for code, wallet in portfolio.get("wallets", {}).items()]
+                )
+
+    def get_user(self, username: str) -> Optional[Dict]:
+        row = self._conn.execute(
+            f"SELECT {self._USER_COLUMNS} FROM users WHERE username = ?",
+            (username,)
+        ).fetchone()
+        return self._user_from_row(row) if row else None
+
+    def get_user_by_id(self, user_id: int) -> Optional[Dict]:
+        row = self._conn.execute(
+            f"SELECT {self._USER_COLUMNS} FROM users WHERE user_id = ?",
+            (user_id,)
+        ).fetchone()
+        return self._user_from_row(row) if row else None
+
+    def next_user_id(self) -> int:
+        row = self._conn.execute(
+            "SELECT COALESCE(MAX(user_id), 0) + 1 FROM users"
+        ).fetchone()
+        return row[0]
+
+    def add_user(self, user: Dict) -> None:
+        try:
+            with self._conn:
+                self._conn.execute(
+                    f"INSERT INTO users ({self._USER_COLUMNS}) "
+                    f"VALUES (?, ?, ?, ?, ?)",
+                    self._user_params(user)
+                )
+        except sqlite3.IntegrityError:
+            raise ConcurrentUpdateError("users")
+
+    def get_portfolio(self, user_id: int) -> Optional[Dict]:
+        header = self._conn.execute(
+            "SELECT version FROM portfolios WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        if not header:
+            return None
+
+        rows = self._conn.execute(
+            "SELECT currency_code, balance FROM wallets WHERE user_id = ? "
+            "ORDER BY rowid",
+            (user_id,)
+        )
+        return {
+            "user_id": user_id,
+            "wallets": {row["currency_code"]: {"balance": row["balance"]}
+                        for row in rows},
+            "version": header["version"],
+        }
+
+    def update_wallets(self, user_id: int, balances: Dict[str, float],
+                       expected_version: Optional[int] = None) -> int:
+        with self._portfolios_lock(), self._conn:
+            # IMMEDIATE сразу берет блокировку записи: проверка версии
+            # и обновление выполняются атомарно относительно других процессов
+            self._conn.execute("BEGIN IMMEDIATE")
+            row = self._conn.execute(
+                "SELECT version FROM portfolios WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            current_version = row["version"] if row else 0
+            if expected_version is not None and expected_version != current_version:
+                raise ConcurrentUpdateError("portfolios")
+
+            version = current_version + 1
+            self._conn.execute(
+                "INSERT INTO portfolios (user_id, version) VALUES (?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET version = excluded.version",
+                (user_id, version)
+            )
+            self._conn.executemany(
+                "INSERT INTO wallets (user_id, currency_code, balance) "
+                "VALUES (?, ?, ?) "
+                "ON CONFLICT(user_id, currency_code) "
+                "DO UPDATE SET balance = excluded.balance",
+                [(user_id, code, balance) for code, balance in balances.items()]
+            )
+        return version
+
+    def update_wallets_many(self, updates: List[WalletUpdate]) -> Dict[int, int]:
+        versions: Dict[int, int] = {}
+        with self._portfolios_lock(), self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            for user_id, balances, expected_version in updates:
+                row = self._conn.execute(
+                    "SELECT version FROM portfolios WHERE user_id = ?", (user_id,)
+                ).fetchone()
+                current_version = row["version"] if row else 0
+                if (expected_version is not None
+                        and expected_version != current_version):
+                    raise ConcurrentUpdateError("portfolios")
+
+                versions[user_id] = current_version + 1
+                self._conn.execute(
+                    "INSERT INTO portfolios (user_id, version) VALUES (?, ?) "
+                    "ON CONFLICT(user_id) DO UPDATE SET version = excluded.version",
+                    (user_id, versions[user_id])
+                )
+                self._conn.executemany(
+                    "INSERT INTO wallets (user_id, currency_code, balance) "
+                    "VALUES (?, ?, ?) "
+                    "ON CONFLICT(user_id, currency_code) "
+                    "DO UPDATE SET balance = excluded.balance",
+                    [(user_id, code, balance) for code, balance in balances.items()]
+                )
+        return versions
+
+    @staticmethod
+    def _user_params(user: Dict) -> tuple:
+        return (
+            user["user_id"],
+            user["username"],
+            user["hashed_password"],
+            user["salt"],
+            user["registration_date"],
+        )
+
+
+def migrate_json_to_sqlite(source: StorageBackend,
+                           target: SqliteBackend) -> Dict[str, int]:
+    """Перенести пользователей и портфели из JSON-бэкенда в SQLite"""
+    users = source.get_users()
+    portfolios = source.get_portfolios()
+
+    target.save_users(users)
+    target.save_portfolios(portfolios)
+
+    return {"users": len(users), "portfolios": len(portfolios)}
+
+
+def iter_json_array(stream: IO, buffer_size: int = 1 << 20) -> Iterator[Any]:
+    """Потоково разобрать JSON-массив верхнего уровня по одному элементу"""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    started = False
+
+    while True:
+        # Пропустить пробелы и разделители, при необходимости дочитать файл
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if position < len(buffer):
+                break
+            buffer, position = stream.read(buffer_size), 0
+            if not buffer:
+                return
+
+        if not started:
+            if buffer[position] != "[":
+                raise ValueError("Ожидался JSON-массив")
+            started = True
+            position += 1
+            continue
+
+        if buffer[position] == "]":
+            return
+
+        try:
+            item, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            more = stream.read(buffer_size)
+            if not more:
+                raise
+            buffer, position = buffer[position:] + more, 0
+            continue
+
+        yield item
+        position = end
+
+
+def _copy_portfolio(portfolio: Dict) -> Dict:
+    """Копия портфеля из индекса, чтобы вызывающий код не портил его"""
+    copy = dict(portfolio)
+    copy["wallets"] = {code: dict(wallet)
+                       for code, wallet in portfolio.get("wallets", {}).items()}
+    return copy
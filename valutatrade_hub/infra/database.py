@@ -1,11 +1,22 @@
 import json
 import os
-from typing import Dict, List
+import tempfile
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from .backends import (
+    JsonBackend,
+    SqliteBackend,
+    StorageBackend,
+    WalletUpdate,
+    migrate_json_to_sqlite,
+)
+from .journal import TradeJournal, UserJournal
+from .locking import FileLock
 from .settings import SettingsLoader
+from .user_index import UserIndex
 
 
 class DatabaseManager:
-    """Singleton для работы с JSON-хранилищем"""
+    """Singleton для работы с хранилищем данных"""
 
     _instance = None
 
@@ -18,7 +29,42 @@ class DatabaseManager:
         if not hasattr(self, '_initialized'):
             self._initialized = True
             self._settings = SettingsLoader()
-            self._cache = {}
+            self._cache: Dict[str, Tuple[Tuple[int, int, int], Any]] = {}
+            self._cache_hits = 0
+            self._cache_misses = 0
+            self._backend = self._create_backend()
+            self._ledger = None
+
+    def _create_backend(self) -> StorageBackend:
+        """Создать бэкенд хранения согласно настройке storage_backend"""
+        backend_name = self._settings.get("storage_backend", "json")
+
+        if backend_name == "json":
+            return self._create_json_backend()
+        if backend_name == "sqlite":
+            return SqliteBackend(self._get_sqlite_path(), lock=self._lock)
+
+        raise ValueError(f"Неизвестный бэкенд хранения: {backend_name}. "
+                         f"Используйте: json, sqlite")
+
+    def _create_json_backend(self) -> JsonBackend:
+        """Создать JSON-бэкенд с журналом сделок"""
+        return JsonBackend(
+            self._load_json,
+            self._save_json,
+            self._lock,
+            journal=TradeJournal(self._get_filepath("portfolios.journal")),
+            compact_threshold=self._settings.get("journal_compact_bytes", 262144),
+            user_journal=UserJournal(self._get_filepath("users.journal")),
+            user_index=UserIndex(self._get_filepath("users.idx")),
+            file_signature=self._file_signature,
+            get_filepath=self._get_filepath
+        )
+
+    def _get_sqlite_path(self) -> str:
+        """Получить путь к файлу базы SQLite (по умолчанию в data_dir)"""
+        return (self._settings.get("sqlite_path")
+                or self._get_filepath("valutatrade.db"))
 
     def _get_filepath(self, filename: str) -> str:
         """Получить полный путь к файлу"""
@@ -26,44 +72,184 @@ class DatabaseManager:
         filepath = os.path.join(data_dir, filename)
         return filepath
 
+    def _lock(self, filename: str) -> FileLock:
+        """Межпроцессная блокировка записи для файла данных"""
+        return FileLock.for_path(self._get_filepath(filename))
+
+    def _file_signature(self, filename: str) -> Tuple[int, int, int]:
+        """Подпись файла (st_mtime_ns, st_size, st_ino) или нули, если его нет"""
+        try:
+            stat = os.stat(self._get_filepath(filename))
+        except FileNotFoundError:
+            return (0, 0, 0)
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
     def _load_json(self, filename: str) -> List[Dict] | Dict:
-        """Загрузить данные из JSON файла"""
+        """
+        Загрузить данные из JSON файла через кэш
+        Кэш проверяется по (st_mtime_ns, st_size, st_ino): файл перечитывается
+        только если его изменили, в том числе другим процессом
+        """
         filepath = self._get_filepath(filename)
 
-        if not os.path.exists(filepath):
+        try:
+            stat = os.stat(filepath)
+        except FileNotFoundError:
+            self._cache.pop(filepath, None)
             return [] if filename in ["users.json", "portfolios.json"] else {}
 
+        signature = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        cached = self._cache.get(filepath)
+        if cached is not None and cached[0] == signature:
+            self._cache_hits += 1
+            return _copy_json(cached[1])
+
+        self._cache_misses += 1
         try:
             with open(filepath, 'r', encoding='utf-8') as f:
-                return json.load(f)
+                data = json.load(f)
         except json.JSONDecodeError:
+            self._cache.pop(filepath, None)
             return [] if filename in ["users.json", "portfolios.json"] else {}
 
+        self._cache[filepath] = (signature, data)
+        return _copy_json(data)
+
     def _save_json(self, filename: str, data: List[Dict] | Dict) -> None:
-        """Сохранить данные в JSON файл"""
+        """Атомарно сохранить данные в JSON файл и сбросить его кэш"""
         filepath = self._get_filepath(filename)
+        self._cache.pop(filepath, None)
+        directory = os.path.dirname(filepath) or "."
+
+        os.makedirs(directory, exist_ok=True)
 
-        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        with self._lock(filename):
+            temp_fd, temp_path = tempfile.mkstemp(
+                dir=directory,
+                prefix=f".{filename}.",
+                suffix=".tmp"
+            )
+            try:
+                with os.fdopen(temp_fd, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, indent=2, ensure_ascii=False)
+                os.replace(temp_path, filepath)
+            except Exception:
+                try:
+                    os.unlink(temp_path)
+                except OSError:
+                    pass
+                raise
 
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+    def cache_stats(self) -> Dict[str, int]:
+        """Счетчики кэша чтения для инструментирования"""
+        return {
+            "hits": self._cache_hits,
+            "misses": self._cache_misses,
+            "entries": len(self._cache),
+        }
 
+    def rates_signature(self) -> Tuple[int, int, int]:
+        """Подпись rates.json для отслеживания изменения курсов"""
+        return self._file_signature("rates.json")
+
+    def clear_cache(self) -> None:
+        """Сбросить кэш чтения и счетчики"""
+        self._cache.clear()
+        self._cache_hits = 0
+        self._cache_misses = 0
+
+    @property
+    def backend_name(self) -> str:
+        """Имя активного бэкенда хранения"""
+        return self._settings.get("storage_backend", "json")
 
     def get_users(self) -> List[Dict]:
         """Получить всех пользователей"""
-        return self._load_json("users.json")
+        return self._backend.get_users()
 
     def save_users(self, users: List[Dict]) -> None:
         """Сохранить пользователей"""
-        self._save_json("users.json", users)
+        self._backend.save_users(users)
+
+    def get_user(self, username: str) -> Optional[Dict]:
+        """Найти пользователя по имени"""
+        return self._backend.get_user(username)
+
+    def get_user_by_id(self, user_id: int) -> Optional[Dict]:
+        """Найти пользователя по ID"""
+        return self._backend.get_user_by_id(user_id)
+
+    def next_user_id(self) -> int:
+        """Получить следующий ID пользователя"""
+        return self._backend.next_user_id()
+
+    def add_user(self, user: Dict) -> None:
+        """Добавить пользователя"""
+        self._backend.add_user(user)
 
     def get_portfolios(self) -> List[Dict]:
         """Получить все портфели"""
-        return self._load_json("portfolios.json")
+        return self._backend.get_portfolios()
 
     def save_portfolios(self, portfolios: List[Dict]) -> None:
         """Сохранить портфели"""
-        self._save_json("portfolios.json", portfolios)
+        self._backend.save_portfolios(portfolios)
+
+    def get_portfolio(self, user_id: int) -> Optional[Dict]:
+        """Получить портфель пользователя"""
+        return self._backend.get_portfolio(user_id)
+
+    def update_wallets(self, user_id: int, balances: Dict[str, float],
+                       expected_version: Optional[int] = None) -> int:
+        """Обновить балансы кошельков пользователя с проверкой версии портфеля"""
+        return self._backend.update_wallets(user_id, balances, expected_version)
+
+    def get_portfolios_for(self, user_ids: List[int]) -> Dict[int, Dict]:
+        """Портфели нескольких пользователей за одно чтение хранилища"""
+        return self._backend.get_portfolios_for(user_ids)
+
+    def update_wallets_many(self, updates: List[WalletUpdate]) -> Dict[int, int]:
+        """Записать балансы нескольких портфелей одной операцией"""
+        return self._backend.update_wallets_many(updates)
+
+    def iter_portfolios(self, chunk_size: int = 10000) -> Iterator[List[Dict]]:
+        """Все портфели пачками, без загрузки хранилища в память целиком"""
+        return self._backend.iter_portfolios(chunk_size)
+
+    def compact_journal(self) -> Dict[str, int]:
+        """Свернуть журнал сделок в снимок portfolios.json"""
+        if isinstance(self._backend, JsonBackend):
+            return self._backend.compact()
+        return {"records": 0, "bytes": 0}
+
+    def portfolios_lock(self) -> FileLock:
+        """Эксклюзивная блокировка портфелей для чтения-изменения-записи"""
+        return self._lock("portfolios.json")
+
+    @property
+    def ledger(self):
+        """Журнал сделок (создается при первом обращении)"""
+        if self._ledger is None:
+            from .ledger import TradeLedger
+
+            interval_ms = self._settings.get("ledger_flush_interval_ms", 50)
+            self._ledger = TradeLedger(
+                self._get_filepath("ledger.jsonl"),
+                self._get_filepath("ledger.idx"),
+                flush_interval=interval_ms / 1000,
+                flush_max_records=self._settings.get("ledger_flush_max_records", 256)
+            )
+        return self._ledger
+
+    def record_trades(self, entries: List[Dict]) -> None:
+        """Поставить сделки в очередь групповой записи журнала"""
+        for entry in entries:
+            self.ledger.record(entry)
+
+    def get_trade_history(self, user_id: int, since_us: Optional[int] = None,
+                          limit: Optional[int] = None) -> Iterator[Dict]:
+        """Сделки пользователя из журнала, начиная с момента since_us"""
+        return self.ledger.history(user_id, since_us, limit)
 
     def get_rates(self) -> Dict:
         """Получить курсы валют"""
@@ -72,3 +258,81 @@ class DatabaseManager:
     def save_rates(self, rates: Dict) -> None:
         """Сохранить курсы валют"""
         self._save_json("rates.json", rates)
+
+    def rates_lock(self) -> FileLock:
+        """Блокировка rates.json на время чтения-изменения-записи"""
+        return self._lock("rates.json")
+
+    def get_orders(self) -> Dict:
+        """Получить книгу отложенных заявок"""
+        return self._load_json("orders.json")
+
+    def save_orders(self, orders: Dict) -> None:
+        """Сохранить книгу отложенных заявок"""
+        self._save_json("orders.json", orders)
+
+    def orders_lock(self) -> FileLock:
+        """Эксклюзивная блокировка книги заявок"""
+        return self._lock("orders.json")
+
+    def get_breakers(self) -> Dict:
+        """Получить состояние circuit breaker'ов источников курсов"""
+        return self._load_json("breakers.json")
+
+    def save_breakers(self, breakers: Dict) -> None:
+        """Сохранить состояние circuit breaker'ов"""
+        self._save_json("breakers.json", breakers)
+
+    def breakers_lock(self) -> FileLock:
+        """Эксклюзивная блокировка состояния circuit breaker'ов"""
+        return self._lock("breakers.json")
+
+    def get_rate_limits(self) -> Dict:
+        """Получить состояние корзин лимита запросов к источникам"""
+        return self._load_json("ratelimits.json")
+
+    def save_rate_limits(self, buckets: Dict) -> None:
+        """Сохранить состояние корзин лимита запросов"""
+        self._save_json("ratelimits.json", buckets)
+
+    def rate_limits_lock(self) -> FileLock:
+        """Эксклюзивная блокировка корзин лимита запросов"""
+        return self._lock("ratelimits.json")
+
+    def get_scheduler_state(self) -> Dict:
+        """Получить время последних и следующих запусков задач планировщика"""
+        return self._load_json("scheduler.json")
+
+    def save_scheduler_state(self, state: Dict) -> None:
+        """Сохранить состояние задач планировщика"""
+        self._save_json("scheduler.json", state)
+
+    def scheduler_lock(self) -> FileLock:
+        """Эксклюзивная блокировка состояния планировщика"""
+        return self._lock("scheduler.json")
+
+    def orders_signature(self) -> Tuple[int, int, int]:
+        """Подпись orders.json для отслеживания изменения книги заявок"""
+        return self._file_signature("orders.json")
+
+    def migrate_to_sqlite(self) -> Dict[str, Any]:
+        """Однократно перенести users.json и portfolios.json в SQLite"""
+        source = (self._backend if isinstance(self._backend, JsonBackend)
+                  else self._create_json_backend())
+        target = SqliteBackend(self._get_sqlite_path(), lock=self._lock)
+        try:
+            result = migrate_json_to_sqlite(source, target)
+        finally:
+            target.close()
+
+        result["db_path"] = target.db_path
+        return result
+
+
+def _copy_json(value: Any) -> Any:
+    """Быстрая копия JSON-данных, чтобы вызывающий код не портил кэш"""
+    if isinstance(value, dict):
+        return {key: _copy_json(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_copy_json(item) for item in value]
+    return value
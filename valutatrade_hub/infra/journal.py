@@ -0,0 +1,229 @@
+"""
+Append-only журналы (write-ahead log) для JSON-хранилища
+Каждая строка - компактная JSON-запись, недописанный хвост отбрасывается
+"""
+
+import json
+import os
+import threading
+from typing import Dict, List, Tuple
+
+
+class AppendOnlyJournal:
+    """Журнал JSON-записей с ротацией для компакции"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.compacting_path = f"{path}.compacting"
+        self._lock = threading.Lock()
+
+    def append_record(self, record: Dict) -> int:
+        """Дописать одну запись. Возвращает размер журнала"""
+        return self.append_records([record])
+
+    def append_records(self, records: List[Dict]) -> int:
+        """
+        Дописать несколько записей с одним fsync. Возвращает размер журнала
+        Вызывается под межпроцессной блокировкой файла данных. Недописанную
+        строку, оставленную упавшим процессом, запись сначала обрезает: иначе
+        новая запись склеится с ней и пропадет при чтении вместе со всеми
+        последующими
+        """
+        data = "".join(
+            json.dumps(record, separators=(",", ":"), ensure_ascii=False) + "\n"
+            for record in records
+        ).encode("utf-8")
+
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+            with open(self.path, "a+b") as f:
+                _trim_torn_tail(f.fileno())
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+                return f.tell()
+
+    def records(self) -> List[Dict]:
+        """Все целые записи: сначала ротированный хвост, затем текущий журнал"""
+        result = []
+        for path in (self.compacting_path, self.path):
+            records, _ = self._read_records(path)
+            result.extend(records)
+        return result
+
+    def recover(self) -> int:
+        """Обрезать недописанную запись в конце журнала. Возвращает число байт"""
+        truncated = 0
+        with self._lock:
+            for path in (self.compacting_path, self.path):
+                if not os.path.exists(path):
+                    continue
+                _, valid_length = self._read_records(path)
+                size = os.path.getsize(path)
+                if valid_length < size:
+                    with open(path, "r+b") as f:
+                        f.truncate(valid_length)
+                    truncated += size - valid_length
+        return truncated
+
+    def rotate(self) -> bool:
+        """Отложить текущий журнал для компакции, новые записи пойдут в новый файл"""
+        with self._lock:
+            if os.path.exists(self.compacting_path):
+                return True
+            if not os.path.exists(self.path):
+                return False
+            os.replace(self.path, self.compacting_path)
+            return True
+
+    def rotated_records(self) -> Tuple[List[Dict], int]:
+        """Записи отложенного для компакции журнала и его размер в байтах"""
+        records, valid_length = self._read_records(self.compacting_path)
+        return records, valid_length
+
+    def discard_compacted(self) -> None:
+        """Удалить журнал, уже свернутый в снимок"""
+        with self._lock:
+            if os.path.exists(self.compacting_path):
+                os.remove(self.compacting_path)
+
+    def clear(self) -> None:
+        """Удалить все записи журнала (после полной перезаписи снимка)"""
+        with self._lock:
+            for path in (self.compacting_path, self.path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def files(self) -> List[Tuple[str, int, int]]:
+        """(путь, st_ino, st_size) файлов журнала: ротированный, затем текущий"""
+        result = []
+        for path in (self.compacting_path, self.path):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            result.append((path, stat.st_ino, stat.st_size))
+        return result
+
+    def records_from(self, path: str, offset: int) -> Tuple[List[Dict], int]:
+        """Целые записи файла после смещения offset и смещение за последней"""
+        return self._read_records(path, offset)
+
+    def size(self) -> int:
+        """Текущий размер журнала в байтах"""
+        try:
+            return os.path.getsize(self.path)
+        except FileNotFoundError:
+            return 0
+
+    def _is_valid(self, record: Dict) -> bool:
+        """Проверить структуру записи"""
+        return isinstance(record, dict)
+
+    def _read_records(self, path: str, offset: int = 0) -> Tuple[List[Dict], int]:
+        """
+        Прочитать записи с offset до первой поврежденной или недописанной
+        строки. Возвращает записи и смещение конца последней целой записи
+        """
+        try:
+            with open(path, "rb") as f:
+                f.seek(offset)
+                data = f.read()
+        except FileNotFoundError:
+            return [], 0
+
+        records = []
+        valid_length = offset
+        for line in data.splitlines(keepends=True):
+            if not line.endswith(b"\n"):
+                break
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            if not self._is_valid(record):
+                break
+            records.append(record)
+            valid_length += len(line)
+
+        return records, valid_length
+
+
+class TradeJournal(AppendOnlyJournal):
+    """Журнал изменений балансов портфелей"""
+
+    def append(self, user_id: int, balances: Dict[str, float],
+               version: int = 0) -> int:
+        """Дописать одну запись об изменении балансов. Возвращает размер журнала"""
+        return self.append_record({"u": user_id, "v": version, "w": balances})
+
+    def append_many(self, entries: List[Tuple[int, Dict[str, float], int]]) -> int:
+        """Дописать изменения нескольких портфелей одной записью на диск"""
+        return self.append_records([
+            {"u": user_id, "v": version, "w": balances}
+            for user_id, balances, version in entries
+        ])
+
+    def _is_valid(self, record: Dict) -> bool:
+        return isinstance(record, dict) and "u" in record and "w" in record
+
+
+class UserJournal(AppendOnlyJournal):
+    """Журнал новых пользователей, дописываемых после снимка users.json"""
+
+    def _is_valid(self, record: Dict) -> bool:
+        return (isinstance(record, dict)
+                and "user_id" in record and "username" in record)
+
+
+def apply_journal(portfolios: List[Dict], records: List[Dict]) -> List[Dict]:
+    """Применить записи журнала к снимку портфелей (на месте)"""
+    by_user = {p.get("user_id"): p for p in portfolios}
+    portfolios.extend(apply_records(by_user, records))
+    return portfolios
+
+
+def apply_records(by_user: Dict[int, Dict], records: List[Dict]) -> List[Dict]:
+    """
+    Применить записи журнала к портфелям по user_id (на месте)
+    Возвращает портфели, созданные для пользователей не из снимка
+    """
+    created = []
+    for record in records:
+        user_id = record["u"]
+        portfolio = by_user.get(user_id)
+        if portfolio is None:
+            portfolio = {"user_id": user_id, "wallets": {}}
+            by_user[user_id] = portfolio
+            created.append(portfolio)
+
+        wallets = portfolio.setdefault("wallets", {})
+        for code, balance in record["w"].items():
+            wallets[code] = {"balance": balance}
+
+        if "v" in record:
+            portfolio["version"] = record["v"]
+
+    return created
+
+
+def _trim_torn_tail(fd: int) -> int:
+    """Обрезать файл после последнего перевода строки. Возвращает число байт"""
+    size = os.fstat(fd).st_size
+    if size == 0 or os.pread(fd, 1, size - 1) == b"\n":
+        return 0
+
+    end = size
+    keep = 0
+    while end > 0:
+        start = max(0, end - 4096)
+        newline = os.pread(fd, end - start, start).rfind(b"\n")
+        if newline >= 0:
+            keep = start + newline + 1
+            break
+        end = start
+    os.ftruncate(fd, keep)
+    return size - keep
@@ -0,0 +1,199 @@
+"""
+Журнал сделок (ledger): append-only файл JSON-строк и индекс смещений
+Индекс (user_id, время, смещение, длина) хранится в sqlite3, поэтому история
+пользователя читается только по его записям. Записи буферизуются и
+сбрасываются группой: одна запись в файл, один fsync и одна транзакция индекса
+"""
+
+import atexit
+import json
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from .locking import FileLock
+
+
+class TradeLedger:
+    """Журнал сделок с групповой записью и индексом по пользователям"""
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS entries (
+            user_id INTEGER NOT NULL,
+            ts INTEGER NOT NULL,
+            offset INTEGER NOT NULL PRIMARY KEY,
+            length INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_entries_user_ts ON entries (user_id, ts);
+    """
+
+    def __init__(self, path: str, index_path: str, flush_interval: float = 0.05,
+                 flush_max_records: int = 256):
+        self.path = path
+        self.index_path = index_path
+        self.flush_interval = flush_interval
+        self.flush_max_records = flush_max_records
+
+        self._conn: Optional[sqlite3.Connection] = None
+        self._buffer: List[Dict[str, Any]] = []
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._writer: Optional[threading.Thread] = None
+        atexit.register(self.flush)
+
+    def record(self, entry: Dict[str, Any]) -> None:
+        """
+        Поставить сделку в очередь записи
+        Запись в файл выполняет фоновый поток пачками по flush_interval
+        """
+        with self._condition:
+            self._buffer.append(entry)
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop,
+                                                daemon=True)
+                self._writer.start()
+            if len(self._buffer) >= self.flush_max_records:
+                self._condition.notify()
+
+    def flush(self) -> int:
+        """Записать буфер на диск. Возвращает число записанных сделок"""
+        with self._flush_lock:
+            with self._condition:
+                pending, self._buffer = self._buffer, []
+            if not pending:
+                return 0
+
+            lines = [
+                json.dumps(entry, separators=(",", ":"), ensure_ascii=False)
+                .encode("utf-8") + b"\n"
+                for entry in pending
+            ]
+
+            with FileLock.for_path(self.path):
+                self._recover()
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                with open(self.path, "ab") as f:
+                    offset = f.seek(0, os.SEEK_END)
+                    f.write(b"".join(lines))
+                    f.flush()
+                    os.fsync(f.fileno())
+
+                rows = []
+                for entry, line in zip(pending, lines):
+                    rows.append((entry["user_id"], entry["ts_us"], offset, len(line)))
+                    offset += len(line)
+                db = self._db()
+                with db:
+                    db.executemany(
+                        "INSERT OR REPLACE INTO entries (user_id, ts, offset, length) "
+                        "VALUES (?, ?, ?, ?)", rows
+                    )
+            return len(pending)
+
+    def history(self, user_id: int, since_us: Optional[int] = None,
+                limit: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """Сделки пользователя по возрастанию времени (через индекс смещений)"""
+        self.flush()
+        with FileLock.for_path(self.path):
+            self._recover()
+
+        query = "SELECT offset, length FROM entries WHERE user_id = ?"
+        params: List[Any] = [user_id]
+        if since_us is not None:
+            query += " AND ts >= ?"
+            params.append(since_us)
+        query += " ORDER BY ts, offset"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        # Соединение общее с фоновой записью, поэтому чтение - под ее блокировкой
+        with self._flush_lock:
+            rows = self._db().execute(query, params).fetchall()
+        if not rows:
+            return
+
+        with open(self.path, "rb") as f:
+            for offset, length in rows:
+                yield json.loads(os.pread(f.fileno(), length, offset))
+
+    def stats(self) -> Dict[str, int]:
+        """Число записей, размер файла и длина буфера"""
+        row = self._db().execute("SELECT COUNT(*) FROM entries").fetchone()
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            size = 0
+        return {"entries": row[0], "bytes": size, "pending": len(self._buffer)}
+
+    def _write_loop(self) -> None:
+        """Фоновая запись: копит сделки flush_interval и сбрасывает пачкой"""
+        while True:
+            with self._condition:
+                if not self._buffer:
+                    self._condition.wait(timeout=self.flush_interval * 20)
+                    if not self._buffer:
+                        # Простой - поток завершается, record запустит новый
+                        self._writer = None
+                        return
+                if len(self._buffer) < self.flush_max_records:
+                    self._condition.wait(timeout=self.flush_interval)
+            self.flush()
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.index_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.index_path, timeout=30,
+                                         check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(self._SCHEMA)
+        return self._conn
+
+    def _recover(self) -> None:
+        """
+        Дописать в индекс записи, попавшие в файл без индекса (сбой между
+        записью файла и индекса), и обрезать недописанную строку в конце.
+        Вызывается под блокировкой файла журнала
+        """
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            return
+
+        row = self._db().execute(
+            "SELECT offset + length FROM entries ORDER BY offset DESC LIMIT 1"
+        ).fetchone()
+        indexed_end = row[0] if row else 0
+        if indexed_end >= size:
+            return
+
+        with open(self.path, "rb") as f:
+            f.seek(indexed_end)
+            tail = f.read()
+
+        rows: List[Tuple[int, int, int, int]] = []
+        offset = indexed_end
+        for line in tail.splitlines(keepends=True):
+            if not line.endswith(b"\n"):
+                break
+            try:
+                entry = json.loads(line)
+                rows.append((entry["user_id"], entry["ts_us"], offset, len(line)))
+            except (ValueError, KeyError, TypeError):
+                break
+            offset += len(line)
+
+        db = self._db()
+        with db:
+            db.executemany(
+                "INSERT OR REPLACE INTO entries (user_id, ts, offset, length) "
+                "VALUES (?, ?, ?, ?)", rows
+            )
+        if offset < size:
+            with open(self.path, "r+b") as f:
+                f.truncate(offset)
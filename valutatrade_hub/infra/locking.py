@@ -0,0 +1,63 @@
+"""
+Межпроцессные advisory-блокировки файлов данных через fcntl
+"""
+
+import fcntl
+import os
+import threading
+from typing import Dict, Optional
+
+
+class FileLock:
+    """
+    Эксклюзивная блокировка файла через fcntl.flock на соседнем <file>.lock
+    Реентерабельна внутри процесса и защищает также от соседних потоков
+    """
+
+    _registry: Dict[str, "FileLock"] = {}
+    _registry_lock = threading.Lock()
+
+    def __init__(self, path: str):
+        self.path = f"{path}.lock"
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._fd: Optional[int] = None
+
+    @classmethod
+    def for_path(cls, path: str) -> "FileLock":
+        """Получить общий объект блокировки для файла"""
+        key = os.path.abspath(path)
+        with cls._registry_lock:
+            lock = cls._registry.get(key)
+            if lock is None:
+                lock = cls(key)
+                cls._registry[key] = lock
+            return lock
+
+    def acquire(self) -> None:
+        self._thread_lock.acquire()
+        if self._depth == 0:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            except BaseException:
+                self._thread_lock.release()
+                raise
+            self._fd = fd
+        self._depth += 1
+
+    def release(self) -> None:
+        self._depth -= 1
+        if self._depth == 0 and self._fd is not None:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._thread_lock.release()
+
+    def __enter__(self) -> "FileLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.release()
@@ -34,11 +34,33 @@ class SettingsLoader:
             "data_dir": "data",
             "logs_dir": "logs",
 
+            # Бэкенд хранения пользователей и портфелей: json или sqlite
+            "storage_backend": "json",
+            # Файл базы SQLite; по умолчанию valutatrade.db в data_dir
+            "sqlite_path": None,
+            # Порог размера журнала сделок для фоновой компакции (JSON-бэкенд)
+            "journal_compact_bytes": 262144,  # 256 KB
+            # Повторы записи при конфликте версий с параллельным процессом
+            "write_conflict_retries": 10,
+            # Групповая запись журнала сделок (ledger): пауза накопления и
+            # размер пачки, при котором запись выполняется сразу
+            "ledger_flush_interval_ms": 50,
+            "ledger_flush_max_records": 256,
+
             # Настройки курсов
             "rates_ttl_seconds": 3600,  # 1 час
             "default_base_currency": "USD",
             "supported_currencies": ["USD", "EUR", "RUB", "GBP", "JPY", "BTC", "ETH"],
 
+            # Сроки хранения истории курсов в днях (0 - хранить всегда):
+            # сырые точки, затем только агрегаты OHLC
+            "history_raw_retention_days": 30,
+            "history_1m_retention_days": 7,
+            "history_1h_retention_days": 365,
+            "history_1d_retention_days": 0,
+            # Период фоновой компакции истории в планировщике
+            "history_compaction_interval": 86400,  # 1 сутки
+
             # Настройки логов
             "log_file": "logs/actions.log",
             "log_level": "INFO",
@@ -49,6 +71,15 @@ class SettingsLoader:
             "initial_usd_balance": 1000.0,
             "min_password_length": 4,
 
+            # Локальный HTTP API (команда serve): адрес и число потоков для
+            # блокирующих операций с хранилищем
+            "server_host": "127.0.0.1",
+            "server_port": 8765,
+            "server_workers": 8,
+            # Сессии HTTP API: срок без обращений, сек, и предел их числа
+            "server_session_ttl": 3600,
+            "server_max_sessions": 10000,
+
             # Настройки API (заглушка)
             "api_timeout": 10,
             "api_max_retries": 3,
@@ -0,0 +1,122 @@
+"""
+Персистентный индекс пользователей для JSON-хранилища
+username -> user_id, user_id -> запись пользователя и монотонный счетчик ID
+Хранится в отдельном файле stdlib sqlite3 (B-дерево), поэтому поиск не
+зависит от размера users.json
+"""
+
+import json
+import os
+import sqlite3
+from typing import Dict, List, Optional, Tuple
+
+
+class UserIndex:
+    """Индекс пользователей с поиском по имени и ID"""
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT NOT NULL UNIQUE,
+            record TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=30,
+                                         check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(self._SCHEMA)
+        return self._conn
+
+    def get_user_id(self, username: str) -> Optional[int]:
+        """Найти ID пользователя по имени"""
+        row = self._db().execute(
+            "SELECT user_id FROM users WHERE username = ?", (username,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def get_record(self, user_id: int) -> Optional[Dict]:
+        """Получить запись пользователя по ID"""
+        row = self._db().execute(
+            "SELECT record FROM users WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_user(self, username: str) -> Optional[Dict]:
+        """Получить запись пользователя по имени"""
+        row = self._db().execute(
+            "SELECT record FROM users WHERE username = ?", (username,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def next_id(self) -> int:
+        """Следующий свободный ID"""
+        value = self._get_meta("next_id")
+        return int(value) if value is not None else 1
+
+    def add(self, user: Dict, sync_state: Tuple) -> None:
+        """Добавить запись пользователя и запомнить состояние источника"""
+        db = self._db()
+        with db:
+            self._put(db, [user])
+            next_id = max(self.next_id(), user["user_id"] + 1)
+            self._set_meta(db, "next_id", str(next_id))
+            self._set_meta(db, "sync", json.dumps(list(sync_state)))
+
+    def rebuild(self, users: List[Dict], sync_state: Tuple) -> None:
+        """Полностью перестроить индекс по списку пользователей"""
+        db = self._db()
+        with db:
+            db.execute("DELETE FROM users")
+            self._put(db, users)
+            next_id = max((user["user_id"] for user in users), default=0) + 1
+            self._set_meta(db, "next_id", str(next_id))
+            self._set_meta(db, "sync", json.dumps(list(sync_state)))
+
+    def is_synced(self, sync_state: Tuple) -> bool:
+        """Проверить, что индекс построен по текущему состоянию источника"""
+        value = self._get_meta("sync")
+        return value is not None and json.loads(value) == list(sync_state)
+
+    def mark_synced(self, sync_state: Tuple) -> None:
+        """Запомнить состояние источника без изменения записей"""
+        db = self._db()
+        with db:
+            self._set_meta(db, "sync", json.dumps(list(sync_state)))
+
+    def _get_meta(self, key: str) -> Optional[str]:
+        row = self._db().execute(
+            "SELECT value FROM meta WHERE key = ?", (key,)
+        ).fetchone()
+        return row[0] if row else None
+
+    @staticmethod
+    def _set_meta(db: sqlite3.Connection, key: str, value: str) -> None:
+        db.execute(
+            "INSERT INTO meta (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, value)
+        )
+
+    @staticmethod
+    def _put(db: sqlite3.Connection, users: List[Dict]) -> None:
+        db.executemany(
+            "INSERT OR REPLACE INTO users (user_id, username, record) "
+            "VALUES (?, ?, ?)",
+            [(user["user_id"], user["username"],
+              json.dumps(user, ensure_ascii=False)) for user in users]
+        )
@@ -1,64 +1,138 @@
 
 """Клиенты для работы с внешними API курсов валют"""
 
+import random
+import threading
 import time
 import requests
 from abc import ABC, abstractmethod
 from typing import Dict, Any, Optional
 from datetime import datetime
+from .breaker import CircuitBreaker
 from .config import config, DataSource
+from .http_cache import (
+    HttpCache, cache_entry, conditional_headers, is_fresh, revalidated
+)
+from .rate_limiter import RateLimitTimeout, TokenBucket
 from ..core.exceptions import ApiRequestError
 
 
 class BaseApiClient(ABC):
     """Абстрактный базовый класс для API клиентов"""
 
+    # Источники опрашиваются параллельно: строки вывода не должны смешиваться
+    _print_lock = threading.Lock()
+
     def __init__(self, source_name: str):
         self.source_name = source_name
         self._session = requests.Session()
-        self._last_request_time = 0
-        self._request_count = 0
+        self._cache = HttpCache(config.HTTP_CACHE_DIR)
+        self._limiter = TokenBucket(source_name)
+        self.timeout = config.REQUEST_TIMEOUT
+        # Момент time.monotonic(), после которого повторы не начинаются
+        self.deadline: Optional[float] = None
 
     @abstractmethod
     def fetch_rates(self) -> Dict[str, Any]:
         """Получить курсы валют от API"""
         pass
 
+    def _log(self, message: str) -> None:
+        with self._print_lock:
+            print(message)
+
+    def _check_payload(self, data: Any) -> None:
+        """
+        Проверить тело ответа 200 до того, как запрос засчитается успешным
+        Источник, который сообщает об ошибке в теле (неверный ключ, исчерпана
+        квота), переопределяет метод и выбрасывает ApiRequestError: такой
+        ответ не кешируется и считается неудачей для circuit breaker
+        """
+
     def _make_request(self, url: str, params: Optional[Dict] = None) -> Dict[str, Any]:
-        """Выполнить HTTP запрос с обработкой ошибок и rate limiting"""
+        """
+        Выполнить HTTP запрос с повторами, общим лимитом и circuit breaker
+        Временные ошибки повторяются до MAX_RETRIES попыток с экспоненциальной
+        задержкой и случайным разбросом, но не дольше срока deadline. Открытый
+        breaker отклоняет запрос сразу, без обращения к сети
+        """
+        breaker = CircuitBreaker(self.source_name)
+        if not breaker.allow():
+            raise ApiRequestError(
+                f"{self.source_name} временно отключен после серии ошибок, "
+                f"пробный запрос после {breaker.retry_at()}"
+            )
 
-        current_time = time.time()
-        time_since_last = current_time - self._last_request_time
-        if time_since_last < 1.0:
-            time.sleep(1.0 - time_since_last)
+        attempts = max(1, config.MAX_RETRIES)
+        for attempt in range(attempts):
+            try:
+                data = self._request_once(url, params)
+            except RateLimitTimeout:
+                # Провайдер не виноват, что лимит исчерпан: breaker не трогаем
+                raise
+            except _TransientApiError as e:
+                delay = random.uniform(0, config.RETRY_DELAY * 2 ** attempt)
+                out_of_time = (self.deadline is not None
+                               and time.monotonic() + delay > self.deadline)
+                if attempt + 1 < attempts and not out_of_time:
+                    self._log(f"   {e.reason}, повтор через {delay:.1f} с "
+                              f"(попытка {attempt + 2}/{attempts})")
+                    time.sleep(delay)
+                    continue
+                breaker.record_failure(e.reason)
+                raise
+            except ApiRequestError as e:
+                breaker.record_failure(e.reason)
+                raise
+
+            breaker.record_success()
+            return data
+
+    def _request_once(self, url: str, params: Optional[Dict] = None) -> Dict[str, Any]:
+        cache_key = HttpCache.key(url, params)
+        cached = self._cache.get(cache_key)
+        if cached is not None and is_fresh(cached):
+            self._log(f"   {self.source_name}: ответ из кеша (max-age)")
+            return cached["body"]
+
+        self._limiter.acquire(self.deadline)
 
         headers = {
             "User-Agent": "ValutaTradeHub/1.0",
             "Accept": "application/json"
         }
+        if cached is not None:
+            headers.update(conditional_headers(cached))
 
         try:
             response = self._session.get(
                 url,
                 params=params,
                 headers=headers,
-                timeout=config.REQUEST_TIMEOUT
+                timeout=self.timeout
             )
-            response.raise_for_status()
+            if response.status_code == 304 and cached is not None:
+                self._cache.put(cache_key, revalidated(cached, response.headers))
+                self._log(f"   {self.source_name}: данные не изменились (304)")
+                return cached["body"]
 
-            self._last_request_time = time.time()
-            self._request_count += 1
+            response.raise_for_status()
 
-            return response.json()
+            data = response.json()
 
         except requests.exceptions.Timeout:
-            raise ApiRequestError(f"Таймаут при запросе к {self.source_name}")
+            raise _TransientApiError(f"Таймаут при запросе к {self.source_name}")
         except requests.exceptions.ConnectionError:
-            raise ApiRequestError(f"Ошибка соединения с {self.source_name}")
+            raise _TransientApiError(f"Ошибка соединения с {self.source_name}")
         except requests.exceptions.HTTPError as e:
             status_code = e.response.status_code
             if status_code == 429:
-                raise ApiRequestError(f"Превышен лимит запросов к {self.source_name}")
+                self._limiter.drain()
+                raise _TransientApiError(
+                    f"Превышен лимит запросов к {self.source_name}"
+                )
+            elif status_code >= 500:
+                raise _TransientApiError(f"HTTP ошибка {status_code}")
             elif status_code == 401:
                 raise ApiRequestError(f"Неверный API ключ для {self.source_name}")
             else:
@@ -68,6 +142,16 @@ class BaseApiClient(ABC):
         except Exception as e:
                 raise ApiRequestError(f"Неизвестная ошибка: {e}")
 
+        self._check_payload(data)
+        entry = cache_entry(response.headers, data)
+        if entry is not None:
+            self._cache.put(cache_key, entry)
+        return data
+
+
+class _TransientApiError(ApiRequestError):
+    """Временная ошибка источника, после которой запрос стоит повторить"""
+
 
 class CoinGeckoClient(BaseApiClient):
     """Клиент для CoinGecko API (криптовалюты)"""
@@ -86,7 +170,7 @@ class CoinGeckoClient(BaseApiClient):
             "vs_currencies": "usd"
         }
 
-        print(f"Запрос к CoinGecko: {config.CRYPTO_CURRENCIES}")
+        self._log(f"Запрос к CoinGecko: {config.CRYPTO_CURRENCIES}")
 
         data = self._make_request(config.COINGECKO_URL, params)
 
@@ -117,16 +201,18 @@ class ExchangeRateApiClient(BaseApiClient):
                 "Добавьте EXCHANGERATE_API_KEY в .env файл или переменные окружения."
             )
 
+    def _check_payload(self, data: Any) -> None:
+        """Ошибки API (неверный ключ, квота) приходят с кодом 200 в поле result"""
+        if data.get("result") != "success":
+            raise ApiRequestError(f"Ошибка: {data.get("error-type", "unknown")}")
+
     def fetch_rates(self) -> Dict[str, Any]:
         """Получить курсы фиатных валют от ExchangeRate-API"""
 
-        print(f"Запрос к ExchangeRate-API: {config.FIAT_CURRENCIES}")
+        self._log(f"Запрос к ExchangeRate-API: {config.FIAT_CURRENCIES}")
 
         data = self._make_request(config.EXCHANGERATE_API_FULL_URL)
 
-        if data.get("result") != "success":
-            raise ApiRequestError(f"Ошибка: {data.get("error-type", "unknown")}")
-
         standardized_rates = {}
         all_rates = data.get("conversion_rates", {})
 
@@ -160,7 +246,7 @@ class FallbackClient(BaseApiClient):
     def fetch_rates(self) -> Dict[str, Any]:
         """Возвращает фиксированные курсы для демонстрации"""
 
-        print("Используются фиксированные курсы (Fallback режим)")
+        self._log("Используются фиксированные курсы (Fallback режим)")
 
 
         fixed_rates = {
@@ -0,0 +1,110 @@
+"""
+Circuit breaker источников курсов
+closed - запросы идут как обычно. После BREAKER_FAILURE_THRESHOLD неудачных
+опросов подряд источник переходит в open и пропускается сразу, без сетевых
+запросов. Через BREAKER_RESET_TIMEOUT разрешается одна пробная попытка
+(half_open): успех закрывает breaker, ошибка снова открывает. Состояние
+хранится в breakers.json и общее для всех процессов
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional
+from .config import config
+from ..infra.database import DatabaseManager
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Breaker одного источника; состояние читается и пишется под блокировкой"""
+
+    def __init__(self, source: str):
+        self.source = source
+
+    def allow(self) -> bool:
+        """Можно ли обращаться к источнику сейчас"""
+        db = DatabaseManager()
+        with db.breakers_lock():
+            breakers = db.get_breakers()
+            state = breakers.get(self.source, {})
+            # В open ждем срок до пробной попытки, в half_open - пока идет
+            # чужая пробная попытка (если процесс с ней упал, срок истечет)
+            retry_at = _retry_at(state)
+            if retry_at is None:
+                return True
+            if _now() < retry_at:
+                return False
+
+            state.update(state=HALF_OPEN, trial_at=_iso(_now()))
+            breakers[self.source] = state
+            db.save_breakers(breakers)
+            return True
+
+    def record_success(self) -> None:
+        db = DatabaseManager()
+        with db.breakers_lock():
+            breakers = db.get_breakers()
+            state = breakers.get(self.source)
+            if state is not None and not state.get("failures") \
+                    and state.get("state") == CLOSED:
+                # Успех после успеха не переписывает файл при каждом опросе
+                return
+            state = state or {}
+            breakers[self.source] = {
+                "state": CLOSED,
+                "failures": 0,
+                "last_success": _iso(_now()),
+                "last_error": state.get("last_error"),
+            }
+            db.save_breakers(breakers)
+
+    def record_failure(self, error: str) -> None:
+        db = DatabaseManager()
+        with db.breakers_lock():
+            breakers = db.get_breakers()
+            state = breakers.get(self.source, {})
+            failures = state.get("failures", 0) + 1
+            state.update(failures=failures, last_error=error,
+                         last_failure=_iso(_now()))
+            if (state.get("state") == HALF_OPEN
+                    or failures >= config.BREAKER_FAILURE_THRESHOLD):
+                state.update(state=OPEN, opened_at=_iso(_now()), trial_at=None)
+            else:
+                state.setdefault("state", CLOSED)
+            breakers[self.source] = state
+            db.save_breakers(breakers)
+
+    def retry_at(self) -> Optional[str]:
+        """Время, после которого будет разрешена пробная попытка"""
+        retry_at = _retry_at(DatabaseManager().get_breakers().get(self.source, {}))
+        return _iso(retry_at) if retry_at else None
+
+
+def breaker_states() -> Dict[str, Dict[str, Any]]:
+    """Состояние breaker'ов всех источников (для parser-status)"""
+    breakers = DatabaseManager().get_breakers()
+    for state in breakers.values():
+        retry_at = _retry_at(state)
+        state["retry_at"] = _iso(retry_at) if retry_at else None
+    return breakers
+
+
+def _retry_at(state: Dict[str, Any]) -> Optional[datetime]:
+    """Срок пробной попытки или None, если breaker закрыт"""
+    since = state.get("trial_at") or state.get("opened_at")
+    if state.get("state", CLOSED) == CLOSED or not since:
+        return None
+    return datetime.fromisoformat(since) + timedelta(
+        seconds=config.BREAKER_RESET_TIMEOUT
+    )
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _iso(moment: datetime) -> str:
+    return moment.isoformat(timespec="seconds")
+
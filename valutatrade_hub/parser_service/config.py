@@ -4,10 +4,7 @@
 
 import os
 from dataclasses import dataclass, field
-from typing import Dict, Tuple
-from dotenv import load_dotenv
-
-load_dotenv()
+from typing import Dict, Optional, Tuple
 
 
 class DataSource:
@@ -18,8 +15,6 @@ class DataSource:
 
 @dataclass
 class ParserConfig:
-    EXCHANGERATE_API_KEY: str = os.getenv("EXCHANGERATE_API_KEY", "")
-
     COINGECKO_URL: str = "https://api.coingecko.com/api/v3/simple/price"
     EXCHANGERATE_API_URL: str = "https://v6.exchangerate-api.com/v6"
 
@@ -35,22 +30,63 @@ class ParserConfig:
     })
 
     RATES_FILE_PATH: str = "data/rates.json"
-    HISTORY_FILE_PATH: str = "data/exchange_rates.json"
+    HISTORY_FILE_PATH: str = "data/exchange_rates.json"  # старый формат, импорт
+    HISTORY_DIR: str = "data/history"
+    # Ответы API с валидаторами ETag/Last-Modified для условных запросов
+    HTTP_CACHE_DIR: str = "data/http_cache"
 
     REQUEST_TIMEOUT: int = 15
+    # Общий лимит времени на опрос одного источника при обновлении
+    SOURCE_TIMEOUT: int = 20
+    # Всего попыток запроса при временных ошибках (сеть, таймаут, 429, 5xx)
+    # и база экспоненциальной задержки между ними, сек
     MAX_RETRIES: int = 3
     RETRY_DELAY: int = 2
-
-    UPDATE_INTERVAL: int = 3600
+    # Лимит запросов к провайдеру, общий для всех процессов: токенов в
+    # секунду и размер всплеска (емкость корзины)
+    RATE_LIMITS: Dict[str, Tuple[float, int]] = field(default_factory=lambda: {
+        DataSource.COINGECKO: (0.5, 3),
+        DataSource.EXCHANGERATE_API: (1.0, 3),
+    })
+    # Circuit breaker: неудачных опросов подряд до отключения источника и
+    # время, через которое разрешается пробный запрос, сек
+    BREAKER_FAILURE_THRESHOLD: int = 3
+    BREAKER_RESET_TIMEOUT: int = 300
+
+    # Интервалы планировщика по источникам, доля случайного разброса
+    # интервала и пауза перед повтором после неудачного обновления, сек
+    CRYPTO_UPDATE_INTERVAL: int = 600
+    FIAT_UPDATE_INTERVAL: int = 3600
+    SCHEDULER_JITTER: float = 0.1
+    SCHEDULER_RETRY_DELAY: int = 300
     CACHE_TTL: int = 900
 
-    def __post_init__(self):
-        if not self.EXCHANGERATE_API_KEY:
-            print("ВНИМАНИЕ: EXCHANGERATE_API_KEY не найден.")
-            print("Создайте файл .env с EXCHANGERATE_API_KEY=ваш_ключ")
-            print("Будет использован Fallback режим")
-
-        self.EXCHANGERATE_API_FULL_URL = (
+    # Фоновый процесс планировщика: pid-файл, Unix-сокет для команд и
+    # чтения курсов, журнал вывода
+    DAEMON_PID_FILE: str = "data/parser.pid"
+    DAEMON_SOCKET_PATH: str = "data/parser.sock"
+    DAEMON_LOG_FILE: str = "logs/parser_daemon.log"
+    DAEMON_START_TIMEOUT: int = 10
+
+    _api_key: Optional[str] = field(default=None, init=False, repr=False)
+
+    @property
+    def EXCHANGERATE_API_KEY(self) -> str:
+        """Ключ ExchangeRate-API из окружения или .env (читается при обращении)"""
+        if self._api_key is None:
+            from dotenv import load_dotenv
+
+            load_dotenv()
+            self._api_key = os.getenv("EXCHANGERATE_API_KEY", "")
+            if not self._api_key:
+                print("ВНИМАНИЕ: EXCHANGERATE_API_KEY не найден.")
+                print("Создайте файл .env с EXCHANGERATE_API_KEY=ваш_ключ")
+                print("Будет использован Fallback режим")
+        return self._api_key
+
+    @property
+    def EXCHANGERATE_API_FULL_URL(self) -> str:
+        return (
             f"{self.EXCHANGERATE_API_URL}/"
             f"{self.EXCHANGERATE_API_KEY}/latest/{self.BASE_CURRENCY}"
         )
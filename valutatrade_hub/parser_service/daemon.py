@@ -0,0 +1,327 @@
+"""
+Фоновый процесс Parser Service
+start-scheduler запускает отдельный процесс в новой сессии, без терминала.
+Процесс держит pid-файл под fcntl-блокировкой (после аварийного завершения
+ее снимает ядро), выполняет планировщик и принимает команды по Unix-сокету:
+одна JSON-строка запроса, одна строка ответа. Курсы из rates.json и матрица
+кросс-курсов держатся в памяти процесса и пересчитываются сразу после смены
+файла, поэтому чтение курсов другими процессами не обращается к диску
+"""
+
+import fcntl
+import json
+import os
+import signal
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+from .config import config
+from ..core.exceptions import (
+    ApiRequestError, CurrencyNotFoundError, ParserDaemonError
+)
+from ..infra.database import DatabaseManager
+
+MODULE = "valutatrade_hub.parser_service.daemon"
+REQUEST_TIMEOUT = 5.0
+MAX_REQUEST_BYTES = 65536
+# Ошибки команд, которые возвращаются клиенту текстом
+COMMAND_ERRORS = (ApiRequestError, CurrencyNotFoundError, ParserDaemonError,
+                  ValueError, KeyError)
+
+
+class ParserDaemon:
+    """Процесс с планировщиком и сервером команд на Unix-сокете"""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.requests = 0
+        self._server: Optional[_CommandServer] = None
+        self._pid_fd: Optional[int] = None
+        self._rates: Optional[Tuple[Tuple, Dict]] = None
+        self._commands: Dict[str, Callable[[Dict], Any]] = {
+            "ping": self._ping,
+            "status": self._status,
+            "rates": self._get_rates,
+            "rate": self._get_rate,
+            "stop": self._stop,
+        }
+
+    def run(self) -> None:
+        """Обслуживать команды до stop-scheduler или SIGTERM"""
+        from .scheduler import scheduler
+
+        self._pid_fd = _lock_pidfile()
+        try:
+            socket_path = config.DAEMON_SOCKET_PATH
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+            self._server = _CommandServer(socket_path, self)
+            os.chmod(socket_path, 0o600)
+
+            signal.signal(signal.SIGTERM, self._on_signal)
+            signal.signal(signal.SIGINT, self._on_signal)
+
+            self.warm()
+            scheduler.start()
+            print(f"Фоновый процесс запущен (PID {os.getpid()}), "
+                  f"сокет {socket_path}")
+            self._server.serve_forever(poll_interval=0.5)
+        finally:
+            if scheduler.is_running:
+                scheduler.stop()
+            if self._server is not None:
+                self._server.server_close()
+                _unlink(config.DAEMON_SOCKET_PATH)
+            print("Фоновый процесс завершен")
+            _unlink(config.DAEMON_PID_FILE)
+            os.close(self._pid_fd)
+
+    def warm(self) -> None:
+        """Перечитать курсы и матрицу, если rates.json изменился"""
+        from ..core.rate_engine import RateEngine
+
+        db = DatabaseManager()
+        signature = db.rates_signature()
+        if self._rates is None or self._rates[0] != signature:
+            data = db.get_rates()
+            self._rates = (signature, {"last_refresh": data.get("last_refresh"),
+                                       "pairs": data.get("pairs", {})})
+        try:
+            RateEngine().matrix()
+        except ApiRequestError:
+            pass
+
+    def dispatch(self, line: bytes) -> Dict[str, Any]:
+        self.requests += 1
+        try:
+            request = json.loads(line)
+            command = self._commands.get(request.get("command"))
+            if command is None:
+                raise ParserDaemonError(
+                    f"неизвестная команда {request.get('command')!r}"
+                )
+            return {"ok": True, "result": command(request)}
+        except json.JSONDecodeError:
+            return {"ok": False, "error": "Некорректный JSON запроса"}
+        except COMMAND_ERRORS as e:
+            return {"ok": False, "error": str(e)}
+        except Exception as e:
+            return {"ok": False, "error": f"Внутренняя ошибка: {e}"}
+
+    def shutdown(self) -> None:
+        # serve_forever ждет shutdown() из другого потока
+        if self._server is not None:
+            threading.Thread(target=self._server.shutdown, daemon=True).start()
+
+    def _on_signal(self, signum: int, frame: Any) -> None:
+        self.shutdown()
+
+    def _ping(self, request: Dict) -> Dict[str, Any]:
+        return {"pid": os.getpid()}
+
+    def _status(self, request: Dict) -> Dict[str, Any]:
+        from .scheduler import scheduler
+
+        status = scheduler.status()
+        self.warm()
+        return {
+            "pid": os.getpid(),
+            "uptime": time.time() - self.started_at,
+            "requests": self.requests,
+            "pairs": len(self._rates[1]["pairs"]),
+            "last_refresh": self._rates[1]["last_refresh"],
+            "scheduler": {key: status[key] for key in
+                          ("is_running", "thread_alive", "next_run", "jobs")},
+        }
+
+    def _get_rates(self, request: Dict) -> Dict[str, Any]:
+        self.warm()
+        return self._rates[1]
+
+    def _get_rate(self, request: Dict) -> Dict[str, Any]:
+        from ..core.rate_engine import RateEngine
+        from ..core.utils import validate_currency_code
+
+        from_code = validate_currency_code(request.get("from", ""))
+        to_code = validate_currency_code(request.get("to", ""))
+        cross = RateEngine().get(from_code, to_code)
+        return {
+            "from": from_code,
+            "to": to_code,
+            "rate": cross.rate,
+            "path": list(cross.path),
+            "updated_at": cross.updated_at,
+            "estimated": cross.estimated,
+            "stale": from_code != to_code and cross.is_stale(),
+        }
+
+    def _stop(self, request: Dict) -> Dict[str, Any]:
+        self.shutdown()
+        return {"pid": os.getpid()}
+
+
+class _CommandHandler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        line = self.rfile.readline(MAX_REQUEST_BYTES)
+        if not line:
+            return
+        response = self.server.parser.dispatch(line)
+        self.wfile.write(json.dumps(response, ensure_ascii=False).encode() + b"\n")
+
+
+class _CommandServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: str, parser: ParserDaemon):
+        self.parser = parser
+        super().__init__(path, _CommandHandler)
+
+    def service_actions(self) -> None:
+        # Между запросами (раз в poll_interval): курсы прогреваются сразу
+        # после обновления, а не при первом чтении
+        self.parser.warm()
+
+
+def request(command: str, **params: Any) -> Any:
+    """Выполнить команду фонового процесса и вернуть ее результат"""
+    if not hasattr(socket, "AF_UNIX"):
+        raise ParserDaemonError("Unix-сокеты не поддерживаются в этой системе")
+
+    payload = json.dumps({"command": command, **params}).encode() + b"\n"
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(REQUEST_TIMEOUT)
+            sock.connect(config.DAEMON_SOCKET_PATH)
+            sock.sendall(payload)
+            with sock.makefile("rb") as reader:
+                reply = reader.readline()
+    except (FileNotFoundError, ConnectionRefusedError):
+        raise ParserDaemonError("не запущен")
+    except OSError as e:
+        raise ParserDaemonError(f"нет ответа: {e}")
+
+    if not reply:
+        raise ParserDaemonError("соединение закрыто без ответа")
+    response = json.loads(reply)
+    if not response["ok"]:
+        raise ParserDaemonError(response["error"])
+    return response["result"]
+
+
+def running_pid() -> Optional[int]:
+    """PID работающего фонового процесса (pid-файл занят его блокировкой)"""
+    try:
+        fd = os.open(config.DAEMON_PID_FILE, os.O_RDONLY)
+    except FileNotFoundError:
+        return None
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return _read_pid(fd)
+    else:
+        # Блокировку никто не держит: pid-файл остался от упавшего процесса
+        return None
+    finally:
+        os.close(fd)
+
+
+def start_daemon() -> int:
+    """Запустить фоновый процесс и дождаться ответа на сокете; вернуть PID"""
+    pid = running_pid()
+    if pid is not None:
+        raise ParserDaemonError(f"уже запущен (PID {pid})")
+
+    log_path = config.DAEMON_LOG_FILE
+    os.makedirs(os.path.dirname(log_path) or ".", exist_ok=True)
+    with open(log_path, "ab") as log:
+        process = subprocess.Popen(
+            [sys.executable, "-m", MODULE],
+            stdin=subprocess.DEVNULL,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+            start_new_session=True,
+        )
+
+    deadline = time.monotonic() + config.DAEMON_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise ParserDaemonError(
+                f"процесс завершился с кодом {process.returncode}, см. {log_path}"
+            )
+        try:
+            return request("ping")["pid"]
+        except ParserDaemonError:
+            time.sleep(0.05)
+    raise ParserDaemonError(
+        f"не ответил за {config.DAEMON_START_TIMEOUT} с, см. {log_path}"
+    )
+
+
+def stop_daemon() -> int:
+    """Остановить фоновый процесс и дождаться его завершения; вернуть PID"""
+    pid = running_pid()
+    if pid is None:
+        raise ParserDaemonError("не запущен")
+
+    try:
+        request("stop")
+    except ParserDaemonError:
+        # Сокет не отвечает: процесс завершится по сигналу
+        os.kill(pid, signal.SIGTERM)
+
+    # Блокировка pid-файла снимается последним действием процесса; текущее
+    # обновление курсов scheduler.stop() ждет до 5 с
+    deadline = time.monotonic() + config.DAEMON_START_TIMEOUT
+    while running_pid() == pid:
+        if time.monotonic() > deadline:
+            raise ParserDaemonError(
+                f"процесс {pid} не завершился за {config.DAEMON_START_TIMEOUT} с"
+            )
+        time.sleep(0.05)
+    return pid
+
+
+def _read_pid(fd: int) -> Optional[int]:
+    try:
+        return int(os.pread(fd, 32, 0).decode().strip())
+    except ValueError:
+        return None
+
+
+def _lock_pidfile() -> int:
+    """Занять pid-файл и записать в него PID; дескриптор держится до выхода"""
+    fd = os.open(config.DAEMON_PID_FILE, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        pid = _read_pid(fd)
+        os.close(fd)
+        raise ParserDaemonError(f"уже запущен (PID {pid})")
+    os.ftruncate(fd, 0)
+    os.pwrite(fd, f"{os.getpid()}\n".encode(), 0)
+    return fd
+
+
+def _unlink(path: str) -> None:
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def main() -> int:
+    sys.stdout.reconfigure(line_buffering=True)
+    try:
+        ParserDaemon().run()
+    except ParserDaemonError as e:
+        print(e)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,516 @@
+"""
+Хранилище истории курсов: один сегмент на пару и сутки (UTC)
+Сегмент - бинарный файл записей фиксированной ширины
+(timestamp в микросекундах, курс, id источника), отсортированных по времени.
+Рядом лежит небольшой index.json с границами сегментов для поиска по времени
+и агрегаты OHLC (1m, 1h, 1d), которые обновляются при каждой записи точки
+"""
+
+import json
+import mmap
+import os
+import tempfile
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from struct import Struct
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from ..infra.locking import FileLock
+
+RECORD = Struct("<qdH")
+
+# Начало интервала, время открытия и закрытия, open, high, low, close, count
+BUCKET = Struct("<qqqddddI")
+
+DAY = 86400 * 1_000_000
+
+RESOLUTIONS: Dict[str, int] = {
+    "1m": 60 * 1_000_000,
+    "1h": 3600 * 1_000_000,
+    "1d": DAY,
+}
+
+
+def parse_timestamp(value: str) -> datetime:
+    """Разобрать ISO-время из API/кеша (в т.ч. вида '...+00:00Z') в UTC"""
+    value = value.strip()
+    if value.endswith("Z"):
+        value = value[:-1]
+        if "+" not in value[10:] and "-" not in value[10:]:
+            value += "+00:00"
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+def to_micros(moment: datetime) -> int:
+    """Перевести время в микросекунды Unix-эпохи"""
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    delta = moment - datetime(1970, 1, 1, tzinfo=timezone.utc)
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+def from_micros(ts: int) -> datetime:
+    """Перевести микросекунды Unix-эпохи во время UTC"""
+    return datetime.fromtimestamp(ts / 1_000_000, tz=timezone.utc)
+
+
+def day_key(ts: int) -> str:
+    """Имя суточного сегмента для метки времени"""
+    return from_micros(ts).strftime("%Y-%m-%d")
+
+
+def bisect_records(buffer: Any, count: int, ts: int, right: bool = False,
+                   layout: Struct = RECORD) -> int:
+    """Бинарный поиск позиции метки времени среди записей файла"""
+    lo, hi = 0, count
+    while lo < hi:
+        mid = (lo + hi) // 2
+        mid_ts = layout.unpack_from(buffer, mid * layout.size)[0]
+        if mid_ts < ts or (right and mid_ts == ts):
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+@contextmanager
+def open_records(path: Path, layout: Struct = RECORD) -> Iterator[Tuple[Any, int]]:
+    """Отобразить файл записей в память: (буфер, число целых записей)"""
+    try:
+        f = open(path, "rb")
+    except FileNotFoundError:
+        yield b"", 0
+        return
+
+    with f:
+        count = os.fstat(f.fileno()).st_size // layout.size
+        if count == 0:
+            yield b"", 0
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            yield buffer, count
+
+
+def trim_torn_tail(path: Path, layout: Struct = RECORD) -> int:
+    """Отбросить недописанную запись в конце файла. Возвращает число записей"""
+    try:
+        size = path.stat().st_size
+    except FileNotFoundError:
+        return 0
+    if size % layout.size:
+        with open(path, "r+b") as f:
+            f.truncate(size - size % layout.size)
+    return size // layout.size
+
+
+def atomic_write_bytes(path: Path, data: bytes) -> None:
+    temp_fd, temp_path = tempfile.mkstemp(
+        dir=path.parent,
+        prefix=f".{path.name}.",
+        suffix=".tmp"
+    )
+    try:
+        with os.fdopen(temp_fd, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except Exception:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+class RollupStore:
+    """
+    Агрегаты OHLC пары по интервалам 1m, 1h, 1d
+    Файл <PAIR>/<интервал>.ohlc отсортирован по началу интервала, поэтому
+    точка в текущий интервал обновляет последнюю запись на месте
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+
+    def path(self, pair: str, resolution: str) -> Path:
+        return self.root / pair / f"{resolution}.ohlc"
+
+    def exists(self, pair: str) -> bool:
+        return all(self.path(pair, res).exists() for res in RESOLUTIONS)
+
+    def add_point(self, pair: str, ts: int, rate: float) -> None:
+        """Учесть точку во всех интервалах (вызывается под блокировкой пары)"""
+        for resolution, width in RESOLUTIONS.items():
+            self._update(self.path(pair, resolution), ts - ts % width, ts, rate)
+
+    def query(self, pair: str, resolution: str, start: Optional[int] = None,
+              end: Optional[int] = None,
+              limit: Optional[int] = None) -> Iterator[Tuple]:
+        """Интервалы OHLC, начало которых лежит в [start, end]"""
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"Неизвестный интервал '{resolution}'. "
+                             f"Доступны: {', '.join(RESOLUTIONS)}")
+
+        with open_records(self.path(pair, resolution), BUCKET) as (buffer, count):
+            position = 0
+            if start is not None:
+                width = RESOLUTIONS[resolution]
+                position = bisect_records(buffer, count, start - start % width,
+                                          layout=BUCKET)
+            emitted = 0
+            for offset in range(position * BUCKET.size, count * BUCKET.size,
+                                BUCKET.size):
+                bucket = BUCKET.unpack_from(buffer, offset)
+                if end is not None and bucket[0] > end:
+                    return
+                yield bucket
+                emitted += 1
+                if limit is not None and emitted >= limit:
+                    return
+
+    def rebuild(self, pair: str,
+                records: Iterator[Tuple[int, float, int]]) -> None:
+        """Пересчитать все агрегаты пары по сырым точкам"""
+        buckets: Dict[str, Dict[int, Tuple]] = {res: {} for res in RESOLUTIONS}
+        for ts, rate, _ in records:
+            for resolution, width in RESOLUTIONS.items():
+                start = ts - ts % width
+                bucket = buckets[resolution].get(start)
+                buckets[resolution][start] = (
+                    self._merge(bucket, ts, rate) if bucket
+                    else self._new_bucket(start, ts, rate)
+                )
+
+        for resolution, by_start in buckets.items():
+            data = b"".join(BUCKET.pack(*by_start[start])
+                            for start in sorted(by_start))
+            atomic_write_bytes(self.path(pair, resolution), data)
+
+    def trim(self, pair: str, resolution: str, cutoff: int) -> Tuple[int, int]:
+        """Удалить интервалы, закончившиеся до cutoff. Возвращает (число, байты)"""
+        path = self.path(pair, resolution)
+        width = RESOLUTIONS[resolution]
+        trim_torn_tail(path, BUCKET)
+
+        with open_records(path, BUCKET) as (buffer, count):
+            position = bisect_records(buffer, count, cutoff - width + 1,
+                                      layout=BUCKET)
+            if position == 0:
+                return 0, 0
+            remaining = bytes(buffer[position * BUCKET.size:count * BUCKET.size])
+
+        atomic_write_bytes(path, remaining)
+        return position, position * BUCKET.size
+
+    def _update(self, path: Path, start: int, ts: int, rate: float) -> None:
+        count = trim_torn_tail(path, BUCKET)
+
+        if count:
+            with open(path, "r+b") as f:
+                f.seek((count - 1) * BUCKET.size)
+                last = BUCKET.unpack(f.read(BUCKET.size))
+                if last[0] == start:
+                    f.seek((count - 1) * BUCKET.size)
+                    f.write(BUCKET.pack(*self._merge(last, ts, rate)))
+                    return
+                if last[0] < start:
+                    f.seek(0, os.SEEK_END)
+                    f.write(BUCKET.pack(*self._new_bucket(start, ts, rate)))
+                    return
+            self._update_past(path, count, start, ts, rate)
+        else:
+            with open(path, "ab") as f:
+                f.write(BUCKET.pack(*self._new_bucket(start, ts, rate)))
+
+    def _update_past(self, path: Path, count: int, start: int, ts: int,
+                     rate: float) -> None:
+        """Точка в прошлый интервал: обновить его на месте или вставить новый"""
+        data = path.read_bytes()[:count * BUCKET.size]
+        position = bisect_records(data, count, start, layout=BUCKET)
+        offset = position * BUCKET.size
+
+        if position < count and BUCKET.unpack_from(data, offset)[0] == start:
+            bucket = self._merge(BUCKET.unpack_from(data, offset), ts, rate)
+            with open(path, "r+b") as f:
+                f.seek(offset)
+                f.write(BUCKET.pack(*bucket))
+        else:
+            record = BUCKET.pack(*self._new_bucket(start, ts, rate))
+            atomic_write_bytes(path, data[:offset] + record + data[offset:])
+
+    @staticmethod
+    def _new_bucket(start: int, ts: int, rate: float) -> Tuple:
+        return (start, ts, ts, rate, rate, rate, rate, 1)
+
+    @staticmethod
+    def _merge(bucket: Tuple, ts: int, rate: float) -> Tuple:
+        start, open_ts, close_ts, open_, high, low, close, count = bucket
+        if ts < open_ts:
+            open_ts, open_ = ts, rate
+        if ts >= close_ts:
+            close_ts, close = ts, rate
+        return (start, open_ts, close_ts, open_, max(high, rate),
+                min(low, rate), close, count + 1)
+
+
+class HistoryStore:
+    """Append-only хранилище истории курсов по парам и суткам"""
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+        self.rollups = RollupStore(self.root)
+        self._sources: Optional[Dict[str, int]] = None
+
+    def pairs(self) -> List[str]:
+        """Список пар, для которых есть история"""
+        if not self.root.exists():
+            return []
+        return sorted(p.name for p in self.root.iterdir()
+                      if p.is_dir() and (p / "index.json").exists())
+
+    def append_batch(self, rates: Dict[str, float], timestamp: str,
+                     source: str) -> int:
+        """Дописать пакет курсов одного источника. Возвращает число записей"""
+        ts = to_micros(parse_timestamp(timestamp))
+        source_id = self.source_id(source)
+
+        count = 0
+        for pair_key, rate in rates.items():
+            if len(pair_key.split("_")) != 2:
+                continue
+            self.append(pair_key, ts, float(rate), source_id)
+            count += 1
+        return count
+
+    def append(self, pair: str, ts: int, rate: float, source_id: int) -> None:
+        """Дописать одну точку; вне порядка - вставка в свой сегмент"""
+        pair_dir = self.root / pair
+        pair_dir.mkdir(parents=True, exist_ok=True)
+
+        with FileLock.for_path(str(pair_dir / "index.json")):
+            index = self.load_index(pair)
+            day = day_key(ts)
+            segment = pair_dir / f"{day}.bin"
+            record = RECORD.pack(ts, rate, source_id)
+            entry = index.get(day)
+
+            if index and not self.rollups.exists(pair):
+                self.rollups.rebuild(pair, self.query(pair))
+
+            if entry is None or ts >= entry["last"]:
+                trim_torn_tail(segment)
+                with open(segment, "ab") as f:
+                    f.write(record)
+            else:
+                self._insert_sorted(segment, ts, record)
+
+            if entry is None:
+                entry = {"first": ts, "last": ts, "count": 0}
+            entry["first"] = min(entry["first"], ts)
+            entry["last"] = max(entry["last"], ts)
+            entry["count"] += 1
+            index[day] = entry
+
+            self._save_index(pair, index)
+            self.rollups.add_point(pair, ts, rate)
+
+    def load_index(self, pair: str) -> Dict[str, Dict[str, int]]:
+        """Индекс сегментов пары: сутки -> first/last/count"""
+        path = self.root / pair / "index.json"
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def segment_path(self, pair: str, day: str) -> Path:
+        return self.root / pair / f"{day}.bin"
+
+    def read_segment(self, pair: str, day: str) -> List[Tuple[int, float, int]]:
+        """Прочитать все записи суточного сегмента"""
+        try:
+            data = self.segment_path(pair, day).read_bytes()
+        except FileNotFoundError:
+            return []
+        usable = len(data) - len(data) % RECORD.size
+        return list(RECORD.iter_unpack(data[:usable]))
+
+    def query(self, pair: str, start: Optional[int] = None,
+              end: Optional[int] = None,
+              limit: Optional[int] = None) -> Iterator[Tuple[int, float, int]]:
+        """Точки пары в интервале [start, end] по возрастанию времени"""
+        index = self.load_index(pair)
+        days = sorted(index)
+        first = bisect_left(days, day_key(start)) if start is not None else 0
+
+        emitted = 0
+        for day in days[first:]:
+            if end is not None and index[day]["first"] > end:
+                break
+            for record in self._scan_segment(pair, day, start, end):
+                yield record
+                emitted += 1
+                if limit is not None and emitted >= limit:
+                    return
+
+    def as_of(self, pair: str, ts: int) -> Optional[Tuple[int, float, int]]:
+        """Последняя точка пары не позже указанного момента"""
+        index = self.load_index(pair)
+        days = sorted(index)
+        position = bisect_right(days, day_key(ts))
+
+        for day in reversed(days[:position]):
+            with self._open_segment(pair, day) as (buffer, count):
+                found = bisect_records(buffer, count, ts, right=True)
+                if found:
+                    return RECORD.unpack_from(buffer, (found - 1) * RECORD.size)
+        return None
+
+    def source_id(self, source: str) -> int:
+        """Числовой id источника (выделяется при первом появлении)"""
+        sources = self.sources()
+        if source in sources:
+            return sources[source]
+
+        path = self.root / "sources.json"
+        with FileLock.for_path(str(path)):
+            self._sources = None
+            sources = self.sources()
+            if source not in sources:
+                sources[source] = max(sources.values(), default=0) + 1
+                self._atomic_write(path, sources)
+            return sources[source]
+
+    def sources(self) -> Dict[str, int]:
+        """Словарь источников: имя -> id"""
+        if self._sources is None:
+            try:
+                with open(self.root / "sources.json", "r", encoding="utf-8") as f:
+                    self._sources = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                self._sources = {}
+        return self._sources
+
+    def source_name(self, source_id: int) -> str:
+        for name, sid in self.sources().items():
+            if sid == source_id:
+                return name
+        return "unknown"
+
+    def import_legacy(self, legacy_path: str) -> int:
+        """Импортировать старый exchange_rates.json (словарь FROM_TO_timestamp)"""
+        try:
+            with open(legacy_path, "r", encoding="utf-8") as f:
+                legacy = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return 0
+
+        points: Dict[str, List[Tuple[int, float, int]]] = {}
+        for record in legacy.values():
+            try:
+                pair = f"{record['from_currency']}_{record['to_currency']}"
+                ts = to_micros(parse_timestamp(record["timestamp"]))
+                rate = float(record["rate"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            source_id = self.source_id(record.get("source", "unknown"))
+            points.setdefault(pair, []).append((ts, rate, source_id))
+
+        imported = 0
+        for pair, pair_points in points.items():
+            # Повторный импорт не создает дублей
+            known = {ts for day in self.load_index(pair)
+                     for ts, _, _ in self.read_segment(pair, day)}
+            for ts, rate, source_id in sorted(pair_points):
+                if ts in known:
+                    continue
+                self.append(pair, ts, rate, source_id)
+                imported += 1
+
+        return imported
+
+    def apply_retention(self, now: int, raw_days: int,
+                        rollup_days: Dict[str, int]) -> Dict[str, int]:
+        """
+        Удалить сырые сегменты и агрегаты старше сроков хранения
+        Сроки в днях, 0 - хранить всегда. Возвращает отчет с числом байт
+        """
+        report = {"segments": 0, "buckets": 0, "bytes": 0}
+
+        for pair in self.pairs():
+            with FileLock.for_path(str(self.root / pair / "index.json")):
+                if raw_days > 0:
+                    cutoff = now - raw_days * DAY
+                    index = self.load_index(pair)
+                    expired = [day for day, entry in index.items()
+                               if entry["last"] < cutoff]
+                    for day in expired:
+                        segment = self.segment_path(pair, day)
+                        try:
+                            report["bytes"] += segment.stat().st_size
+                            segment.unlink()
+                        except FileNotFoundError:
+                            pass
+                        del index[day]
+                        report["segments"] += 1
+                    if expired:
+                        self._save_index(pair, index)
+
+                for resolution, days in rollup_days.items():
+                    if days <= 0:
+                        continue
+                    buckets, size = self.rollups.trim(pair, resolution,
+                                                      now - days * DAY)
+                    report["buckets"] += buckets
+                    report["bytes"] += size
+
+        return report
+
+    def iter_segments(self) -> Iterator[Tuple[str, str, Path]]:
+        """Все сегменты: (пара, сутки, путь)"""
+        for pair in self.pairs():
+            for day in sorted(self.load_index(pair)):
+                yield pair, day, self.segment_path(pair, day)
+
+    def total_size(self) -> int:
+        """Размер хранилища истории в байтах"""
+        if not self.root.exists():
+            return 0
+        return sum(p.stat().st_size for p in self.root.rglob("*") if p.is_file())
+
+    def _scan_segment(self, pair: str, day: str, start: Optional[int],
+                      end: Optional[int]) -> Iterator[Tuple[int, float, int]]:
+        """Прочитать записи сегмента в интервале, начиная с бинарного поиска"""
+        with self._open_segment(pair, day) as (buffer, count):
+            position = (bisect_records(buffer, count, start)
+                        if start is not None else 0)
+            for offset in range(position * RECORD.size, count * RECORD.size,
+                                RECORD.size):
+                record = RECORD.unpack_from(buffer, offset)
+                if end is not None and record[0] > end:
+                    return
+                yield record
+
+    def _open_segment(self, pair: str, day: str):
+        return open_records(self.segment_path(pair, day))
+
+    def _insert_sorted(self, segment: Path, ts: int, record: bytes) -> None:
+        """Вставить запись в середину сегмента с сохранением порядка"""
+        data = segment.read_bytes() if segment.exists() else b""
+        data = data[:len(data) - len(data) % RECORD.size]
+
+        position = bisect_records(data, len(data) // RECORD.size, ts, right=True)
+        offset = position * RECORD.size
+        atomic_write_bytes(segment, data[:offset] + record + data[offset:])
+
+    def _save_index(self, pair: str, index: Dict[str, Any]) -> None:
+        self._atomic_write(self.root / pair / "index.json", index)
+
+    @staticmethod
+    def _atomic_write(path: Path, data: Dict[str, Any]) -> None:
+        atomic_write_bytes(
+            path, json.dumps(data, ensure_ascii=False, sort_keys=True).encode()
+        )
@@ -0,0 +1,114 @@
+"""
+Дисковый кеш HTTP-ответов источников курсов
+Для каждого запроса (URL и параметры) хранятся валидаторы ETag и
+Last-Modified, срок свежести из Cache-Control: max-age и уже разобранное
+JSON-тело. Свежий ответ отдается без обращения к сети, устаревший
+перепроверяется условным запросом, и на 304 тело берется из кеша
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+
+class HttpCache:
+    """Файлы <ключ>.json в каталоге кеша, по одному на запрос"""
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+
+    @staticmethod
+    def key(url: str, params: Optional[Dict] = None) -> str:
+        """Ключ запроса (хэш, чтобы ключ API из URL не попадал в имя файла)"""
+        raw = json.dumps([url, sorted((params or {}).items())])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.directory / f"{key}.json", "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def put(self, key: str, entry: Dict[str, Any]) -> None:
+        """Сохранить запись атомарно; ошибка записи не мешает обновлению"""
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix=f".{key}.",
+                                             suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(temp_path, self.directory / f"{key}.json")
+        except OSError:
+            pass
+
+    def stats(self) -> Tuple[int, int]:
+        """Число записей и их суммарный размер в байтах"""
+        if not self.directory.exists():
+            return 0, 0
+        sizes = [path.stat().st_size for path in self.directory.glob("*.json")]
+        return len(sizes), sum(sizes)
+
+
+def cache_entry(headers: Mapping[str, str], body: Any) -> Optional[Dict[str, Any]]:
+    """Запись кеша для ответа 200 или None, если его нельзя или незачем хранить"""
+    storable, lifetime = _freshness(headers)
+    etag = headers.get("ETag")
+    last_modified = headers.get("Last-Modified")
+    if not storable or not (etag or last_modified or lifetime > 0):
+        return None
+    return {
+        "etag": etag,
+        "last_modified": last_modified,
+        "expires_at": time.time() + lifetime,
+        "body": body,
+    }
+
+
+def revalidated(entry: Dict[str, Any], headers: Mapping[str, str]) -> Dict[str, Any]:
+    """Запись после 304: тело прежнее, срок и валидаторы - из нового ответа"""
+    _, lifetime = _freshness(headers)
+    return {
+        **entry,
+        "etag": headers.get("ETag") or entry.get("etag"),
+        "last_modified": headers.get("Last-Modified") or entry.get("last_modified"),
+        "expires_at": time.time() + lifetime,
+    }
+
+
+def is_fresh(entry: Dict[str, Any]) -> bool:
+    return time.time() < entry.get("expires_at", 0)
+
+
+def conditional_headers(entry: Dict[str, Any]) -> Dict[str, str]:
+    """Заголовки условного запроса по сохраненным валидаторам"""
+    headers = {}
+    if entry.get("etag"):
+        headers["If-None-Match"] = entry["etag"]
+    if entry.get("last_modified"):
+        headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+
+def _freshness(headers: Mapping[str, str]) -> Tuple[bool, float]:
+    """(можно ли хранить ответ, сколько секунд он свеж) по Cache-Control и Age"""
+    directives = [item.strip().lower()
+                  for item in headers.get("Cache-Control", "").split(",")]
+    if "no-store" in directives:
+        return False, 0.0
+    if "no-cache" in directives:
+        return True, 0.0
+
+    for directive in directives:
+        name, _, value = directive.partition("=")
+        if name == "max-age":
+            try:
+                age = float(headers.get("Age", 0))
+                return True, max(0.0, float(value.strip('"')) - age)
+            except ValueError:
+                return True, 0.0
+    return True, 0.0
@@ -0,0 +1,75 @@
+"""
+Межпроцессный token bucket для запросов к источникам курсов
+Состояние корзин (токены и время пересчета) хранится в ratelimits.json под
+fcntl-блокировкой, поэтому лимит соблюдают все клиенты всех процессов.
+Запрос, которому не хватило токена, резервирует его (баланс уходит в минус)
+и ждет вне блокировки, так что ожидающие обслуживаются по очереди
+"""
+
+import time
+from typing import Optional, Tuple
+from .config import config
+from ..core.exceptions import ApiRequestError
+from ..infra.database import DatabaseManager
+
+
+class RateLimitTimeout(ApiRequestError):
+    """Токен не освободится до срока запроса"""
+
+
+class TokenBucket:
+    """Корзина провайдера: rate токенов в секунду, не больше burst сразу"""
+
+    def __init__(self, source: str, rate: Optional[float] = None,
+                 burst: Optional[int] = None):
+        default_rate, default_burst = config.RATE_LIMITS.get(source, (1.0, 1))
+        self.source = source
+        self.rate = rate or default_rate
+        self.burst = burst or default_burst
+
+    def acquire(self, deadline: Optional[float] = None) -> float:
+        """
+        Взять токен, при необходимости подождав. Возвращает время ожидания;
+        если ждать пришлось бы дольше срока deadline (time.monotonic()),
+        токен не резервируется и выбрасывается RateLimitTimeout
+        """
+        db = DatabaseManager()
+        with db.rate_limits_lock():
+            buckets = db.get_rate_limits()
+            now = time.time()
+            tokens = self._refill(buckets.get(self.source), now)
+
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+            if deadline is not None and time.monotonic() + wait > deadline:
+                raise RateLimitTimeout(
+                    f"лимит запросов к {self.source} не позволяет уложиться "
+                    f"в срок (ожидание {wait:.1f} с)"
+                )
+
+            buckets[self.source] = {"tokens": tokens - 1, "updated_at": now}
+            db.save_rate_limits(buckets)
+
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def drain(self) -> None:
+        """Обнулить корзину (например, после ответа 429 от провайдера)"""
+        db = DatabaseManager()
+        with db.rate_limits_lock():
+            buckets = db.get_rate_limits()
+            now = time.time()
+            tokens = min(0.0, self._refill(buckets.get(self.source), now))
+            buckets[self.source] = {"tokens": tokens, "updated_at": now}
+            db.save_rate_limits(buckets)
+
+    def state(self) -> Tuple[float, float]:
+        """Текущее число токенов и емкость корзины"""
+        bucket = DatabaseManager().get_rate_limits().get(self.source)
+        return self._refill(bucket, time.time()), float(self.burst)
+
+    def _refill(self, bucket: Optional[dict], now: float) -> float:
+        if bucket is None:
+            return float(self.burst)
+        elapsed = max(0.0, now - bucket["updated_at"])
+        return min(float(self.burst), bucket["tokens"] + elapsed * self.rate)
@@ -1,13 +1,27 @@
 """
 Планировщик для периодического обновления курсов валют
+Задачи (курсы криптовалют, курсы фиатных валют, компакция истории) лежат в
+куче по времени следующего запуска, а поток ждет ближайшую из них на
+_stop_event, поэтому stop() срабатывает сразу. Интервалы размываются
+случайным разбросом, пропущенные запуски (например, пока планировщик был
+остановлен) выполняются один раз сразу. Время запусков хранится в
+scheduler.json
 """
 
+import heapq
+import random
 import time
 import threading
-from typing import Optional
-from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime, timezone
 from .updater import updater
 from .config import config
+from ..infra.database import DatabaseManager
+from ..infra.settings import SettingsLoader
+
+# Задачи обновления курсов и их источники
+JOB_SOURCES = {"crypto": "coingecko", "fiat": "exchangerate"}
+COMPACTION_JOB = "compaction"
 
 
 class Scheduler:
@@ -15,25 +29,39 @@ class Scheduler:
         self._thread: Optional[threading.Thread] = None
         self._stop_event = threading.Event()
         self._is_running = False
+        self._lock = threading.Lock()
+        # Куча (время запуска, задача) и интервалы задач в секундах
+        self._heap: List[Tuple[float, str]] = []
+        self._intervals: Dict[str, float] = {}
+        self._compaction_thread: Optional[threading.Thread] = None
+        self._last_compaction_report: Optional[dict] = None
 
     def start(self, interval: Optional[int] = None) -> None:
+        """Запустить планировщик; interval задает общий интервал обоих источников"""
         if self._is_running:
             print("Планировщик уже запущен")
             return
 
-        update_interval = interval or config.UPDATE_INTERVAL
+        self._intervals = {
+            "crypto": interval or config.CRYPTO_UPDATE_INTERVAL,
+            "fiat": interval or config.FIAT_UPDATE_INTERVAL,
+            COMPACTION_JOB: SettingsLoader().get("history_compaction_interval", 86400),
+        }
+        with self._lock:
+            self._heap = self._initial_heap()
 
         print("=" * 50)
         print("ЗАПУСК ПЛАНИРОВЩИКА")
-        print(f"   Интервал обновления: {update_interval} сек")
-        print(f"   ({update_interval/3600:.1f} ч)")
-        print(f"   Следующее обновление: через {update_interval} сек")
+        print(f"   Криптовалюты: каждые {self._intervals['crypto']} сек")
+        print(f"   Фиатные валюты: каждые {self._intervals['fiat']} сек")
+        print(f"   Разброс интервалов: ±{config.SCHEDULER_JITTER:.0%}")
+        for name, moment in self.next_runs().items():
+            print(f"   {name}: {_format_time(moment)}")
         print("=" * 50)
 
         self._stop_event.clear()
         self._thread = threading.Thread(
             target=self._run_scheduler,
-            args=(update_interval,),
             daemon=True
         )
         self._thread.start()
@@ -50,55 +78,156 @@ class Scheduler:
         self._stop_event.set()
 
         if self._thread:
+            # Ожидание прерывается сразу, дольше ждать можно только
+            # выполняющееся обновление
             self._thread.join(timeout=5)
+            if self._thread.is_alive():
+                print("Текущее обновление завершится в фоне")
 
         self._is_running = False
         print("Планировщик остановлен")
 
-    def _run_scheduler(self, interval: int) -> None:
-        last_update = None
-
+    def _initial_heap(self) -> List[Tuple[float, str]]:
+        """
+        Расписание по последним запускам из scheduler.json: задача, срок
+        которой прошел, выполняется сразу и один раз, сколько бы интервалов
+        ни было пропущено
+        """
+        state = DatabaseManager().get_scheduler_state()
+        now = time.time()
+        heap = []
+        for name, interval in self._intervals.items():
+            last_run = state.get(name, {}).get("last_run")
+            due = now
+            if last_run is not None:
+                due = max(now, _parse_time(last_run) + interval)
+            heap.append((due, name))
+        heapq.heapify(heap)
+        return heap
+
+    def _run_scheduler(self) -> None:
         while not self._stop_event.is_set():
-            try:
-                current_time = datetime.now().strftime("%H:%M:%S")
-
-                should_update = (
-                    last_update is None or
-                    (time.time() - last_update) >= interval or
-                    not updater.storage.is_cache_valid()
-                )
-
-                if should_update:
-                    print(f"\n[{current_time}] Запланированное обновление...")
-                    result = updater.run_update("all")
-
-                    if result["success"]:
-                        last_update = time.time()
-                        next_update = datetime.fromtimestamp(
-                            last_update + interval
-                        ).strftime("%H:%M:%S")
-                        print(f"   Следующее обновление: {next_update}")
-                    else:
-                        print("   Обновление не удалось")
-
-                time.sleep(60)
-
-            except Exception as e:
-                print(f"Ошибка в планировщике: {e}")
-                time.sleep(300)
+            with self._lock:
+                due, name = self._heap[0]
+
+            delay = due - time.time()
+            if delay > 0:
+                self._stop_event.wait(delay)
+                continue
+
+            started = time.time()
+            ok = self._run_job(name)
+
+            interval = self._intervals[name]
+            if not ok:
+                interval = min(interval, config.SCHEDULER_RETRY_DELAY)
+            next_due = started + self._jittered(interval)
+
+            with self._lock:
+                heapq.heapreplace(self._heap, (next_due, name))
+            self._save_state(name, started, next_due, ok)
+
+            if name != COMPACTION_JOB:
+                print(f"   Следующее обновление ({name}): {_format_time(next_due)}")
+
+    def _run_job(self, name: str) -> bool:
+        if name == COMPACTION_JOB:
+            self._start_compaction()
+            return True
+
+        current_time = datetime.now().strftime("%H:%M:%S")
+        print(f"\n[{current_time}] Запланированное обновление ({name})...")
+        try:
+            result = updater.run_update(JOB_SOURCES[name])
+        except Exception as e:
+            print(f"Ошибка в планировщике: {e}")
+            return False
+
+        if not result["success"]:
+            print("   Обновление не удалось")
+        return result["success"]
+
+    def _jittered(self, interval: float) -> float:
+        jitter = config.SCHEDULER_JITTER
+        return interval * (1 + random.uniform(-jitter, jitter))
+
+    def _save_state(self, name: str, started: float, next_due: float,
+                    ok: bool) -> None:
+        db = DatabaseManager()
+        try:
+            with db.scheduler_lock():
+                state = db.get_scheduler_state()
+                state[name] = {
+                    "last_run": _iso(started),
+                    "next_run": _iso(next_due),
+                    "status": "ok" if ok else "error",
+                }
+                db.save_scheduler_state(state)
+        except OSError as e:
+            print(f"Не удалось сохранить состояние планировщика: {e}")
+
+    def _start_compaction(self) -> None:
+        """Компакция истории идет в отдельном потоке и не задерживает обновления"""
+        if self._compaction_thread and self._compaction_thread.is_alive():
+            return
+
+        self._compaction_thread = threading.Thread(
+            target=self._run_compaction,
+            daemon=True
+        )
+        self._compaction_thread.start()
+
+    def _run_compaction(self) -> None:
+        try:
+            report = updater.storage.compact_history()
+            self._last_compaction_report = report
+            print(f"   Компакция истории: освобождено "
+                  f"{report['bytes'] / 1024:.1f} KB "
+                  f"(сегментов: {report['segments']}, "
+                  f"интервалов OHLC: {report['buckets']})")
+        except Exception as e:
+            print(f"Ошибка компакции истории: {e}")
+
+    @property
+    def is_running(self) -> bool:
+        return self._is_running
+
+    def next_runs(self) -> Dict[str, float]:
+        """Запланированное время запуска каждой задачи (timestamp)"""
+        with self._lock:
+            return {name: due for due, name in sorted(self._heap)}
 
     def status(self) -> dict:
         cache_status = updater.get_status()
+        next_runs = self.next_runs() if self._is_running else {}
 
         return {
             "is_running": self._is_running,
             "thread_alive": self._thread.is_alive() if self._thread else False,
             "cache_status": cache_status,
+            "history_compaction": self._last_compaction_report,
+            "next_run": _iso(min(next_runs.values())) if next_runs else None,
+            "jobs": {name: {"interval": self._intervals[name], "next_run": _iso(due)}
+                     for name, due in next_runs.items()},
             "config": {
-                "update_interval": config.UPDATE_INTERVAL,
+                "crypto_interval": config.CRYPTO_UPDATE_INTERVAL,
+                "fiat_interval": config.FIAT_UPDATE_INTERVAL,
+                "jitter": config.SCHEDULER_JITTER,
                 "cache_ttl": config.CACHE_TTL
             }
         }
 
 
+def _iso(moment: float) -> str:
+    return datetime.fromtimestamp(moment, timezone.utc).isoformat(timespec="seconds")
+
+
+def _parse_time(value: str) -> float:
+    return datetime.fromisoformat(value).timestamp()
+
+
+def _format_time(moment: float) -> str:
+    return datetime.fromtimestamp(moment).strftime("%H:%M:%S")
+
+
 scheduler = Scheduler()
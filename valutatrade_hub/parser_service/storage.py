@@ -5,40 +5,55 @@
 import json
 import os
 import tempfile
-from typing import Dict, Any
+from typing import Dict, Any, Iterator, Optional, Union
 from datetime import datetime, timezone
 from pathlib import Path
 from .config import config, DataSource
+from ..infra.database import DatabaseManager
+from ..infra.settings import SettingsLoader
+from .history import (
+    HistoryStore, RESOLUTIONS, from_micros, parse_timestamp, to_micros
+)
 
 
 class RatesStorage:
     def __init__(self):
         self.rates_file = Path(config.RATES_FILE_PATH)
         self.history_file = Path(config.HISTORY_FILE_PATH)
+        self.history_store = HistoryStore(config.HISTORY_DIR)
 
         self.rates_file.parent.mkdir(parents=True, exist_ok=True)
-        self.history_file.parent.mkdir(parents=True, exist_ok=True)
 
-    def save_current_rates(self, rates_data: Dict[str, Any]) -> None:
+    def save_current_rates(self, rates_data: Dict[str, Any],
+                           merge: bool = False) -> None:
+        """
+        Сохранить курсы в rates.json
+        merge - обновить только полученные пары, сохранив остальные (при
+        обновлении части источников). Чтение, слияние и запись идут под
+        блокировкой rates.json, поэтому параллельные обновления из разных
+        процессов не теряют пары друг друга
+        """
         current_time = datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
 
-        pairs = {}
-        for pair_key, rate in rates_data.get("rates", {}).items():
-            pairs[pair_key] = {
-                "rate": float(rate),
-                "updated_at": rates_data.get("timestamp", current_time),
-                "source": rates_data.get("source", DataSource.FALLBACK)
-            }
+        with DatabaseManager().rates_lock():
+            pairs = self.load_current_rates().get("pairs", {}) if merge else {}
+            for pair_key, rate in rates_data.get("rates", {}).items():
+                pairs[pair_key] = {
+                    "rate": float(rate),
+                    "updated_at": rates_data.get("timestamp", current_time),
+                    "source": rates_data.get("source", DataSource.FALLBACK)
+                }
 
-        data = {
-            "pairs": pairs,
-            "last_refresh": current_time,
-            "total_pairs": len(pairs)
-        }
+            data = {
+                "pairs": pairs,
+                "last_refresh": current_time,
+                "total_pairs": len(pairs)
+            }
 
-        self._atomic_write(self.rates_file, data)
+            self._atomic_write(self.rates_file, data)
 
-        print(f"Сохранено {len(pairs)} курсов в {self.rates_file}")
+        saved = len(rates_data.get("rates", {}))
+        print(f"Сохранено {saved} курсов в {self.rates_file}")
 
     def load_current_rates(self) -> Dict[str, Any]:
         if not self.rates_file.exists():
@@ -69,49 +84,89 @@ class RatesStorage:
         if not rates_data.get("rates"):
             return
 
-        history = self._load_history()
-
         timestamp = rates_data.get("timestamp",
                                   datetime.now(timezone.utc).isoformat() + "Z")
         source = rates_data.get("source", DataSource.FALLBACK)
 
-        for pair_key, rate in rates_data["rates"].items():
-            parts = pair_key.split('_')
-            if len(parts) != 2:
-                continue
-
-            from_curr, to_curr = parts
-
-            record_id = f"{from_curr}_{to_curr}_{timestamp}"
-
-            record = {
-                "id": record_id,
-                "from_currency": from_curr,
-                "to_currency": to_curr,
-                "rate": float(rate),
-                "timestamp": timestamp,
-                "source": source,
-                "meta": {
-                    "request_ms": 0,
-                    "status_code": 200
-                }
-            }
+        count = self.history_store.append_batch(rates_data["rates"], timestamp, source)
+
+        print(f"Добавлено в историю: {count} записей")
 
-            history[record_id] = record
+    def import_legacy_history(self) -> int:
+        """Импортировать exchange_rates.json в сегментное хранилище истории"""
+        return self.history_store.import_legacy(str(self.history_file))
 
-        self._atomic_write(self.history_file, history)
+    def compact_history(self) -> Dict[str, Any]:
+        """Применить сроки хранения истории из настроек [tool.valutatrade]"""
+        settings = SettingsLoader()
+        rollup_days = {
+            resolution: int(settings.get(f"history_{resolution}_retention_days", 0))
+            for resolution in RESOLUTIONS
+        }
+        size_before = self.history_store.total_size()
 
-        print(f"Добавлено в историю: {len(rates_data['rates'])} записей")
+        report = self.history_store.apply_retention(
+            to_micros(datetime.now(timezone.utc)),
+            int(settings.get("history_raw_retention_days", 0)),
+            rollup_days
+        )
+        report["size_before"] = size_before
+        report["size_after"] = self.history_store.total_size()
+        # Вместе с данными уменьшаются и индексы сегментов
+        report["bytes"] = max(size_before - report["size_after"], 0)
+        report["finished_at"] = datetime.now(timezone.utc).isoformat()
+        return report
+
+    def history(self, pair: str,
+                start: Optional[Union[str, datetime]] = None,
+                end: Optional[Union[str, datetime]] = None,
+                limit: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """Потоково выдать точки истории пары в интервале времени"""
+        records = self.history_store.query(
+            pair.upper(), self._to_ts(start), self._to_ts(end), limit
+        )
+        for record in records:
+            yield self._history_point(record)
+
+    def as_of(self, pair: str,
+              moment: Union[str, datetime]) -> Optional[Dict[str, Any]]:
+        """Курс пары, действовавший в указанный момент"""
+        record = self.history_store.as_of(pair.upper(), self._to_ts(moment))
+        return self._history_point(record) if record else None
+
+    def ohlc(self, pair: str, resolution: str,
+             start: Optional[Union[str, datetime]] = None,
+             end: Optional[Union[str, datetime]] = None,
+             limit: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """Агрегаты OHLC пары (1m, 1h, 1d), рассчитанные при записи истории"""
+        buckets = self.history_store.rollups.query(
+            pair.upper(), resolution, self._to_ts(start), self._to_ts(end), limit
+        )
+        for start_ts, _, _, open_, high, low, close, count in buckets:
+            yield {
+                "timestamp": from_micros(start_ts).isoformat().replace("+00:00", "Z"),
+                "open": open_,
+                "high": high,
+                "low": low,
+                "close": close,
+                "count": count
+            }
 
-    def _load_history(self) -> Dict[str, Any]:
-        if not self.history_file.exists():
-            return {}
+    def _history_point(self, record) -> Dict[str, Any]:
+        ts, rate, source_id = record
+        return {
+            "timestamp": from_micros(ts).isoformat().replace("+00:00", "Z"),
+            "rate": rate,
+            "source": self.history_store.source_name(source_id)
+        }
 
-        try:
-            with open(self.history_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, IOError):
-            return {}
+    @staticmethod
+    def _to_ts(moment: Optional[Union[str, datetime]]) -> Optional[int]:
+        if moment is None:
+            return None
+        if isinstance(moment, str):
+            moment = parse_timestamp(moment)
+        return to_micros(moment)
 
     def _atomic_write(self, filepath: Path, data: Dict[str, Any]) -> None:
         temp_fd, temp_path = tempfile.mkstemp(
@@ -1,20 +1,39 @@
 """
 Основной модуль обновления курсов валют
+Источники опрашиваются параллельно в пуле потоков, у каждого свой таймаут;
+результаты объединяются по мере готовности, поэтому медленный источник не
+задерживает остальные
 """
 
-from typing import Dict, Any
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
 from datetime import datetime, timezone
 from .config import config
-from .api_clients import get_api_client
 from .storage import RatesStorage
 from ..core.exceptions import ApiRequestError
+from ..infra.database import DatabaseManager
 from ..decorators import log_action
 
 
 class RatesUpdater:
     def __init__(self):
-        self.storage = RatesStorage()
+        self._storage: Optional[RatesStorage] = None
         self._sources_order = ["coingecko", "exchangerate"]
+        self._announced = False
+
+    @property
+    def storage(self) -> RatesStorage:
+        """Хранилище курсов (создается при первом обращении)"""
+        if self._storage is None:
+            self._storage = RatesStorage()
+        return self._storage
+
+    def _announce(self) -> None:
+        """Баннер сервиса - один раз, перед первым обновлением"""
+        if self._announced:
+            return
+        self._announced = True
 
         print("=" * 50)
         print("ИНИЦИАЛИЗАЦИЯ PARSER SERVICE")
@@ -29,6 +48,9 @@ class RatesUpdater:
 
     @log_action
     def run_update(self, source: str = "all") -> Dict[str, Any]:
+        from ..core.orders import trigger_orders
+
+        self._announce()
         print("\n" + "=" * 50)
         print("ЗАПУСК ОБНОВЛЕНИЯ КУРСОВ")
         print(f"   Источник: {source}")
@@ -41,6 +63,7 @@ class RatesUpdater:
             "sources_processed": 0,
             "sources_failed": 0,
             "details": [],
+            "orders": [],
             "timestamp": datetime.now(timezone.utc).isoformat() + "Z"
         }
 
@@ -57,58 +80,70 @@ class RatesUpdater:
             print("API ключ не найден, заменяем exchangerate на fallback")
             sources_to_update[sources_to_update.index("exchangerate")] = "fallback"
 
-        for src in sources_to_update:
-            try:
-                print(f"\nИсточник: {src.upper()}")
-
-                client = get_api_client(src)
-                rates_data = client.fetch_rates()
-
-                all_rates.update(rates_data["rates"])
-
-                self.storage.save_to_history(rates_data)
-
-                results["details"].append({
-                    "source": src,
-                    "status": "success",
-                    "rates_count": rates_data["count"],
-                    "timestamp": rates_data["timestamp"]
-                })
-
-                print(f"   Успешно: {rates_data['count']} курсов")
-                results["sources_processed"] += 1
-
-            except ApiRequestError as e:
-                error_msg = str(e)
+        # При совпадении пар побеждает источник, стоящий позже в порядке
+        # опроса (как при последовательном обновлении), а не закончивший позже
+        priority = {src: index for index, src in enumerate(sources_to_update)}
+        owners: Dict[str, int] = {}
+        started = time.perf_counter()
+
+        for src, outcome, elapsed in self._fetch_sources(sources_to_update):
+            print(f"\nИсточник: {src.upper()} ({elapsed:.2f} с)")
+
+            if not isinstance(outcome, Exception):
+                rates_data = outcome
+                for pair, rate in rates_data["rates"].items():
+                    if owners.get(pair, -1) <= priority[src]:
+                        all_rates[pair] = rate
+                        owners[pair] = priority[src]
+                try:
+                    self.storage.save_to_history(rates_data)
+                except Exception as e:
+                    outcome = e
+
+            if isinstance(outcome, Exception):
+                if isinstance(outcome, ApiRequestError):
+                    error_msg = str(outcome)
+                    print(f"   Ошибка: {error_msg}")
+                else:
+                    error_msg = f"Неизвестная ошибка: {outcome}"
+                    print(f"   Критическая ошибка: {error_msg}")
                 results["details"].append({
                     "source": src,
                     "status": "error",
-                    "error": error_msg
+                    "error": error_msg,
+                    "elapsed": elapsed
                 })
                 results["sources_failed"] += 1
-                print(f"   Ошибка: {error_msg}")
+                continue
+
+            results["details"].append({
+                "source": src,
+                "status": "success",
+                "rates_count": rates_data["count"],
+                "timestamp": rates_data["timestamp"],
+                "elapsed": elapsed
+            })
 
-            except Exception as e:
-                error_msg = f"Неизвестная ошибка: {e}"
-                results["details"].append({
-                    "source": src,
-                    "status": "error",
-                    "error": error_msg
-                })
-                results["sources_failed"] += 1
-                print(f"   Критическая ошибка: {error_msg}")
+            print(f"   Успешно: {rates_data['count']} курсов")
+            results["sources_processed"] += 1
+
+        results["elapsed"] = time.perf_counter() - started
 
         if all_rates:
+            # Обновление одного источника не стирает пары остальных
             self.storage.save_current_rates({
                 "rates": all_rates,
                 "timestamp": results["timestamp"],
                 "source": "mixed" if len(sources_to_update) > 1
                          else sources_to_update[0]
-            })
+            }, merge=source != "all")
 
             results["success"] = True
             results["total_rates"] = len(all_rates)
 
+            # Отложенные заявки проверяются лишь по парам, полученным этим обновлением
+            results["orders"] = trigger_orders(all_rates)
+
         print("\n" + "=" * 50)
         if results["success"]:
             print("ОБНОВЛЕНИЕ ЗАВЕРШЕНО")
@@ -116,16 +151,65 @@ class RatesUpdater:
             print(f"   Источников обработано: {results['sources_processed']}")
             if results["sources_failed"] > 0:
                 print(f"   Источников с ошибками: {results['sources_failed']}")
+            for result in results["orders"]:
+                order = result["order"]
+                status = ("исполнена" if result["status"] == "ok"
+                          else f"отклонена: {result['error']}")
+                print(f"   Заявка #{order.order_id} ({order.side} {order.amount} "
+                      f"{order.currency} по {result['rate']:.4f}) {status}")
         else:
             print("ОБНОВЛЕНИЕ НЕ УДАЛОСЬ")
             print("   Не удалось получить ни одного курса")
 
+        sources_time = ", ".join(f"{item['source']} {item['elapsed']:.2f} с"
+                                 for item in results["details"])
+        print(f"   Время обновления: {results['elapsed']:.2f} с ({sources_time})")
         print(f"   Время: {results['timestamp']}")
         print("=" * 50)
 
         return results
 
+    def _fetch_sources(self, sources: List[str]
+                       ) -> Iterator[Tuple[str, Union[Dict, Exception], float]]:
+        """
+        Опросить источники параллельно и отдавать (источник, курсы или ошибка,
+        секунды с начала опроса) по мере готовности. Источник, не уложившийся
+        в SOURCE_TIMEOUT, возвращается с ошибкой таймаута
+        """
+        timeout = config.SOURCE_TIMEOUT
+        started = time.perf_counter()
+        pool = ThreadPoolExecutor(max_workers=len(sources),
+                                  thread_name_prefix="rates")
+        futures = {pool.submit(_fetch_source, src, timeout): src
+                   for src in sources}
+        pending = set(futures)
+        try:
+            while pending:
+                remaining = started + timeout - time.perf_counter()
+                done, pending = wait(pending, timeout=max(remaining, 0),
+                                     return_when=FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        outcome = future.result()
+                    except Exception as e:
+                        outcome = e
+                    yield futures[future], outcome, time.perf_counter() - started
+
+                if not done:
+                    for future in pending:
+                        src = futures[future]
+                        yield (src, ApiRequestError(
+                            f"Таймаут источника {src} ({timeout} с)"
+                        ), time.perf_counter() - started)
+                    break
+        finally:
+            # Зависший запрос не держит обновление: поток завершится сам по
+            # таймауту HTTP-клиента
+            pool.shutdown(wait=False, cancel_futures=True)
+
     def get_status(self) -> Dict[str, Any]:
+        from .breaker import breaker_states
+
         cache_data = self.storage.load_current_rates()
 
         return {
@@ -133,6 +217,8 @@ class RatesUpdater:
             "cache_valid": self.storage.is_cache_valid(),
             "last_refresh": cache_data.get("last_refresh"),
             "total_pairs": cache_data.get("total_pairs", 0),
+            "breakers": breaker_states(),
+            "scheduler": DatabaseManager().get_scheduler_state(),
             "config": {
                 "base_currency": config.BASE_CURRENCY,
                 "fiat_currencies": config.FIAT_CURRENCIES,
@@ -146,4 +232,13 @@ class RatesUpdater:
         return self.run_update("all")
 
 
+def _fetch_source(source: str, timeout: float) -> Dict[str, Any]:
+    from .api_clients import get_api_client
+
+    client = get_api_client(source)
+    client.timeout = min(client.timeout, timeout)
+    client.deadline = time.monotonic() + timeout
+    return client.fetch_rates()
+
+
 updater = RatesUpdater()